@@ -0,0 +1,164 @@
+"""
+Response cache for external API data
+TTL + LRU cache with request coalescing and stale-while-revalidate
+"""
+import functools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Any, Optional, Callable, Hashable
+
+def cache_key(source: str, city_name: str, lat: float = None, lon: float = None) -> tuple:
+    """
+    Key a request by source and location. Coordinates are rounded to two
+    decimals (~1 km) so nearby requests share an entry; without coordinates
+    the normalized city name is used.
+    """
+    if lat is not None and lon is not None:
+        return (source, round(lat, 2), round(lon, 2))
+    return (source, (city_name or '').lower().strip())
+
+class _Entry:
+    __slots__ = ('value', 'expires_at', 'stale_until')
+
+    def __init__(self, value, expires_at: float, stale_until: float):
+        self.value = value
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+
+class TTLCache:
+    """
+    Thread-safe cache where each entry is fresh for `ttl` seconds and may
+    then be served stale for `stale_ttl` more seconds while one background
+    refresh runs. Concurrent misses for the same key share a single fetch.
+    Cached values are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, max_entries: int = 1024, executor=None):
+        self.max_entries = max_entries
+        self.executor = executor
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'refreshes': 0,
+            'errors': 0,
+            'evictions': 0,
+            'fetches': 0,
+            'fetch_ms_total': 0.0,
+            'fetch_ms_max': 0.0
+        }
+
+    def get_or_fetch(self, key: Hashable, fetch: Callable[[], Any],
+                     ttl: float, stale_ttl: float = 0.0) -> Any:
+        """Return the cached value for `key`, calling `fetch()` on a miss"""
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(key)
+            if entry is not None and now < entry.stale_until:
+                self._entries.move_to_end(key)
+                if now < entry.expires_at:
+                    self._stats['hits'] += 1
+                    return entry.value
+
+                # Serve stale and revalidate in the background (once per key)
+                self._stats['stale_hits'] += 1
+                if key not in self._inflight and self.executor is not None:
+                    future = Future()
+                    self._inflight[key] = future
+                    self._stats['refreshes'] += 1
+                    self.executor.submit(self._fetch, key, fetch, ttl, stale_ttl, future)
+                return entry.value
+
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats['coalesced'] += 1
+                owner = False
+            else:
+                future = Future()
+                self._inflight[key] = future
+                self._stats['misses'] += 1
+                owner = True
+
+        if owner:
+            self._fetch(key, fetch, ttl, stale_ttl, future)
+        return future.result()
+
+    def _fetch(self, key: Hashable, fetch: Callable[[], Any], ttl: float,
+               stale_ttl: float, future: Future):
+        """Run `fetch`, store its result and resolve everyone waiting on `future`"""
+        start = time.perf_counter()
+        try:
+            value = fetch()
+        except Exception as e:
+            with self._lock:
+                self._stats['errors'] += 1
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            return
+
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            now = time.monotonic()
+            self._entries[key] = _Entry(value, now + ttl, now + ttl + stale_ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+            self._inflight.pop(key, None)
+            self._stats['fetches'] += 1
+            self._stats['fetch_ms_total'] += elapsed
+            self._stats['fetch_ms_max'] = max(self._stats['fetch_ms_max'], elapsed)
+        future.set_result(value)
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Drop one entry, or every entry when no key is given"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of hit/miss counters and upstream fetch latency"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['inflight'] = len(self._inflight)
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses'] + stats['coalesced']
+        stats['hit_ratio'] = round((stats['hits'] + stats['stale_hits']) / lookups, 3) if lookups else 0.0
+        stats['fetch_ms_avg'] = round(stats['fetch_ms_total'] / stats['fetches'], 2) if stats['fetches'] else 0.0
+        stats['fetch_ms_total'] = round(stats['fetch_ms_total'], 2)
+        stats['fetch_ms_max'] = round(stats['fetch_ms_max'], 2)
+        return stats
+
+class SourceUnavailable(Exception):
+    """No provider could serve a source; the caller's fallback is used and nothing is cached"""
+
+def cached_source(source: str, fallback: str):
+    """
+    Decorate an APIService fetch method so its results go through
+    `self.cache` using the TTLs configured for `source` in `self.cache_ttls`.
+    When the method raises SourceUnavailable, the `fallback` method's
+    (simulated) data is returned instead and is never cached, so a transient
+    outage is retried on the next call rather than served as real data.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, city_name: str, lat: float = None, lon: float = None):
+            ttl, stale_ttl = self.cache_ttls[source]
+            try:
+                return self.cache.get_or_fetch(
+                    cache_key(source, city_name, lat, lon),
+                    lambda: method(self, city_name, lat, lon),
+                    ttl, stale_ttl
+                )
+            except SourceUnavailable:
+                return getattr(self, fallback)(city_name)
+        return wrapper
+    return decorator
@@ -1,12 +1,48 @@
 """
 API Services for fetching real-time data from external APIs
 """
-import requests
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import Dict, Any, Optional
 from datetime import datetime
 import random
 
+from api_cache import TTLCache, cached_source, SourceUnavailable
+from http_client import ProviderClient
+
+# Provider base URLs (overridable per instance, e.g. to point at a local stub)
+OPENWEATHER_BASE_URL = 'https://api.openweathermap.org'
+AIRVISUAL_BASE_URL = 'https://api.airvisual.com'
+
+# Per-source cache lifetimes in seconds: (fresh TTL, extra time served stale while refreshing).
+# Only provider-backed sources are cached; simulated data is never stored.
+CACHE_TTLS = {
+    'air_quality': (600, 1200),
+    'weather': (600, 1200)
+}
+
+# Sources fetched for a full city run: name -> (fetch method, simulated fallback)
+CITY_SOURCES = {
+    'air_quality': ('fetch_air_quality_data', 'simulate_air_quality_data'),
+    'weather': ('fetch_weather_data', 'simulate_weather_data'),
+    'traffic': ('fetch_traffic_data', 'simulate_traffic_data'),
+    'parking': ('fetch_parking_data', 'simulate_parking_data'),
+    'activity': ('fetch_citizen_activity_data', 'simulate_citizen_activity_data')
+}
+
+# Overall time budget (seconds) for fetching every source of a city
+FETCH_DEADLINE = 3.0
+
+def _timed_call(fn, *args):
+    """Call fn(*args) and return (result, error, elapsed milliseconds)"""
+    start = time.perf_counter()
+    try:
+        result, error = fn(*args), None
+    except Exception as e:
+        result, error = None, e
+    return result, error, (time.perf_counter() - start) * 1000
+
 class APIService:
     """Service for fetching data from external APIs"""
     def __init__(self):
@@ -14,73 +50,136 @@ class APIService:
         # For demo, we'll use free/public APIs or simulate data
         self.openweather_api_key = None  # Set your OpenWeatherMap API key here
         self.airvisual_api_key = None    # Set your AirVisual API key here
+        self.openweather_base_url = OPENWEATHER_BASE_URL
+        self.airvisual_base_url = AIRVISUAL_BASE_URL
+        
+        # Pooled sessions with retry and circuit-breaker policy, one per provider
+        # Each call's budget matches the city fetch deadline its result is awaited under
+        self.openweather = ProviderClient('openweathermap', call_budget=FETCH_DEADLINE)
+        self.airvisual = ProviderClient('airvisual', call_budget=FETCH_DEADLINE)
+        
+        # Shared pool for concurrent upstream fetches and background refreshes
+        self.executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='api-fetch')
+        
+        # Cache in front of the provider-backed fetch_* methods
+        self.cache_ttls = dict(CACHE_TTLS)
+        self.cache = TTLCache(max_entries=2048, executor=self.executor)
+        
+    def fetch_city_data(self, city_name: str, lat: float = None, lon: float = None,
+                        deadline: float = FETCH_DEADLINE) -> Dict[str, Any]:
+        """
+        Fetch every source in CITY_SOURCES concurrently under one deadline.
+        Sources that fail or miss the deadline are replaced by simulated data.
+        Returns {'data': {source: data}, 'timings': {source: timing}}.
+        """
+        start = time.perf_counter()
+        futures = {
+            name: self.executor.submit(_timed_call, getattr(self, fetch), city_name, lat, lon)
+            for name, (fetch, _) in CITY_SOURCES.items()
+        }
+        _, not_done = wait(futures.values(), timeout=deadline)
+        # Fetches still queued would only delay other cities' fetches; drop them
+        for future in not_done:
+            future.cancel()
         
+        data = {}
+        timings = {}
+        for name, future in futures.items():
+            simulate = getattr(self, CITY_SOURCES[name][1])
+            if future.done() and not future.cancelled():
+                result, error, elapsed = future.result()
+                status = 'ok' if error is None else 'error'
+            else:
+                # Cancelled if never started; fetches already running finish and are dropped
+                result, error = None, None
+                elapsed = (time.perf_counter() - start) * 1000
+                status = 'timeout'
+            
+            if status == 'error':
+                print(f"Error fetching {name} data: {error}")
+            data[name] = result if status == 'ok' else simulate(city_name)
+            timings[name] = {
+                'status': status,
+                'ms': round(elapsed, 1),
+                'source': data[name].get('source')
+            }
+        
+        return {'data': data, 'timings': timings}
+    
+    def provider_status(self) -> Dict[str, Any]:
+        """Circuit breaker state and request counters per provider"""
+        return {
+            'openweathermap': self.openweather.status(),
+            'airvisual': self.airvisual.status()
+        }
+        
+    @cached_source('air_quality', fallback='simulate_air_quality_data')
     def fetch_air_quality_data(self, city_name: str, lat: float = None, lon: float = None) -> Dict[str, Any]:
         """
         Fetch real air quality data
         Uses OpenWeatherMap Air Pollution API or AirVisual API
-        Falls back to realistic simulated data if API keys not available
+        Falls back to realistic simulated data (uncached) if API keys are not
+        available or both providers fail
         """
         # Try OpenWeatherMap Air Pollution API
         if lat and lon and self.openweather_api_key:
             try:
-                url = f"http://api.openweathermap.org/data/2.5/air_pollution"
+                url = f"{self.openweather_base_url}/data/2.5/air_pollution"
                 params = {
                     'lat': lat,
                     'lon': lon,
                     'appid': self.openweather_api_key
                 }
-                response = requests.get(url, params=params, timeout=5)
-                if response.status_code == 200:
-                    data = response.json()
-                    components = data.get('list', [{}])[0].get('components', {})
-                    main = data.get('list', [{}])[0].get('main', {})
-                    
-                    return {
-                        'pm25': components.get('pm2_5', 0),
-                        'pm10': components.get('pm10', 0),
-                        'no2': components.get('no2', 0),
-                        'co': components.get('co', 0) / 1000,  # Convert to ppm
-                        'so2': components.get('so2', 0),
-                        'aqi': main.get('aqi', 0) * 50,  # Scale 1-5 to 0-250
-                        'source': 'OpenWeatherMap'
-                    }
+                data = self.openweather.get_json(url, params)
+                components = data.get('list', [{}])[0].get('components', {})
+                main = data.get('list', [{}])[0].get('main', {})
+                
+                return {
+                    'pm25': components.get('pm2_5', 0),
+                    'pm10': components.get('pm10', 0),
+                    'no2': components.get('no2', 0),
+                    'co': components.get('co', 0) / 1000,  # Convert to ppm
+                    'so2': components.get('so2', 0),
+                    'aqi': main.get('aqi', 0) * 50,  # Scale 1-5 to 0-250
+                    'source': 'OpenWeatherMap'
+                }
             except Exception as e:
                 print(f"Error fetching from OpenWeatherMap: {e}")
         
         # Try AirVisual API (IQAir)
         if city_name and self.airvisual_api_key:
             try:
-                url = "https://api.airvisual.com/v2/city"
+                url = f"{self.airvisual_base_url}/v2/city"
                 params = {
                     'city': city_name,
                     'state': '',  # Can be enhanced
                     'country': 'India',
                     'key': self.airvisual_api_key
                 }
-                response = requests.get(url, params=params, timeout=5)
-                if response.status_code == 200:
-                    data = response.json()
-                    current = data.get('data', {}).get('current', {})
-                    pollution = current.get('pollution', {})
-                    weather = current.get('weather', {})
-                    
-                    return {
-                        'pm25': pollution.get('aqius', 0),  # AirVisual uses AQI US
-                        'pm10': pollution.get('aqius', 0) * 1.2,  # Estimate
-                        'no2': pollution.get('aqius', 0) * 0.3,  # Estimate
-                        'co': pollution.get('aqius', 0) * 0.05,  # Estimate
-                        'so2': pollution.get('aqius', 0) * 0.1,  # Estimate
-                        'aqi': pollution.get('aqius', 0),
-                        'temperature': weather.get('tp', 25),
-                        'humidity': weather.get('hu', 60),
-                        'wind_speed': weather.get('ws', 10),
-                        'source': 'AirVisual'
-                    }
+                data = self.airvisual.get_json(url, params)
+                current = data.get('data', {}).get('current', {})
+                pollution = current.get('pollution', {})
+                weather = current.get('weather', {})
+                
+                return {
+                    'pm25': pollution.get('aqius', 0),  # AirVisual uses AQI US
+                    'pm10': pollution.get('aqius', 0) * 1.2,  # Estimate
+                    'no2': pollution.get('aqius', 0) * 0.3,  # Estimate
+                    'co': pollution.get('aqius', 0) * 0.05,  # Estimate
+                    'so2': pollution.get('aqius', 0) * 0.1,  # Estimate
+                    'aqi': pollution.get('aqius', 0),
+                    'temperature': weather.get('tp', 25),
+                    'humidity': weather.get('hu', 60),
+                    'wind_speed': weather.get('ws', 10),
+                    'source': 'AirVisual'
+                }
             except Exception as e:
                 print(f"Error fetching from AirVisual: {e}")
         
-        # Fallback: Generate realistic data based on city
+        raise SourceUnavailable('air_quality')
+    
+    def simulate_air_quality_data(self, city_name: str) -> Dict[str, Any]:
+        """Generate realistic air quality data based on city"""
         # Delhi typically has high AQI (150-300+), Mumbai moderate (100-200)
         city_lower = city_name.lower()
         if 'delhi' in city_lower:
@@ -115,42 +214,44 @@ class APIService:
             'source': 'Simulated (Realistic)'
         }
     
+    @cached_source('weather', fallback='simulate_weather_data')
     def fetch_weather_data(self, city_name: str, lat: float = None, lon: float = None) -> Dict[str, Any]:
-        """Fetch weather data for accident risk prediction"""
+        """Fetch weather data for accident risk prediction (simulated, uncached, on failure)"""
         if lat and lon and self.openweather_api_key:
             try:
-                url = "https://api.openweathermap.org/data/2.5/weather"
+                url = f"{self.openweather_base_url}/data/2.5/weather"
                 params = {
                     'lat': lat,
                     'lon': lon,
                     'appid': self.openweather_api_key,
                     'units': 'metric'
                 }
-                response = requests.get(url, params=params, timeout=5)
-                if response.status_code == 200:
-                    data = response.json()
-                    weather_main = data.get('weather', [{}])[0].get('main', '').lower()
-                    
-                    # Map weather to condition code
-                    weather_condition = 0  # Clear
-                    if 'rain' in weather_main:
-                        weather_condition = 1  # Rainy
-                    elif 'fog' in weather_main or 'mist' in weather_main:
-                        weather_condition = 2  # Foggy
-                    
-                    return {
-                        'temperature': data.get('main', {}).get('temp', 25),
-                        'humidity': data.get('main', {}).get('humidity', 60),
-                        'wind_speed': data.get('wind', {}).get('speed', 10) * 3.6,  # Convert m/s to km/h
-                        'visibility': data.get('visibility', 10000) / 1000,  # Convert to km
-                        'weather_condition': weather_condition,
-                        'weather_description': data.get('weather', [{}])[0].get('description', 'clear'),
-                        'source': 'OpenWeatherMap'
-                    }
+                data = self.openweather.get_json(url, params)
+                weather_main = data.get('weather', [{}])[0].get('main', '').lower()
+                
+                # Map weather to condition code
+                weather_condition = 0  # Clear
+                if 'rain' in weather_main:
+                    weather_condition = 1  # Rainy
+                elif 'fog' in weather_main or 'mist' in weather_main:
+                    weather_condition = 2  # Foggy
+                
+                return {
+                    'temperature': data.get('main', {}).get('temp', 25),
+                    'humidity': data.get('main', {}).get('humidity', 60),
+                    'wind_speed': data.get('wind', {}).get('speed', 10) * 3.6,  # Convert m/s to km/h
+                    'visibility': data.get('visibility', 10000) / 1000,  # Convert to km
+                    'weather_condition': weather_condition,
+                    'weather_description': data.get('weather', [{}])[0].get('description', 'clear'),
+                    'source': 'OpenWeatherMap'
+                }
             except Exception as e:
                 print(f"Error fetching weather: {e}")
         
-        # Fallback: Generate realistic data
+        raise SourceUnavailable('weather')
+    
+    def simulate_weather_data(self, city_name: str) -> Dict[str, Any]:
+        """Generate realistic weather data"""
         return {
             'temperature': round(random.uniform(15, 35), 1),
             'humidity': round(random.uniform(40, 85), 1),
@@ -165,6 +266,10 @@ class APIService:
         """Fetch traffic data for accident risk prediction"""
         # In production, this would use Google Maps API, TomTom, or similar
         # For now, generate realistic data
+        return self.simulate_traffic_data(city_name)
+    
+    def simulate_traffic_data(self, city_name: str) -> Dict[str, Any]:
+        """Generate realistic traffic data based on city"""
         city_lower = city_name.lower()
         
         # Major cities typically have higher traffic
@@ -188,6 +293,10 @@ class APIService:
         """Fetch parking data"""
         # In production, this would use parking APIs or IoT sensors
         # For now, generate realistic data
+        return self.simulate_parking_data(city_name)
+    
+    def simulate_parking_data(self, city_name: str) -> Dict[str, Any]:
+        """Generate realistic parking data"""
         return {
             'parking_capacity': random.randint(100, 300),
             'occupied_slots': random.randint(50, 250),
@@ -200,6 +309,10 @@ class APIService:
         """Fetch citizen activity data"""
         # In production, this would use mobile data, WiFi hotspots, etc.
         # For now, generate realistic data based on city size
+        return self.simulate_citizen_activity_data(city_name)
+    
+    def simulate_citizen_activity_data(self, city_name: str) -> Dict[str, Any]:
+        """Generate realistic citizen activity data based on city size"""
         city_lower = city_name.lower()
         
         if 'delhi' in city_lower or 'mumbai' in city_lower:
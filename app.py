@@ -1,46 +1,77 @@
-from flask import Flask, render_template, request, jsonify, make_response
+from flask import Flask, render_template, request, jsonify, make_response, Response, stream_with_context
 import numpy as np
 import random
 import os
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from datetime import datetime, timedelta
 from typing import Dict, Any
 
 # Import location services
-from location_services import location_service, load_city_data, save_city_data, CityData
+from location_services import location_service, load_city_data, load_city, save_city, CityData
 # Import API services
 from api_services import api_service
+# Import trained model registry
+from model_registry import model_registry, MODULE_DATASETS
+# Import micro-batched model inference
+from inference_batcher import inference_batcher, MAX_BATCH_LIMIT, MAX_WAIT_LIMIT_MS
+# Import metrics history
+from city_history import city_history, parse_timestamp
+# Import heatmap generation
+from heatmap import generate_heatmap, to_json_layers, to_f32_layers, MAX_DENSITY
+from heatmap_tiles import heatmap_tiles
+# Import score/alert fan-out
+from pubsub import event_broker, format_sse
+# Import background metric refresh
+from refresh_scheduler import RefreshScheduler
+# Import IoT sensor ingestion
+from sensor_ingest import sensor_ingest, parse_ndjson, IngestQueueFull
+# Import request validation
+from validation import PREDICT_VALIDATORS, ValidationError
+# Import the shared rule-based scoring formulas
+from scoring import (
+    predict_accident_risk, predict_air_quality, predict_citizen_activity, predict_parking_availability,
+    predict_accident_risk_batch, predict_air_quality_batch, predict_citizen_activity_batch,
+    predict_parking_availability_batch
+)
 
 app = Flask(__name__)
 
-def predict_accident_risk(vehicle_density, avg_speed, road_condition, weather_condition, visibility, time_of_day):
-    score = (vehicle_density/500)*0.4 + (1 - avg_speed/100)*0.3 + \
-            (2 - road_condition)*0.1 + weather_condition*0.1 + \
-            (1 - visibility/1000)*0.1
-    
-    if score < 0.4: return "Low"
-    elif score < 0.7: return "Medium"
-    else: return "High"
-
-def predict_air_quality(pm25, pm10, no2, co, so2, temperature, humidity, wind_speed):
-    aqi = (0.4*pm25 + 0.3*pm10 + 0.1*no2 + 15*co + 0.05*so2 - 
-           0.2*wind_speed - 0.1*humidity)
-    return max(0, min(500, aqi))
+SCALAR_PREDICTORS = {
+    'accident': predict_accident_risk,
+    'air_quality': predict_air_quality,
+    'activity': predict_citizen_activity,
+    'parking': predict_parking_availability
+}
 
-def predict_citizen_activity(population_density, avg_age, workplace_count, public_events, temperature, day_of_week):
-    score = (population_density/15000)*0.4 + (workplace_count/50)*0.3 + \
-            (public_events/5)*0.2 + (temperature/40)*0.1
-    
-    if score < 0.4: return "Low"
-    elif score < 0.7: return "Moderate"
-    else: return "High"
+BATCH_PREDICTORS = {
+    'accident': predict_accident_risk_batch,
+    'air_quality': predict_air_quality_batch,
+    'activity': predict_citizen_activity_batch,
+    'parking': predict_parking_availability_batch
+}
 
-def predict_parking_availability(parking_capacity, occupied_slots, entry_rate, exit_rate, time_of_day, weekday, nearby_events):
-    utilization = occupied_slots/parking_capacity
-    inflow = entry_rate - exit_rate
-    score = utilization + inflow/50 + nearby_events*0.5
-    
-    return "Full" if score > 1.2 else "Available"
+def run_model(module: str, formula, *features):
+    """
+    Score one record with the trained model for `module` when one has been
+    exported, otherwise with the hand-written formula. Model calls from
+    concurrent requests are coalesced into one predict call per batch.
+    A batch that times out or fails is answered with the formula too.
+    """
+    name = MODULE_DATASETS[module]
+    if not model_registry.is_available(name):
+        return formula(*features)
+    try:
+        prediction = inference_batcher.predict(name, features)
+    except Exception as e:
+        # Includes the future's TimeoutError, whose message is empty
+        print(f"Error predicting {module}, using the formula: {type(e).__name__} {e}")
+        inference_batcher.count_fallback(name)
+        return formula(*features)
+    if prediction is None:
+        return formula(*features)
+    return prediction
 
 def calculate_smart_city_score(air_quality, accident_risk, parking_status, activity_level):
     """Calculate overall smart city score (0-100)"""
@@ -82,88 +113,85 @@ def index():
 
 @app.route('/predict', methods=['POST'])
 def predict():
-    data = request.json
-    module = data['module']
+    data = request.json or {}
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'Request body must be a JSON object'}), 400
+    module = data.get('module')
+    
+    validator = PREDICT_VALIDATORS.get(module)
+    if validator is None:
+        return jsonify({'success': False, 'error': 'Invalid module'}), 400
     
     try:
-        result_data = {}
-        
-        if module == 'accident':
-            result = predict_accident_risk(
-                float(data['vehicle_density']), float(data['avg_speed']),
-                int(data['road_condition']), int(data['weather_condition']),
-                float(data['visibility']), int(data['time_of_day'])
-            )
-            result_data = {
-                'prediction': result,
-                'inputs': {
-                    'vehicle_density': float(data['vehicle_density']),
-                    'avg_speed': float(data['avg_speed']),
-                    'road_condition': int(data['road_condition']),
-                    'weather_condition': int(data['weather_condition']),
-                    'visibility': float(data['visibility']),
-                    'time_of_day': int(data['time_of_day'])
-                }
-            }
-        elif module == 'air_quality':
-            result = round(predict_air_quality(
-                float(data['pm25']), float(data['pm10']), float(data['no2']),
-                float(data['co']), float(data['so2']), float(data['temperature']),
-                float(data['humidity']), float(data['wind_speed'])
-            ), 1)
-            result_data = {
-                'prediction': result,
-                'inputs': {
-                    'pm25': float(data['pm25']),
-                    'pm10': float(data['pm10']),
-                    'no2': float(data['no2']),
-                    'co': float(data['co']),
-                    'so2': float(data['so2']),
-                    'temperature': float(data['temperature']),
-                    'humidity': float(data['humidity']),
-                    'wind_speed': float(data['wind_speed'])
-                }
-            }
-        elif module == 'activity':
-            result = predict_citizen_activity(
-                int(data['population_density']), int(data['avg_age']),
-                int(data['workplace_count']), int(data['public_events']),
-                float(data['temperature']), int(data['day_of_week'])
-            )
-            result_data = {
-                'prediction': result,
-                'inputs': {
-                    'population_density': int(data['population_density']),
-                    'avg_age': int(data['avg_age']),
-                    'workplace_count': int(data['workplace_count']),
-                    'public_events': int(data['public_events']),
-                    'temperature': float(data['temperature']),
-                    'day_of_week': int(data['day_of_week'])
-                }
-            }
-        elif module == 'parking':
-            result = predict_parking_availability(
-                int(data['parking_capacity']), int(data['occupied_slots']),
-                float(data['entry_rate']), float(data['exit_rate']),
-                int(data['time_of_day']), int(data['weekday']), int(data['nearby_events'])
-            )
-            result_data = {
-                'prediction': result,
-                'inputs': {
-                    'parking_capacity': int(data['parking_capacity']),
-                    'occupied_slots': int(data['occupied_slots']),
-                    'entry_rate': float(data['entry_rate']),
-                    'exit_rate': float(data['exit_rate']),
-                    'time_of_day': int(data['time_of_day']),
-                    'weekday': int(data['weekday']),
-                    'nearby_events': int(data['nearby_events'])
-                }
-            }
-        
-        return jsonify({'success': True, **result_data})
+        # Each field is coerced once; the same values are scored and echoed
+        values = validator.validate(data)
+    except ValidationError as e:
+        return jsonify({'success': False, 'error': str(e), 'errors': e.errors}), 400
+    
+    try:
+        result = run_model(module, SCALAR_PREDICTORS[module], *values)
+        if module == 'air_quality':
+            result = round(result, 1)
+        return jsonify({'success': True, 'prediction': result, 'inputs': validator.as_dict(values)})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Score many records for one module in a single vectorized pass"""
+    data = request.json or {}
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'Request body must be a JSON object'}), 400
+    module = data.get('module')
+    
+    if module not in BATCH_PREDICTORS:
+        return jsonify({'success': False, 'error': 'Invalid module'}), 400
+    
+    try:
+        columns = PREDICT_VALIDATORS[module].validate_batch(data)
+    except ValidationError as e:
+        return jsonify({'success': False, 'error': str(e), 'errors': e.errors}), 400
+    
+    predictions = model_registry.predict(MODULE_DATASETS[module], np.column_stack(columns))
+    if predictions is None:
+        predictions = BATCH_PREDICTORS[module](*columns)
+    predictions = predictions.tolist()
+    if module == 'air_quality':
+        # Python's round() so results match the single-record endpoint exactly
+        predictions = [round(aqi, 1) for aqi in predictions]
+    
+    return jsonify({
+        'success': True,
+        'module': module,
+        'count': len(predictions),
+        'predictions': predictions
+    })
+
+@app.route('/api/predict/validation_stats', methods=['GET'])
+def get_validation_stats():
+    """Records validated/rejected and mean parsing cost per record, per module"""
+    return jsonify({module: validator.status() for module, validator in PREDICT_VALIDATORS.items()})
+
+@app.route('/api/inference/stats', methods=['GET', 'POST'])
+def inference_stats():
+    """Batch size and latency histograms per model; POST max_batch/max_wait_ms to retune"""
+    if request.method == 'POST':
+        data = request.json or {}
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        try:
+            max_batch = int(data['max_batch']) if 'max_batch' in data else None
+            max_wait_ms = float(data['max_wait_ms']) if 'max_wait_ms' in data else None
+        except (TypeError, ValueError, OverflowError):
+            return jsonify({'error': 'max_batch and max_wait_ms must be numbers'}), 400
+        # The negated range check also refuses NaN
+        if (max_batch is not None and not 1 <= max_batch <= MAX_BATCH_LIMIT) or \
+                (max_wait_ms is not None and not 0 <= max_wait_ms <= MAX_WAIT_LIMIT_MS):
+            return jsonify({'error': f'max_batch must be between 1 and {MAX_BATCH_LIMIT} '
+                                     f'and max_wait_ms between 0 and {MAX_WAIT_LIMIT_MS:g}'}), 400
+        inference_batcher.configure(max_batch, max_wait_ms)
+    return jsonify(inference_batcher.status())
+
 @app.route('/api/fetch_data', methods=['GET'])
 def fetch_data():
     """Fetch data from APIs for a specific module"""
@@ -197,25 +225,40 @@ def fetch_data():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/geocode/suggest', methods=['GET'])
+def geocode_suggest():
+    """Autocomplete suggestions for city names"""
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', type=int, default=10), 1), 50)
+    
+    if not query:
+        return jsonify({'query': query, 'suggestions': []})
+    
+    return jsonify({'query': query, 'suggestions': location_service.suggest(query, limit)})
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Hit/miss and latency counters for the external API cache"""
+    return jsonify(api_service.cache.stats())
+
+@app.route('/api/providers/status', methods=['GET'])
+def get_provider_status():
+    """Circuit breaker state and request counters for external providers"""
+    return jsonify(api_service.provider_status())
+
 @app.route('/api/city_score', methods=['GET'])
 def get_city_score():
     """Get Smart City Score - optionally for a specific city"""
     city_name = request.args.get('city')
     
     if city_name:
-        # Get city-specific metrics
-        metrics = get_city_metrics(city_name)
         city = location_service.geocode(city_name)
         
         if city:
-            # Run all models for this city
-            all_metrics = run_all_models_for_city(city_name, city.latitude, city.longitude)
-            score = calculate_smart_city_score(
-                air_quality=all_metrics['air_quality'],
-                accident_risk=all_metrics['accident_risk'],
-                parking_status=all_metrics['parking_status'],
-                activity_level=all_metrics['activity_level']
-            )
+            # Precomputed by the refresh scheduler (computed here only on first request)
+            snapshot = refresh_scheduler.get(city.name, city.latitude, city.longitude)
+            all_metrics = snapshot['metrics']
+            score = snapshot['score']
             status = get_city_status(score)
             
             return jsonify({
@@ -246,74 +289,93 @@ def get_city_score():
 
 @app.route('/api/heatmap_data', methods=['GET'])
 def get_heatmap_data():
-    """Generate heatmap data based on city location and predictions"""
+    """
+    Generate heatmap data based on city location and predictions
+    format=json (default) returns nested lists; format=f32 (or an Accept
+    header of application/octet-stream) returns packed float32 triplets with
+    the layer layout in the X-Heatmap-Layers header.
+    """
     city_name = request.args.get('city')
     lat = request.args.get('lat', type=float, default=28.6139)  # Default to New Delhi
     lon = request.args.get('lon', type=float, default=77.2090)
+    density = min(max(request.args.get('density', type=int, default=1), 1), MAX_DENSITY)
+    output_format = request.args.get('format')
+    if output_format is None:
+        best = request.accept_mimetypes.best_match(['application/json', 'application/octet-stream'])
+        output_format = 'f32' if best == 'application/octet-stream' else 'json'
     
     # Get city if name provided
+    metrics = None
     if city_name:
         city = location_service.geocode(city_name)
         if city:
             lat, lon = city.latitude, city.longitude
+        # Adjust intensity based on actual metrics
+        metrics = get_city_metrics(city_name)
     
-    def generate_points(center_lat, center_lng, count, radius_km, intensity_range=(0.1, 1.0)):
-        """Generate heatmap points with varying intensity"""
-        points = []
-        for _ in range(count):
-            r = radius_km * (random.random() ** 0.5)
-            theta = random.uniform(0, 2 * 3.14159)
-            dx = r * 0.01 * random.choice([-1, 1]) * random.random()
-            dy = r * 0.01 * random.choice([-1, 1]) * random.random()
-            
-            points.append([
-                center_lat + dy,
-                center_lng + dx,
-                random.uniform(intensity_range[0], intensity_range[1])
-            ])
-        return points
-    
-    # Generate heatmap data based on city metrics if available
+    layers = generate_heatmap(lat, lon, metrics, density)
+    
+    if output_format == 'f32':
+        body, descriptor = to_f32_layers(layers)
+        response = make_response(body)
+        response.headers['Content-Type'] = 'application/octet-stream'
+        response.headers['X-Heatmap-Layers'] = descriptor
+        response.headers['Access-Control-Expose-Headers'] = 'X-Heatmap-Layers'
+        return response
+    
+    return jsonify(to_json_layers(layers))
+
+@app.route('/api/heatmap_tiles/<layer>/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_heatmap_tile(layer, z, x, y):
+    """Aggregated heatmap cells for one slippy-map tile of a layer"""
+    city_name = request.args.get('city')
+    lat = request.args.get('lat', type=float, default=28.6139)  # Default to New Delhi
+    lon = request.args.get('lon', type=float, default=77.2090)
+    
+    metrics = None
+    version = ''
+    key = f"{lat:.4f},{lon:.4f}"
     if city_name:
+        city = location_service.geocode(city_name)
+        if city:
+            city_name, lat, lon = city.name, city.latitude, city.longitude
         metrics = get_city_metrics(city_name)
-        
-        # Adjust intensity based on actual metrics
-        aqi = metrics.get('air_quality', 50)
-        air_intensity = (0.3, min(1.0, 0.3 + (aqi / 500) * 0.7))
-        
-        risk = metrics.get('accident_risk', 'Medium')
-        risk_intensity = {'Low': (0.2, 0.5), 'Medium': (0.4, 0.7), 'High': (0.6, 1.0)}.get(risk, (0.4, 0.7))
-        
-        parking = metrics.get('parking_status', 'Available')
-        parking_intensity = {'Available': (0.3, 0.6), 'Full': (0.7, 1.0)}.get(parking, (0.4, 0.7))
-        
-        activity = metrics.get('activity_level', 'Moderate')
-        activity_intensity = {'Low': (0.2, 0.5), 'Moderate': (0.4, 0.7), 'High': (0.6, 1.0)}.get(activity, (0.4, 0.7))
-        
-        return jsonify({
-            'accident_risk': generate_points(lat, lon, 100, 5, risk_intensity),
-            'air_quality': generate_points(lat, lon, 150, 5, air_intensity),
-            'parking': generate_points(lat, lon, 50, 5, parking_intensity),
-            'crowd_density': generate_points(lat, lon, 200, 5, activity_intensity)
-        })
+        key = city_name.title()
+        version = metrics.get('last_updated', '')
     
-    # Default heatmap data
-    return jsonify({
-        'accident_risk': generate_points(lat, lon, 100, 5),
-        'air_quality': generate_points(lat, lon, 150, 5),
-        'parking': generate_points(lat, lon, 50, 5),
-        'crowd_density': generate_points(lat, lon, 200, 5)
+    try:
+        cells = heatmap_tiles.get_tile(key, lat, lon, metrics, version, layer, z, x, y)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    response = jsonify({
+        'layer': layer,
+        'z': z,
+        'x': x,
+        'y': y,
+        'cells': np.round(cells, 5).tolist()
     })
+    response.headers['Cache-Control'] = 'private, max-age=60'
+    return response
 
 # Load city data
 CITY_DATA = load_city_data()
 
+# Event stream timings
+STREAM_KEEPALIVE = 15.0
+STREAM_RETRY_MS = 5000
+
 def run_all_models_for_city(city_name: str, lat: float, lon: float, use_api: bool = True) -> Dict[str, Any]:
     """Run all ML models for a given city location"""
     # Fetch real data from APIs if available, otherwise use realistic simulated data
+    upstream_timings = {}
     if use_api:
-        # Fetch Air Quality Data
-        air_data = api_service.fetch_air_quality_data(city_name, lat, lon)
+        # Fetch all sources concurrently; late ones fall back to simulated data
+        upstream = api_service.fetch_city_data(city_name, lat, lon)
+        upstream_timings = upstream['timings']
+        
+        # Air Quality Data
+        air_data = upstream['data']['air_quality']
         pm25 = air_data.get('pm25', random.uniform(20, 120))
         pm10 = air_data.get('pm10', random.uniform(30, 150))
         no2 = air_data.get('no2', random.uniform(15, 80))
@@ -328,27 +390,28 @@ def run_all_models_for_city(city_name: str, lat: float, lon: float, use_api: boo
         if aqi_from_api:
             aqi = aqi_from_api
         else:
-            aqi = predict_air_quality(pm25, pm10, no2, co, so2, temperature, humidity, wind_speed)
+            aqi = run_model('air_quality', predict_air_quality,
+                            pm25, pm10, no2, co, so2, temperature, humidity, wind_speed)
         
-        # Fetch Weather Data for Accident Risk
-        weather_data = api_service.fetch_weather_data(city_name, lat, lon)
+        # Weather Data for Accident Risk
+        weather_data = upstream['data']['weather']
         weather_condition = weather_data.get('weather_condition', random.choice([0, 1, 2]))
         visibility = weather_data.get('visibility', random.uniform(2, 10)) * 1000  # Convert to meters
         
-        # Fetch Traffic Data
-        traffic_data = api_service.fetch_traffic_data(city_name, lat, lon)
+        # Traffic Data
+        traffic_data = upstream['data']['traffic']
         vehicle_density = traffic_data.get('vehicle_density', random.randint(100, 450))
         avg_speed = traffic_data.get('avg_speed', random.randint(30, 80))
         
-        # Fetch Parking Data
-        parking_data = api_service.fetch_parking_data(city_name, lat, lon)
+        # Parking Data
+        parking_data = upstream['data']['parking']
         parking_capacity = parking_data.get('parking_capacity', random.randint(100, 300))
         occupied_slots = parking_data.get('occupied_slots', random.randint(50, parking_capacity))
         entry_rate = parking_data.get('entry_rate', random.uniform(10, 40))
         exit_rate = parking_data.get('exit_rate', random.uniform(8, 35))
         
-        # Fetch Citizen Activity Data
-        activity_data = api_service.fetch_citizen_activity_data(city_name, lat, lon)
+        # Citizen Activity Data
+        activity_data = upstream['data']['activity']
         population_density = activity_data.get('population_density', random.randint(5000, 15000))
         avg_age = activity_data.get('avg_age', random.randint(25, 50))
         workplace_count = activity_data.get('workplace_count', random.randint(15, 50))
@@ -364,7 +427,8 @@ def run_all_models_for_city(city_name: str, lat: float, lon: float, use_api: boo
         temperature = random.uniform(15, 35)
         humidity = random.uniform(40, 85)
         wind_speed = random.uniform(5, 25)
-        aqi = predict_air_quality(pm25, pm10, no2, co, so2, temperature, humidity, wind_speed)
+        aqi = run_model('air_quality', predict_air_quality,
+                        pm25, pm10, no2, co, so2, temperature, humidity, wind_speed)
         
         vehicle_density = random.randint(100, 450)
         avg_speed = random.randint(30, 80)
@@ -382,6 +446,20 @@ def run_all_models_for_city(city_name: str, lat: float, lon: float, use_api: boo
         public_events = random.randint(0, 5)
         activity_temperature = random.uniform(18, 32)
     
+    # Live sensor aggregates take precedence over fetched or simulated values
+    live_parking = sensor_ingest.parking_aggregate(city_name)
+    if live_parking:
+        parking_capacity = live_parking['parking_capacity']
+        occupied_slots = live_parking['occupied_slots']
+        entry_rate = live_parking['entry_rate']
+        exit_rate = live_parking['exit_rate']
+    live_activity = sensor_ingest.activity_aggregate(city_name)
+    if live_activity:
+        population_density = live_activity.get('population_density', population_density)
+        avg_age = live_activity.get('avg_age', avg_age)
+        workplace_count = live_activity.get('workplace_count', workplace_count)
+        public_events = live_activity.get('public_events', public_events)
+    
     # Run ML models with fetched data
     road_condition = random.choice([0, 1, 2])  # Could be enhanced with road data API
     time_of_day = datetime.now().hour // 6  # 0-3 based on current hour
@@ -390,22 +468,26 @@ def run_all_models_for_city(city_name: str, lat: float, lon: float, use_api: boo
     day_of_week = weekday
     nearby_events = random.choice([0, 1])
     
-    accident_risk = predict_accident_risk(vehicle_density, avg_speed, road_condition, 
-                                         weather_condition, visibility, time_of_day)
+    accident_risk = run_model('accident', predict_accident_risk,
+                              vehicle_density, avg_speed, road_condition,
+                              weather_condition, visibility, time_of_day)
     
-    parking_status = predict_parking_availability(parking_capacity, occupied_slots, 
-                                                   entry_rate, exit_rate, 
-                                                   parking_time_of_day, weekday, nearby_events)
+    parking_status = run_model('parking', predict_parking_availability,
+                               parking_capacity, occupied_slots,
+                               entry_rate, exit_rate,
+                               parking_time_of_day, weekday, nearby_events)
     
-    activity_level = predict_citizen_activity(population_density, avg_age, workplace_count,
-                                             public_events, activity_temperature, day_of_week)
+    activity_level = run_model('activity', predict_citizen_activity,
+                               population_density, avg_age, workplace_count,
+                               public_events, activity_temperature, day_of_week)
     
-    return {
+    metrics = {
         'air_quality': round(aqi, 1),
         'accident_risk': accident_risk,
         'parking_status': parking_status,
         'activity_level': activity_level,
         'location': {'lat': lat, 'lon': lon},
+        'upstream': upstream_timings,
         'raw_data': {
             'air_quality': {
                 'pm25': round(pm25, 1),
@@ -428,23 +510,41 @@ def run_all_models_for_city(city_name: str, lat: float, lon: float, use_api: boo
                 'parking_capacity': parking_capacity,
                 'occupied_slots': occupied_slots,
                 'entry_rate': round(entry_rate, 1),
-                'exit_rate': round(exit_rate, 1)
+                'exit_rate': round(exit_rate, 1),
+                'time_until_full': live_parking['min_time_until_full'] if live_parking else None,
+                'source': 'Sensors' if live_parking else 'Simulated'
             },
             'activity': {
                 'population_density': population_density,
                 'avg_age': avg_age,
                 'workplace_count': workplace_count,
-                'public_events': public_events
+                'public_events': public_events,
+                'source': 'Sensors' if live_activity else 'Simulated'
             }
         }
     }
+    
+    # Record this run in the city's metrics history
+    score = calculate_smart_city_score(
+        air_quality=metrics['air_quality'],
+        accident_risk=accident_risk,
+        parking_status=parking_status,
+        activity_level=activity_level
+    )
+    city_history.record(city_name, metrics, score)
+    
+    return metrics
 
 def get_city_metrics(city_name: str) -> Dict[str, Any]:
     """Get or generate metrics for a city"""
     city_name = city_name.title()  # Normalize case
     
-    # Get or create city data
-    if city_name not in CITY_DATA:
+    # Read through the shared store so rows written by other workers are seen;
+    # the in-process copy only serves when the store has no row or can't be read
+    stored = load_city(city_name)
+    if stored is not None:
+        CITY_DATA[city_name] = stored
+    elif city_name not in CITY_DATA:
         # Generate some random but realistic data for new cities
         CITY_DATA[city_name] = {
             'air_quality': random.uniform(30, 150),  # AQI
@@ -455,7 +555,7 @@ def get_city_metrics(city_name: str) -> Dict[str, Any]:
             'traffic_congestion': random.uniform(0.1, 0.9),  # 0-1 scale
             'last_updated': datetime.now().isoformat()
         }
-        save_city_data(CITY_DATA)
+        save_city(city_name, CITY_DATA[city_name])
         
     return CITY_DATA[city_name]
 
@@ -527,6 +627,127 @@ def generate_insights(city_name: str, metrics: Dict[str, Any]) -> Dict[str, str]
     
     return insights
 
+def refresh_city(city_name: str, lat: float, lon: float, use_api: bool = True) -> Dict[str, Any]:
+    """
+    Run all models for a city, store the result and push it to stream
+    subscribers. Returns the snapshot request handlers serve.
+    """
+    all_metrics = run_all_models_for_city(city_name, lat, lon, use_api=use_api)
+    
+    # Update city data with latest predictions
+    city_metrics = get_city_metrics(city_name)
+    city_metrics.update({
+        'air_quality': all_metrics['air_quality'],
+        'accident_risk': all_metrics['accident_risk'],
+        'parking_status': all_metrics['parking_status'],
+        'activity_level': all_metrics['activity_level'],
+        'last_updated': datetime.now().isoformat()
+    })
+    CITY_DATA[city_name] = city_metrics
+    save_city(city_name, city_metrics)
+    heatmap_tiles.invalidate(city_name.title())
+    
+    # Calculate overall smart city score
+    score = calculate_smart_city_score(
+        air_quality=all_metrics['air_quality'],
+        accident_risk=all_metrics['accident_risk'],
+        parking_status=all_metrics['parking_status'],
+        activity_level=all_metrics['activity_level']
+    )
+    
+    # Check for threshold breaches
+    alerts = check_threshold_breaches(city_name, all_metrics)
+    publish_city_update(city_name, all_metrics, score, alerts, city_metrics['last_updated'])
+    
+    return {
+        'metrics': all_metrics,
+        'city_metrics': dict(city_metrics),
+        'score': score,
+        'alerts': alerts,
+        'last_updated': city_metrics['last_updated']
+    }
+
+# Background refresh of watched cities
+refresh_scheduler = RefreshScheduler(refresh_city)
+
+@app.before_request
+def start_sensor_ingest():
+    """Restore the parking window snapshot before the first refresh reads sensor state"""
+    sensor_ingest.start()
+
+@app.before_request
+def start_refresh_scheduler():
+    """Start warming the built-in and stored cities in the serving process"""
+    if not refresh_scheduler.start():
+        return
+    names = set(CITY_DATA) | {name.title() for name in location_service.CITY_COORDINATES}
+    for name in sorted(names):
+        city = location_service.geocode(name)
+        if city:
+            refresh_scheduler.watch(city.name, city.latitude, city.longitude)
+
+@app.route('/api/scheduler/status', methods=['GET'])
+def get_scheduler_status():
+    """Watched/warm city counts and refresh counters"""
+    return jsonify(refresh_scheduler.status())
+
+# Largest /api/ingest body, and the Retry-After sent when the queue is full
+MAX_INGEST_BYTES = 16 * 1024 * 1024
+INGEST_RETRY_AFTER = 1
+
+@app.route('/api/ingest', methods=['POST'])
+def ingest_readings():
+    """Accept newline-delimited sensor readings for asynchronous aggregation"""
+    if request.content_length and request.content_length > MAX_INGEST_BYTES:
+        return jsonify({'error': f'Body larger than {MAX_INGEST_BYTES} bytes; split the batch'}), 413
+    readings, malformed = parse_ndjson(request.get_data(cache=False))
+    try:
+        sensor_ingest.submit(readings)
+    except IngestQueueFull as e:
+        response = jsonify({'error': f'Ingest queue full: {e}', 'accepted': 0, 'malformed': malformed})
+        response.headers['Retry-After'] = str(INGEST_RETRY_AFTER)
+        return response, 429
+    return jsonify({'accepted': len(readings), 'malformed': malformed}), 202
+
+@app.route('/api/ingest/status', methods=['GET'])
+def get_ingest_status():
+    """Queue depth, apply throughput and live lot/zone counts"""
+    return jsonify(sensor_ingest.status())
+
+@app.route('/api/parking/lots', methods=['GET'])
+def get_parking_lots():
+    """Live per-lot rates, occupancy, time-until-full and predicted availability for a city"""
+    city_name = request.args.get('city')
+    if not city_name:
+        return jsonify({'error': 'City name required'}), 400
+    state = sensor_ingest.lot_states(city_name)
+    if state is None:
+        return jsonify({'city': city_name, 'lots': []})
+    
+    n = len(state['lot'])
+    now = datetime.now()
+    features = np.column_stack([
+        state['capacity'], state['occupied'], state['entry_rate'], state['exit_rate'],
+        np.full(n, now.hour // 6), np.full(n, now.weekday()), np.zeros(n)
+    ])
+    predictions = model_registry.predict(MODULE_DATASETS['parking'], features)
+    if predictions is None:
+        predictions = predict_parking_availability_batch(*features.T)
+    
+    lots = []
+    for i, lot in enumerate(state['lot']):
+        until_full = state['time_until_full'][i]
+        lots.append({
+            'lot': lot,
+            'capacity': int(state['capacity'][i]),
+            'occupied': int(state['occupied'][i]),
+            'entry_rate': round(float(state['entry_rate'][i]), 1),
+            'exit_rate': round(float(state['exit_rate'][i]), 1),
+            'time_until_full': None if np.isnan(until_full) else round(float(until_full)),
+            'prediction': str(predictions[i])
+        })
+    return jsonify({'city': city_name, 'lots': lots})
+
 @app.route('/api/city/predict', methods=['GET'])
 def predict_city():
     """Endpoint for location-based predictions - runs all models"""
@@ -547,35 +768,19 @@ def predict_city():
             'error': 'Could not determine city. Please provide a valid city name or coordinates.'
         }), 400
     
-    # Run all ML models for this city
-    all_metrics = run_all_models_for_city(city.name, city.latitude, city.longitude, use_api=use_api)
-    
-    # Update city data with latest predictions
-    city_metrics = get_city_metrics(city.name)
-    city_metrics.update({
-        'air_quality': all_metrics['air_quality'],
-        'accident_risk': all_metrics['accident_risk'],
-        'parking_status': all_metrics['parking_status'],
-        'activity_level': all_metrics['activity_level'],
-        'last_updated': datetime.now().isoformat()
-    })
-    CITY_DATA[city.name] = city_metrics
-    save_city_data(CITY_DATA)
-    
-    # Calculate overall smart city score
-    score = calculate_smart_city_score(
-        air_quality=all_metrics['air_quality'],
-        accident_risk=all_metrics['accident_risk'],
-        parking_status=all_metrics['parking_status'],
-        activity_level=all_metrics['activity_level']
-    )
+    if use_api:
+        snapshot = refresh_scheduler.get(city.name, city.latitude, city.longitude)
+    else:
+        # Simulated-data runs are explicit one-offs, not scheduler snapshots
+        snapshot = refresh_city(city.name, city.latitude, city.longitude, use_api=False)
+    all_metrics = snapshot['metrics']
+    city_metrics = snapshot['city_metrics']
+    score = snapshot['score']
+    alerts = snapshot['alerts']
     
     # Generate insights and recommendations
     insights = generate_insights(city.name, city_metrics)
     
-    # Check for threshold breaches
-    alerts = check_threshold_breaches(city.name, all_metrics)
-    
     # Prepare response
     response = {
         'city': city.name,
@@ -588,11 +793,150 @@ def predict_city():
         'status': get_city_status(score),
         'insights': insights,
         'alerts': alerts,
-        'last_updated': city_metrics['last_updated']
+        'last_updated': snapshot['last_updated']
     }
     
     return jsonify(response)
 
+# Multi-city scoring limits
+MAX_BATCH_CITIES = 500
+CITY_SCORES_BUDGET = 10.0
+city_score_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='city-score')
+
+def score_city(city: CityData) -> Dict[str, Any]:
+    """Score one city from its scheduler snapshot, or by running the models"""
+    started = time.perf_counter()
+    snapshot = refresh_scheduler.snapshot(city.name)
+    if snapshot is not None:
+        metrics, score, source = snapshot['metrics'], snapshot['score'], 'snapshot'
+    else:
+        metrics = run_all_models_for_city(city.name, city.latitude, city.longitude)
+        score = calculate_smart_city_score(
+            air_quality=metrics['air_quality'],
+            accident_risk=metrics['accident_risk'],
+            parking_status=metrics['parking_status'],
+            activity_level=metrics['activity_level']
+        )
+        source = 'computed'
+    return {
+        'city': city.name,
+        'location': {'lat': city.latitude, 'lon': city.longitude},
+        'score': score,
+        'status': get_city_status(score),
+        'metrics': {key: metrics[key] for key in ('air_quality', 'accident_risk', 'parking_status', 'activity_level')},
+        'source': source,
+        'ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+@app.route('/api/cities/scores', methods=['GET', 'POST'])
+def get_cities_scores():
+    """
+    Score many cities at once, given as `cities` (comma-separated or a JSON
+    list) or a `bbox` of west,south,east,north (west > east crosses the
+    antimeridian). Results stream as NDJSON in completion order; the last
+    line ranks every city scored within the time budget and lists those
+    that did not finish.
+    """
+    params = (request.get_json(silent=True) or {}) if request.method == 'POST' else {}
+    if not isinstance(params, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    cities_param = params.get('cities', request.args.get('cities'))
+    bbox_param = params.get('bbox', request.args.get('bbox'))
+    try:
+        limit = int(params.get('limit', request.args.get('limit', MAX_BATCH_CITIES)))
+        budget = float(params.get('budget', request.args.get('budget', CITY_SCORES_BUDGET)))
+    except (TypeError, ValueError, OverflowError):
+        return jsonify({'error': 'limit and budget must be numbers'}), 400
+    if not 1 <= limit <= MAX_BATCH_CITIES:
+        return jsonify({'error': f'limit must be between 1 and {MAX_BATCH_CITIES}'}), 400
+    # NaN fails the comparison too
+    if not budget > 0:
+        return jsonify({'error': 'budget must be a positive number of seconds'}), 400
+    budget = min(budget, CITY_SCORES_BUDGET)
+    
+    cities, unknown = [], []
+    if cities_param:
+        names = cities_param.split(',') if isinstance(cities_param, str) else cities_param
+        for name in dict.fromkeys(str(name).strip() for name in names if str(name).strip()):
+            city = location_service.geocode(name)
+            if city:
+                cities.append(city)
+            else:
+                unknown.append(name)
+    elif bbox_param:
+        try:
+            west, south, east, north = [float(v) for v in
+                                        (bbox_param.split(',') if isinstance(bbox_param, str) else bbox_param)]
+        except (TypeError, ValueError):
+            return jsonify({'error': 'bbox must be west,south,east,north'}), 400
+        if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+            return jsonify({'error': 'bbox must be west,south,east,north'}), 400
+        cities = location_service.cities_in_bbox(south, west, north, east, limit)
+    else:
+        return jsonify({'error': 'Provide cities or bbox'}), 400
+    
+    # One entry per place; repeated coordinates share cached upstream fetches
+    cities = list({city.name: city for city in cities}.values())[:limit]
+    
+    def results():
+        started = time.perf_counter()
+        futures = {city_score_executor.submit(score_city, city): city for city in cities}
+        scored, failed, pending = [], [], set(futures)
+        try:
+            for future in as_completed(futures, timeout=budget):
+                pending.discard(future)
+                city = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed.append(city.name)
+                    yield json.dumps({'city': city.name, 'error': str(e)}) + '\n'
+                    continue
+                scored.append(result)
+                yield json.dumps(result, default=str) + '\n'
+        except FuturesTimeoutError:
+            pass
+        finally:
+            for future in pending:
+                future.cancel()
+        
+        ranking = sorted(scored, key=lambda result: -result['score'])
+        yield json.dumps({
+            'ranking': [{'rank': rank, 'city': result['city'], 'score': result['score'],
+                         'status': result['status']['status']}
+                        for rank, result in enumerate(ranking, 1)],
+            'timed_out': sorted(futures[future].name for future in pending),
+            'failed': failed,
+            'unknown': unknown,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }) + '\n'
+    
+    return Response(stream_with_context(results()), mimetype='application/x-ndjson')
+
+@app.route('/api/city/history', methods=['GET'])
+def get_city_history():
+    """Min/mean/max rollups of a city's metrics over a time range"""
+    city_name = request.args.get('city')
+    if not city_name:
+        return jsonify({'error': 'City name required'}), 400
+    
+    try:
+        end = parse_timestamp(request.args.get('to'), datetime.now().timestamp())
+        start = parse_timestamp(request.args.get('from'), end - 86400)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid time range: {e}'}), 400
+    try:
+        step = int(request.args.get('step', 3600))
+    except ValueError:
+        step = 0
+    if step <= 0:
+        return jsonify({'error': 'step must be a positive whole number of seconds'}), 400
+    
+    if end <= start:
+        return jsonify({'error': 'Invalid time range'}), 400
+    
+    return jsonify(city_history.query(city_name, start, end, step))
+
 def check_threshold_breaches(city_name: str, metrics: Dict[str, Any]) -> list:
     """Check for threshold breaches and return alerts"""
     alerts = []
@@ -659,10 +1003,69 @@ def check_threshold_breaches(city_name: str, metrics: Dict[str, Any]) -> list:
     
     return alerts
 
-def send_alert(message, level="info"):
-    """Send a real-time alert"""
-    # In a real app, this would use WebSockets or similar for real-time updates
+def send_alert(message, level="info", city_name=None, alert=None):
+    """Send a real-time alert to stream subscribers of the city (or everyone)"""
     print(f"ALERT [{level.upper()}]: {message}")
+    topic = city_topic(city_name) if city_name else '*'
+    event_broker.publish(topic, 'alert', {**(alert or {}), 'type': level, 'message': message, 'city': city_name})
+
+# Alert keys last published per city topic, so only new breaches are pushed
+_active_alerts: Dict[str, set] = {}
+
+def city_topic(city_name: str) -> str:
+    return city_name.strip().title()
+
+def publish_city_update(city_name: str, metrics: Dict[str, Any], score: float,
+                        alerts: list = None, last_updated: str = None):
+    """
+    Push a city's score to stream subscribers when it changed, and send
+    alerts for breaches that were not active at the previous update.
+    """
+    topic = city_topic(city_name)
+    core = {key: metrics.get(key) for key in ('air_quality', 'accident_risk', 'parking_status', 'activity_level')}
+    previous = event_broker.retained(topic, 'score')
+    if previous is None or previous['score'] != score or previous['metrics'] != core:
+        event_broker.publish(topic, 'score', {
+            'city': topic,
+            'score': score,
+            'status': get_city_status(score),
+            'metrics': core,
+            'last_updated': last_updated or datetime.now().isoformat()
+        }, retain=True)
+
+    if alerts is None:
+        alerts = check_threshold_breaches(city_name, metrics)
+    keys = {(alert['metric'], alert['type']) for alert in alerts}
+    # Cities without active alerts are not kept, so the map only holds cities in breach
+    previous_keys = _active_alerts.pop(topic, set())
+    if keys:
+        _active_alerts[topic] = keys
+    for alert in alerts:
+        if (alert['metric'], alert['type']) not in previous_keys:
+            send_alert(alert['message'], alert['type'], city_name=topic, alert=alert)
+
+@app.route('/api/stream', methods=['GET'])
+def stream_city_events():
+    """
+    Server-Sent Events stream of score changes and new alerts for a city
+    (alerts only when no city is given). Clients that cannot hold the stream
+    open fall back to polling /api/city_score and /api/alerts.
+    """
+    city_name = request.args.get('city')
+    subscription = event_broker.subscribe(city_topic(city_name)) if city_name else event_broker.subscribe()
+
+    def events():
+        try:
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            while True:
+                message = subscription.get(timeout=STREAM_KEEPALIVE)
+                # Comment frames keep proxies from closing an idle stream
+                yield format_sse(message) if message else ": keepalive\n\n"
+        finally:
+            event_broker.unsubscribe(subscription)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/alerts', methods=['GET'])
 def get_alerts():
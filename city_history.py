@@ -0,0 +1,368 @@
+"""
+City History for Smart City System
+Time-series storage of city metrics with precomputed 1-minute/1-hour rollups
+"""
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+# Numeric series recorded for every model run
+SERIES = ('score', 'air_quality', 'accident_risk', 'parking_status', 'activity_level')
+
+# Categorical predictions are stored as ordinal levels
+LEVELS = {
+    'accident_risk': {'Low': 0, 'Medium': 1, 'High': 2},
+    'parking_status': {'Available': 0, 'Full': 1},
+    'activity_level': {'Low': 0, 'Moderate': 1, 'High': 2}
+}
+
+MINUTE = 60
+HOUR = 3600
+# Latest epoch second a query may name (end of year 9999, the datetime limit)
+MAX_TIMESTAMP = 253402300799
+
+HISTORY_DIR = 'data/history'
+RETENTION_DAYS = 31
+RAW_CAPACITY = 1440
+
+# One closed 1-minute bucket as written to the per-day chunk files
+RECORD_DTYPE = np.dtype([
+    ('ts', '<i8'),
+    ('count', '<i8'),
+    ('sum', '<f8', (len(SERIES),)),
+    ('min', '<f8', (len(SERIES),)),
+    ('max', '<f8', (len(SERIES),))
+])
+
+def parse_timestamp(value: Optional[str], default: float) -> float:
+    """
+    Parse epoch seconds or an ISO 8601 string; fall back to `default`.
+    Raises ValueError for NaN, infinities and seconds outside MAX_TIMESTAMP.
+    """
+    if value is None or value == '':
+        return default
+    try:
+        ts = float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+    if not math.isfinite(ts) or abs(ts) > MAX_TIMESTAMP:
+        raise ValueError(f"timestamp out of range: {value}")
+    return ts
+
+def aggregate(ts, count, total, low, high, start: int, end: int, step: int):
+    """
+    Roll sorted bucket rows up into `step`-second buckets over [start, end).
+    Returns (bucket_start, count, sum, min, max) with empty buckets omitted.
+    """
+    lo, hi = np.searchsorted(ts, [start, end])
+    if lo == hi:
+        empty = np.empty((0, total.shape[1]))
+        return np.empty(0, np.int64), np.empty(0, np.int64), empty, empty, empty
+
+    bucket = (ts[lo:hi] - start) // step
+    edges = np.concatenate(([0], np.flatnonzero(np.diff(bucket)) + 1))
+    return (
+        start + bucket[edges] * step,
+        np.add.reduceat(count[lo:hi], edges),
+        np.add.reduceat(total[lo:hi], edges, axis=0),
+        np.minimum.reduceat(low[lo:hi], edges, axis=0),
+        np.maximum.reduceat(high[lo:hi], edges, axis=0)
+    )
+
+class Rollup:
+    """Fixed-resolution count/sum/min/max aggregates kept sorted by bucket start"""
+
+    def __init__(self, resolution: int, capacity: int = 256):
+        width = len(SERIES)
+        self.resolution = resolution
+        self.size = 0
+        self.ts = np.empty(capacity, np.int64)
+        self.count = np.empty(capacity, np.int64)
+        self.sum = np.empty((capacity, width))
+        self.min = np.empty((capacity, width))
+        self.max = np.empty((capacity, width))
+
+    def _grow(self, needed: int):
+        capacity = len(self.ts)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2)
+        for attr in ('ts', 'count', 'sum', 'min', 'max'):
+            old = getattr(self, attr)
+            new = np.empty((capacity,) + old.shape[1:], old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, attr, new)
+
+    def add(self, t: float, values: np.ndarray) -> Optional[int]:
+        """
+        Add one point. Returns the index of the previous last bucket when
+        this point opens a newer bucket (i.e. that bucket is now closed).
+        """
+        bucket = int(t) - int(t) % self.resolution
+        last = self.size - 1
+
+        if self.size and self.ts[last] == bucket:
+            self._merge(last, 1, values, values, values)
+            return None
+
+        if not self.size or self.ts[last] < bucket:
+            self._grow(self.size + 1)
+            self._set(self.size, bucket, 1, values, values, values)
+            self.size += 1
+            return last if last >= 0 else None
+
+        # Late point for an older bucket
+        i = int(np.searchsorted(self.ts[:self.size], bucket))
+        if self.ts[i] == bucket:
+            self._merge(i, 1, values, values, values)
+        else:
+            self._grow(self.size + 1)
+            for attr in ('ts', 'count', 'sum', 'min', 'max'):
+                arr = getattr(self, attr)
+                arr[i + 1:self.size + 1] = arr[i:self.size]
+            self._set(i, bucket, 1, values, values, values)
+            self.size += 1
+        return None
+
+    def extend(self, ts, count, total, low, high):
+        """Append already-aggregated rows that are newer than every existing row"""
+        n = len(ts)
+        self._grow(self.size + n)
+        end = self.size + n
+        self.ts[self.size:end] = ts
+        self.count[self.size:end] = count
+        self.sum[self.size:end] = total
+        self.min[self.size:end] = low
+        self.max[self.size:end] = high
+        self.size = end
+
+    def _set(self, i, bucket, count, total, low, high):
+        self.ts[i] = bucket
+        self.count[i] = count
+        self.sum[i] = total
+        self.min[i] = low
+        self.max[i] = high
+
+    def _merge(self, i, count, total, low, high):
+        self.count[i] += count
+        self.sum[i] += total
+        np.minimum(self.min[i], low, out=self.min[i])
+        np.maximum(self.max[i], high, out=self.max[i])
+
+    def record(self, i: int) -> np.ndarray:
+        """Return row `i` as a RECORD_DTYPE record"""
+        record = np.zeros(1, RECORD_DTYPE)
+        record['ts'] = self.ts[i]
+        record['count'] = self.count[i]
+        record['sum'] = self.sum[i]
+        record['min'] = self.min[i]
+        record['max'] = self.max[i]
+        return record
+
+    def trim(self, oldest: int):
+        """Drop buckets that start before `oldest`"""
+        cut = int(np.searchsorted(self.ts[:self.size], oldest))
+        if not cut:
+            return
+        keep = self.size - cut
+        for attr in ('ts', 'count', 'sum', 'min', 'max'):
+            arr = getattr(self, attr)
+            arr[:keep] = arr[cut:self.size]
+        self.size = keep
+
+    def query(self, start: int, end: int, step: int):
+        n = self.size
+        return aggregate(self.ts[:n], self.count[:n], self.sum[:n],
+                         self.min[:n], self.max[:n], start, end, step)
+
+class RawRing:
+    """Ring buffer of the most recent raw points for one city"""
+
+    def __init__(self, capacity: int = RAW_CAPACITY):
+        self.ts = np.zeros(capacity, np.int64)
+        self.values = np.zeros((capacity, len(SERIES)))
+        self.head = 0
+        self.size = 0
+
+    def append(self, t: float, values: np.ndarray):
+        self.ts[self.head] = int(t)
+        self.values[self.head] = values
+        self.head = (self.head + 1) % len(self.ts)
+        self.size = min(self.size + 1, len(self.ts))
+
+    def query(self, start: int, end: int, step: int):
+        order = np.arange(self.head - self.size, self.head) % len(self.ts)
+        ts = self.ts[order]
+        values = self.values[order]
+        # Points normally arrive in time order; sort in case of clock adjustments
+        if np.any(np.diff(ts) < 0):
+            idx = np.argsort(ts, kind='stable')
+            ts, values = ts[idx], values[idx]
+        return aggregate(ts, np.ones(len(ts), np.int64), values, values, values, start, end, step)
+
+class CityHistory:
+    """Raw ring buffer plus minute and hour rollups for one city"""
+
+    def __init__(self):
+        self.raw = RawRing()
+        self.rollups = {MINUTE: Rollup(MINUTE, 2048), HOUR: Rollup(HOUR)}
+
+class HistoryStore:
+    """
+    In-memory per-city history backed by per-day chunk files of closed
+    1-minute buckets. Hour rollups are rebuilt from the minute chunks when a
+    city is first touched, so range queries never scan raw points.
+    """
+
+    def __init__(self, history_dir: str = HISTORY_DIR, retention_days: int = RETENTION_DAYS):
+        self.history_dir = history_dir
+        self.retention = retention_days * 86400
+        self._cities: Dict[str, CityHistory] = {}
+        self._lock = threading.Lock()
+
+    def _city_dir(self, city_name: str) -> str:
+        # The slug is for reading; the hash of the exact name keeps names that
+        # differ only in punctuation or sign ("12.5,-3.2" vs "12.5,3.2") apart
+        slug = re.sub(r'[^a-z0-9]+', '_', city_name.lower()).strip('_')
+        digest = hashlib.sha1(city_name.encode('utf-8')).hexdigest()[:8]
+        return os.path.join(self.history_dir, f"{slug}_{digest}")
+
+    def _get(self, city_name: str) -> CityHistory:
+        history = self._cities.get(city_name)
+        if history is None:
+            history = CityHistory()
+            self._load(city_name, history)
+            self._cities[city_name] = history
+        return history
+
+    def _load(self, city_name: str, history: CityHistory):
+        """Rebuild minute and hour rollups from this city's chunk files"""
+        directory = self._city_dir(city_name)
+        if not os.path.isdir(directory):
+            return
+
+        oldest = int(time.time()) - self.retention
+        oldest_day = datetime.fromtimestamp(oldest).strftime('%Y%m%d')
+        chunks = []
+        for filename in sorted(os.listdir(directory)):
+            path = os.path.join(directory, filename)
+            if not filename.endswith('.bin'):
+                continue
+            if filename[:-4] < oldest_day:
+                os.remove(path)
+                continue
+            chunks.append(np.fromfile(path, dtype=RECORD_DTYPE))
+
+        if not chunks:
+            return
+
+        records = np.concatenate(chunks)
+        records = records[np.argsort(records['ts'], kind='stable')]
+        args = (records['ts'], records['count'], records['sum'], records['min'], records['max'])
+        # Merge duplicate minutes written by different worker processes
+        end = int(records['ts'][-1]) + 1
+        for resolution, rollup in history.rollups.items():
+            start = oldest - oldest % resolution
+            rollup.extend(*aggregate(*args, start, end, resolution))
+
+    def _persist(self, city_name: str, record: np.ndarray):
+        """Append a closed minute bucket to its day's chunk file"""
+        directory = self._city_dir(city_name)
+        os.makedirs(directory, exist_ok=True)
+        day = datetime.fromtimestamp(int(record['ts'][0])).strftime('%Y%m%d')
+        with open(os.path.join(directory, f"{day}.bin"), 'ab') as f:
+            record.tofile(f)
+
+    def record(self, city_name: str, metrics: Dict[str, Any], score: float,
+               timestamp: Optional[float] = None):
+        """Append one model run for a city"""
+        city_name = city_name.title()
+        t = time.time() if timestamp is None else timestamp
+        values = np.array([
+            score,
+            metrics.get('air_quality', np.nan),
+            *(LEVELS[name].get(metrics.get(name), np.nan) for name in SERIES[2:])
+        ], dtype=np.float64)
+
+        with self._lock:
+            history = self._get(city_name)
+            history.raw.append(t, values)
+            minutes = history.rollups[MINUTE]
+            late = minutes.size and int(t) < minutes.ts[minutes.size - 1]
+            closed = minutes.add(t, values)
+            history.rollups[HOUR].add(t, values)
+
+            if late:
+                # Persist the point on its own; loading merges it into its minute
+                record = np.zeros(1, RECORD_DTYPE)
+                record['ts'] = int(t) - int(t) % MINUTE
+                record['count'] = 1
+                record['sum'] = record['min'] = record['max'] = values
+            elif closed is not None:
+                record = minutes.record(closed)
+                for rollup in history.rollups.values():
+                    rollup.trim(int(t) - self.retention)
+            else:
+                record = None
+
+        if record is not None:
+            try:
+                self._persist(city_name, record)
+            except OSError as e:
+                print(f"Error writing history for {city_name}: {e}")
+
+    def query(self, city_name: str, start: float, end: float, step: int) -> Dict[str, Any]:
+        """
+        Return min/mean/max per series in `step`-second buckets over [start, end).
+        Uses hour rollups when `step` is a multiple of an hour, minute rollups
+        when it is a multiple of a minute, and the raw ring buffer otherwise.
+        """
+        city_name = city_name.title()
+        start, end, step = int(start), int(end), max(1, int(step))
+
+        if step % HOUR == 0:
+            resolution = HOUR
+        elif step % MINUTE == 0:
+            resolution = MINUTE
+        else:
+            resolution = 0
+
+        with self._lock:
+            history = self._get(city_name)
+            source = history.rollups[resolution] if resolution else history.raw
+            ts, count, total, low, high = source.query(start, end, step)
+
+        mean = total / count[:, None] if len(count) else total
+        series = {}
+        for i, name in enumerate(SERIES):
+            series[name] = {
+                'min': _to_list(low[:, i]),
+                'mean': _to_list(mean[:, i]),
+                'max': _to_list(high[:, i])
+            }
+
+        return {
+            'city': city_name,
+            'from': start,
+            'to': end,
+            'step': step,
+            'resolution': resolution or 'raw',
+            'timestamps': ts.tolist(),
+            'count': count.tolist(),
+            'series': series
+        }
+
+def _to_list(values: np.ndarray) -> list:
+    """Convert to a JSON-friendly list (NaN -> None, rounded)"""
+    values = np.round(values, 3)
+    return [None if v != v else v for v in values.tolist()]
+
+# Global history store instance
+city_history = HistoryStore()
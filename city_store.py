@@ -0,0 +1,102 @@
+"""
+City Store for Smart City System
+SQLite-backed storage for per-city metrics with per-city upserts
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Any, Optional
+
+class CityStore:
+    """
+    Stores one JSON document per city in an SQLite database.
+    WAL mode lets several Flask workers read while one writes, and every
+    write is a single-row upsert inside its own transaction.
+    """
+
+    def __init__(self, db_path: str, legacy_json: Optional[str] = None):
+        self.db_path = db_path
+        self.legacy_json = legacy_json
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, creating the schema on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=10000')
+        self._local.conn = conn
+
+        with self._init_lock:
+            if not self._initialized:
+                self._create_schema(conn)
+                self._initialized = True
+        return conn
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        """Create the table and import the legacy JSON file if the store is new"""
+        with conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cities ('
+                'name TEXT PRIMARY KEY, '
+                'data TEXT NOT NULL, '
+                'updated_at TEXT)'
+            )
+
+        if not self.legacy_json or not os.path.exists(self.legacy_json):
+            return
+        if conn.execute('SELECT 1 FROM cities LIMIT 1').fetchone():
+            return
+
+        try:
+            with open(self.legacy_json, 'r') as f:
+                legacy = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error importing {self.legacy_json}: {e}")
+            return
+
+        # INSERT OR IGNORE keeps this safe if another worker imports concurrently
+        with conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO cities (name, data, updated_at) VALUES (?, ?, ?)',
+                [(name, json.dumps(metrics), metrics.get('last_updated'))
+                 for name, metrics in legacy.items()]
+            )
+
+    def load_all(self) -> Dict[str, Any]:
+        """Read every city into a dict keyed by city name"""
+        rows = self._connect().execute('SELECT name, data FROM cities').fetchall()
+        return {name: json.loads(data) for name, data in rows}
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        """Read a single city, or None if it has never been stored"""
+        row = self._connect().execute(
+            'SELECT data FROM cities WHERE name = ?', (name,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def upsert(self, name: str, metrics: Dict[str, Any]):
+        """Insert or replace one city's metrics atomically"""
+        self.upsert_many({name: metrics})
+
+    def upsert_many(self, data: Dict[str, Any]):
+        """Insert or replace several cities in one transaction"""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'INSERT INTO cities (name, data, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at',
+                [(name, json.dumps(metrics), metrics.get('last_updated'))
+                 for name, metrics in data.items()]
+            )
@@ -0,0 +1,161 @@
+"""
+Columnar datasets for Smart City System
+Typed .npy column stores with a JSON schema, memory-mapped on load
+"""
+import json
+import os
+import sys
+from typing import Dict, Any, Iterator, List
+
+import numpy as np
+import pandas as pd
+
+COLUMNAR_DIR = os.path.join('data', 'columnar')
+SCHEMA_FILE = 'schema.json'
+CONVERT_CHUNK_SIZE = 500_000
+
+UNSIGNED = [np.uint8, np.uint16, np.uint32, np.uint64]
+SIGNED = [np.int8, np.int16, np.int32, np.int64]
+
+def columnar_path(name: str, base_dir: str = COLUMNAR_DIR) -> str:
+    return os.path.join(base_dir, name)
+
+def narrowest_int(lo: int, hi: int):
+    """Smallest integer dtype holding [lo, hi]"""
+    for dtype in (UNSIGNED if lo >= 0 else SIGNED):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return dtype
+    return np.int64
+
+def _infer_schema(chunks: Iterator[pd.DataFrame]) -> Dict[str, Any]:
+    """Column kinds and value ranges over every chunk of a CSV"""
+    stats, rows = {}, 0
+    for chunk in chunks:
+        rows += len(chunk)
+        for column in chunk.columns:
+            values = chunk[column]
+            info = stats.setdefault(column, {'kind': None, 'lo': None, 'hi': None,
+                                             'float32': True, 'categories': set()})
+            if pd.api.types.is_integer_dtype(values) or pd.api.types.is_bool_dtype(values):
+                kind = 'int'
+            elif pd.api.types.is_float_dtype(values):
+                kind = 'float'
+            else:
+                kind = 'category'
+            # A column widens int -> float -> category as chunks disagree
+            order = ['int', 'float', 'category']
+            if info['kind'] is None or order.index(kind) > order.index(info['kind']):
+                info['kind'] = kind
+
+            if kind == 'category':
+                info['categories'].update(values.dropna().astype(str).unique().tolist())
+            else:
+                data = values.to_numpy(dtype=np.float64)
+                finite = data[~np.isnan(data)]
+                if len(finite):
+                    lo, hi = finite.min(), finite.max()
+                    info['lo'] = lo if info['lo'] is None else min(info['lo'], lo)
+                    info['hi'] = hi if info['hi'] is None else max(info['hi'], hi)
+                    if info['float32'] and not np.array_equal(finite.astype(np.float32).astype(np.float64), finite):
+                        info['float32'] = False
+
+    columns = []
+    for column, info in stats.items():
+        if info['kind'] == 'category':
+            categories = sorted(info['categories'])
+            # Signed codes: missing values are stored as -1, as pandas codes them
+            columns.append({'name': column, 'kind': 'category', 'categories': categories,
+                            'dtype': np.dtype(narrowest_int(-1, max(len(categories), 1))).name})
+        elif info['kind'] == 'int':
+            dtype = narrowest_int(int(info['lo'] or 0), int(info['hi'] or 0))
+            columns.append({'name': column, 'kind': 'int', 'dtype': np.dtype(dtype).name})
+        else:
+            dtype = np.float32 if info['float32'] else np.float64
+            columns.append({'name': column, 'kind': 'float', 'dtype': np.dtype(dtype).name})
+    return {'rows': rows, 'columns': columns}
+
+def convert_csv(csv_path: str, out_dir: str, chunk_size: int = CONVERT_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Convert a CSV into one .npy per column plus schema.json, using the
+    narrowest lossless dtype per column (categories for text). Two chunked
+    passes, so memory stays bounded by chunk_size.
+    """
+    schema = _infer_schema(pd.read_csv(csv_path, chunksize=chunk_size))
+    os.makedirs(out_dir, exist_ok=True)
+
+    arrays = {
+        column['name']: np.lib.format.open_memmap(
+            os.path.join(out_dir, f"{column['name']}.npy"), mode='w+',
+            dtype=column['dtype'], shape=(schema['rows'],))
+        for column in schema['columns']
+    }
+    offset = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+        end = offset + len(chunk)
+        for column in schema['columns']:
+            values = chunk[column['name']]
+            if column['kind'] == 'category':
+                # NaN stays missing (code -1) rather than becoming the string 'nan'
+                values = pd.Categorical(values.astype(str).where(values.notna()),
+                                        categories=column['categories']).codes
+            arrays[column['name']][offset:end] = values
+        offset = end
+    for array in arrays.values():
+        array.flush()
+
+    stat = os.stat(csv_path)
+    schema['source'] = {'path': os.path.abspath(csv_path), 'mtime': stat.st_mtime, 'size': stat.st_size}
+    # Written last: a directory without a schema is an incomplete conversion
+    with open(os.path.join(out_dir, SCHEMA_FILE), 'w') as f:
+        json.dump(schema, f, indent=2)
+    return schema
+
+def is_fresh(out_dir: str, csv_path: str) -> bool:
+    """True if a complete columnar copy exists and is newer than the CSV"""
+    schema_path = os.path.join(out_dir, SCHEMA_FILE)
+    if not os.path.exists(schema_path):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return os.path.getmtime(schema_path) >= os.path.getmtime(csv_path)
+
+def read_schema(out_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(out_dir, SCHEMA_FILE), 'r') as f:
+        return json.load(f)
+
+def load_columns(out_dir: str) -> Dict[str, np.ndarray]:
+    """Memory-mapped raw columns (category columns as their codes)"""
+    schema = read_schema(out_dir)
+    return {column['name']: np.load(os.path.join(out_dir, f"{column['name']}.npy"), mmap_mode='r')
+            for column in schema['columns']}
+
+def _frame(schema: Dict[str, Any], columns: Dict[str, np.ndarray], rows: slice) -> pd.DataFrame:
+    data = {}
+    for column in schema['columns']:
+        values = columns[column['name']][rows]
+        if column['kind'] == 'category':
+            data[column['name']] = pd.Categorical.from_codes(values, categories=column['categories'])
+        else:
+            data[column['name']] = values
+    return pd.DataFrame(data, copy=False)
+
+def load_columnar(out_dir: str) -> pd.DataFrame:
+    """Load a converted dataset as a DataFrame backed by memory-mapped columns"""
+    return _frame(read_schema(out_dir), load_columns(out_dir), slice(None))
+
+def iter_columnar(out_dir: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Yield a converted dataset as DataFrames of at most chunk_size rows"""
+    schema = read_schema(out_dir)
+    columns = load_columns(out_dir)
+    for start in range(0, schema['rows'], chunk_size):
+        yield _frame(schema, columns, slice(start, start + chunk_size))
+
+def main(names: List[str]):
+    for name in names:
+        schema = convert_csv(f"{name}.csv", columnar_path(name))
+        dtypes = ', '.join(f"{column['name']}:{column['dtype']}" for column in schema['columns'])
+        print(f"{name}: {schema['rows']} rows -> {columnar_path(name)} ({dtypes})")
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or ['accident_risk', 'air_quality', 'citizen_activity', 'smart_parking'])
@@ -0,0 +1,214 @@
+"""
+Compiled Forests for Smart City System
+Fitted random forests flattened into contiguous arrays with a vectorized traversal
+"""
+from typing import Optional
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+
+from stacking import PrefitStacking
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Rows traversed together; bounds the (trees x rows) node index matrices
+ROW_BLOCK = 1024
+# Synthetic rows checked when no real check rows are given
+SYNTHETIC_CHECK_ROWS = 500
+
+class CompiledForest:
+    """
+    A fitted RandomForestClassifier/Regressor as flat node arrays: every tree's
+    nodes are concatenated, children are absolute indices and leaves point to
+    themselves, so all trees advance one level per step for a whole block of
+    rows at once. Only what prediction needs is kept (no impurities or sample
+    counts), and leaf values live in a leaf-only table. Rows that reached a
+    leaf drop out of the traversal, so each level only touches live paths.
+
+    Inputs are cast to float32 and compared with the float64 thresholds, and
+    per-tree outputs are summed in tree order then divided by the tree count,
+    exactly as sklearn does, so predictions match sklearn bit for bit.
+    """
+
+    def __init__(self, forest):
+        if forest.n_outputs_ > 1:
+            raise ValueError(f"Only single-output forests can be compiled, got {forest.n_outputs_} outputs")
+        self.classifier = isinstance(forest, RandomForestClassifier)
+        if self.classifier:
+            self.classes_ = forest.classes_
+        self.n_features_in_ = forest.n_features_in_
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        self.n_trees = len(trees)
+
+        sizes = np.array([tree.node_count for tree in trees])
+        self.roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int32)
+        feature_dtype = np.int16 if self.n_features_in_ < np.iinfo(np.int16).max else np.int32
+
+        features, thresholds, lefts, rights, go_left, leaf_index, leaf_values = [], [], [], [], [], [], []
+        n_leaves = 0
+        for root, tree in zip(self.roots, trees):
+            nodes = np.arange(tree.node_count, dtype=np.int32) + root
+            is_leaf = tree.children_left == -1
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            lefts.append(np.where(is_leaf, nodes, tree.children_left + root))
+            rights.append(np.where(is_leaf, nodes, tree.children_right + root))
+            go_left.append(np.asarray(tree.missing_go_to_left, dtype=bool))
+            index = np.full(tree.node_count, -1, dtype=np.int32)
+            index[is_leaf] = np.arange(n_leaves, n_leaves + is_leaf.sum())
+            leaf_index.append(index)
+            n_leaves += int(is_leaf.sum())
+            # Classifier leaves hold class fractions, regressor leaves the mean target
+            leaf_values.append(tree.value[is_leaf, 0, :] if self.classifier else tree.value[is_leaf, 0, :1])
+
+        self.feature = np.concatenate(features).astype(feature_dtype)
+        self.threshold = np.concatenate(thresholds).astype(np.float64)
+        self.left = np.concatenate(lefts).astype(np.int32)
+        self.right = np.concatenate(rights).astype(np.int32)
+        self.missing_go_to_left = np.concatenate(go_left)
+        self.leaf_index = np.concatenate(leaf_index)
+        self.leaf_values = np.ascontiguousarray(np.concatenate(leaf_values), dtype=np.float64)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self.roots, self.feature, self.threshold, self.left, self.right,
+                                              self.missing_go_to_left, self.leaf_index, self.leaf_values))
+
+    def _leaves(self, X: np.ndarray) -> np.ndarray:
+        """Leaf-table row reached in every tree, shape (trees, rows)"""
+        n = len(X)
+        flat = X.ravel()
+        node = np.repeat(self.roots, n)
+        offset = np.tile(np.arange(n) * X.shape[1], self.n_trees)
+        # Only (tree, row) pairs still above a leaf are advanced each level
+        active = np.flatnonzero(self.leaf_index[node] < 0)
+        while active.size:
+            current = node[active]
+            value = flat[offset[active] + self.feature[current]]
+            # NaN fails the comparison and follows the node's missing-value direction
+            go_left = (value <= self.threshold[current]) | (np.isnan(value) & self.missing_go_to_left[current])
+            current = np.where(go_left, self.left[current], self.right[current])
+            node[active] = current
+            active = active[self.leaf_index[current] < 0]
+        return self.leaf_index[node].reshape(self.n_trees, n)
+
+    def _sum_trees(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected {self.n_features_in_} features, got array of shape {X.shape}")
+        out = np.zeros((len(X), self.leaf_values.shape[1]), dtype=np.float64)
+        if _traverse is not None:
+            _traverse(np.ascontiguousarray(X), self.roots, self.feature, self.threshold, self.left, self.right,
+                      self.missing_go_to_left, self.leaf_index, self.leaf_values, out)
+            return out
+        for start in range(0, len(X), ROW_BLOCK):
+            block = out[start:start + ROW_BLOCK]
+            for leaves in self._leaves(np.ascontiguousarray(X[start:start + ROW_BLOCK])):
+                block += self.leaf_values[leaves]
+        return out
+
+    def predict_proba(self, X) -> np.ndarray:
+        if not self.classifier:
+            raise AttributeError("predict_proba is only available for classifiers")
+        proba = self._sum_trees(X)
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X) -> np.ndarray:
+        if self.classifier:
+            return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+        y = self._sum_trees(X)[:, 0]
+        y /= self.n_trees
+        return y
+
+def _compile_traverse():
+    """
+    Numba kernel walking each row through each tree in tree order, or None
+    when Numba is unavailable. Same comparisons and summation order as the
+    NumPy path.
+    """
+    if numba is None:
+        return None
+
+    @numba.njit(cache=True)
+    def traverse(X, roots, feature, threshold, left, right, missing_go_to_left, leaf_index, leaf_values, out):
+        for i in range(X.shape[0]):
+            for root in roots:
+                node = root
+                while leaf_index[node] < 0:
+                    value = X[i, feature[node]]
+                    if np.isnan(value):
+                        node = left[node] if missing_go_to_left[node] else right[node]
+                    elif value <= threshold[node]:
+                        node = left[node]
+                    else:
+                        node = right[node]
+                leaf = leaf_index[node]
+                for k in range(leaf_values.shape[1]):
+                    out[i, k] += leaf_values[leaf, k]
+
+    return traverse
+
+_traverse = _compile_traverse()
+
+def compile_forests(model):
+    """
+    The model with every single-output random forest replaced by a
+    CompiledForest, including forests used as stacking base estimators.
+    Other models are returned unchanged.
+    """
+    if isinstance(model, (RandomForestClassifier, RandomForestRegressor)):
+        return CompiledForest(model) if model.n_outputs_ == 1 else model
+    if isinstance(model, PrefitStacking):
+        estimators = [(name, compile_forests(estimator)) for name, estimator in model.estimators]
+        if all(new is old for (_, new), (_, old) in zip(estimators, model.estimators)):
+            return model
+        return PrefitStacking(estimators, model.final_estimator, model.classifier)
+    return model
+
+def same_predictions(model, compiled, X) -> bool:
+    """True if the compiled model reproduces the original's outputs on X exactly"""
+    if not np.array_equal(model.predict(X), compiled.predict(X)):
+        return False
+    if hasattr(model, 'predict_proba') and getattr(compiled, 'classifier', False):
+        return np.array_equal(model.predict_proba(X), compiled.predict_proba(X))
+    return True
+
+def synthetic_rows(compiled, n_rows: int = SYNTHETIC_CHECK_ROWS, seed: int = 0) -> np.ndarray:
+    """
+    Rows spread uniformly over (a little beyond) the split thresholds of the
+    compiled forests in `compiled`, so every feature lands on both sides of
+    its splits
+    """
+    forests = [compiled] if isinstance(compiled, CompiledForest) else \
+        [estimator for _, estimator in compiled.estimators if isinstance(estimator, CompiledForest)]
+    n = forests[0].n_features_in_
+    low, high = np.full(n, np.inf), np.full(n, -np.inf)
+    for forest in forests:
+        split = forest.leaf_index < 0
+        np.minimum.at(low, forest.feature[split], forest.threshold[split])
+        np.maximum.at(high, forest.feature[split], forest.threshold[split])
+    # Features no tree splits on get an arbitrary unit range
+    unused = low > high
+    low[unused], high[unused] = -1.0, 1.0
+    margin = 0.1 * (high - low) + 1.0
+    return np.random.default_rng(seed).uniform(low - margin, high + margin, (n_rows, n))
+
+def compile_checked(model, X: Optional[np.ndarray]):
+    """
+    compile_forests(model) if it reproduces the model's predictions on the
+    check rows X exactly (synthetic rows when X is None or empty);
+    otherwise the original model.
+    """
+    compiled = compile_forests(model)
+    if compiled is model:
+        return compiled
+    if X is None or len(X) == 0:
+        X = synthetic_rows(compiled)
+    if not same_predictions(model, compiled, X):
+        print(f"Error compiling {type(model).__name__}: predictions differ from sklearn, keeping the original")
+        return model
+    return compiled
@@ -0,0 +1,268 @@
+"""
+Gazetteer for Smart City System
+Place names and coordinates with a persisted grid index for nearest-place lookups
+"""
+import csv
+import json
+import os
+from typing import Optional, Tuple, List, Dict, Any
+
+import numpy as np
+
+from name_index import NameIndex
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * np.pi / 180
+
+# Grid cell size in degrees; 1 degree keeps a 50 km query to a few cells
+CELL_DEGREES = 1.0
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between points given in degrees (vectorized)"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def read_gazetteer_file(path: str) -> Tuple[List[str], List[float], List[float], List[int]]:
+    """
+    Read places from a local file. Supports GeoNames dumps (tab-separated
+    .txt, e.g. cities500.txt) and CSV files with a header containing
+    name, latitude/lat, longitude/lon and optionally population.
+    """
+    names, lats, lons, populations = [], [], [], []
+
+    if path.endswith('.txt') or path.endswith('.tsv'):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 15:
+                    continue
+                names.append(fields[1])
+                lats.append(float(fields[4]))
+                lons.append(float(fields[5]))
+                populations.append(int(fields[14] or 0))
+        return names, lats, lons, populations
+
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            names.append(row['name'])
+            lats.append(float(row.get('latitude') or row['lat']))
+            lons.append(float(row.get('longitude') or row['lon']))
+            populations.append(int(float(row.get('population') or 0)))
+    return names, lats, lons, populations
+
+class Gazetteer:
+    """
+    Places stored as flat arrays sorted by grid cell, with a CSR-style
+    `cell_offsets` array so the places in any cell are one contiguous slice.
+    Names live in a single UTF-8 blob. Every array can be saved as .npy and
+    memory-mapped on load instead of being rebuilt.
+    """
+
+    ARRAYS = ('lat', 'lon', 'population', 'name_blob', 'name_offsets', 'cell_offsets')
+
+    def __init__(self, lat, lon, population, name_blob, name_offsets, cell_offsets,
+                 cell_degrees: float = CELL_DEGREES):
+        self.lat = lat
+        self.lon = lon
+        self.population = population
+        self.name_blob = name_blob
+        self.name_offsets = name_offsets
+        self.cell_offsets = cell_offsets
+        self.cell_degrees = cell_degrees
+        self.n_lat = int(np.ceil(180 / cell_degrees))
+        self.n_lon = int(np.ceil(360 / cell_degrees))
+        # Name lookups over the same place ids (see name_index.NameIndex)
+        self.names = None
+
+    @classmethod
+    def build(cls, names: List[str], lats, lons, populations=None,
+              cell_degrees: float = CELL_DEGREES) -> 'Gazetteer':
+        """Sort places by grid cell and build the cell offsets"""
+        lat = np.asarray(lats, dtype=np.float64)
+        lon = np.asarray(lons, dtype=np.float64)
+        population = np.zeros(len(lat), np.int64) if populations is None else \
+            np.asarray(populations, dtype=np.int64)
+
+        n_lat = int(np.ceil(180 / cell_degrees))
+        n_lon = int(np.ceil(360 / cell_degrees))
+        cells = _cell_rows(lat, cell_degrees, n_lat) * n_lon + _cell_cols(lon, cell_degrees, n_lon)
+        order = np.argsort(cells, kind='stable')
+
+        encoded = [names[i].encode('utf-8') for i in order]
+        name_offsets = np.zeros(len(encoded) + 1, np.int64)
+        np.cumsum([len(e) for e in encoded], out=name_offsets[1:])
+        name_blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+        cell_offsets = np.searchsorted(cells[order], np.arange(n_lat * n_lon + 1)).astype(np.int64)
+        return cls(lat[order], lon[order], population[order], name_blob, name_offsets,
+                   cell_offsets, cell_degrees)
+
+    def save(self, directory: str, meta: Dict[str, Any] = None):
+        """Write every array as .npy plus a meta.json describing the build"""
+        os.makedirs(directory, exist_ok=True)
+        for attr in self.ARRAYS:
+            np.save(os.path.join(directory, f"{attr}.npy"), getattr(self, attr))
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({**(meta or {}), 'cell_degrees': self.cell_degrees, 'count': len(self)}, f)
+
+    @classmethod
+    def load(cls, directory: str) -> 'Gazetteer':
+        """Memory-map a gazetteer written by save()"""
+        with open(os.path.join(directory, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(directory, f"{attr}.npy"), mmap_mode='r') for attr in cls.ARRAYS]
+        return cls(*arrays, cell_degrees=meta['cell_degrees'])
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def name(self, i: int) -> str:
+        start, end = self.name_offsets[i], self.name_offsets[i + 1]
+        return bytes(self.name_blob[start:end]).decode('utf-8')
+
+    def _candidates(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Indices of places in every grid cell that may lie within radius_km"""
+        dlat = radius_km / KM_PER_DEGREE
+        row_lo = _cell_rows(np.array([lat - dlat]), self.cell_degrees, self.n_lat)[0]
+        row_hi = _cell_rows(np.array([lat + dlat]), self.cell_degrees, self.n_lat)[0]
+
+        # Longitude span widens towards the poles
+        max_abs_lat = min(89.999, abs(lat) + dlat)
+        dlon = dlat / np.cos(np.radians(max_abs_lat))
+        if dlon >= 180:
+            col_ranges = [(0, self.n_lon - 1)]
+        else:
+            col_lo = int(np.floor((lon - dlon + 180) / self.cell_degrees))
+            col_hi = int(np.floor((lon + dlon + 180) / self.cell_degrees))
+            if col_hi - col_lo + 1 >= self.n_lon:
+                col_ranges = [(0, self.n_lon - 1)]
+            elif col_lo < 0:
+                col_ranges = [(0, col_hi), (col_lo + self.n_lon, self.n_lon - 1)]
+            elif col_hi >= self.n_lon:
+                col_ranges = [(col_lo, self.n_lon - 1), (0, col_hi - self.n_lon)]
+            else:
+                col_ranges = [(col_lo, col_hi)]
+
+        slices = []
+        for row in range(row_lo, row_hi + 1):
+            base = row * self.n_lon
+            for col_lo, col_hi in col_ranges:
+                start = self.cell_offsets[base + col_lo]
+                end = self.cell_offsets[base + col_hi + 1]
+                if end > start:
+                    slices.append(np.arange(start, end))
+        return np.concatenate(slices) if slices else np.empty(0, np.int64)
+
+    def within(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Indices and distances (km) of places within radius_km, nearest first"""
+        idx = self._candidates(lat, lon, radius_km)
+        dist = haversine_km(lat, lon, self.lat[idx], self.lon[idx])
+        keep = dist <= radius_km
+        idx, dist = idx[keep], dist[keep]
+        order = np.argsort(dist, kind='stable')
+        return idx[order], dist[order]
+
+    def nearest(self, lat: float, lon: float, radius_km: float) -> Optional[Tuple[int, float]]:
+        """Index and distance (km) of the nearest place within radius_km, or None"""
+        idx = self._candidates(lat, lon, radius_km)
+        if not len(idx):
+            return None
+        dist = haversine_km(lat, lon, self.lat[idx], self.lon[idx])
+        best = int(np.argmin(dist))
+        if dist[best] > radius_km:
+            return None
+        return int(idx[best]), float(dist[best])
+
+    def in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                limit: Optional[int] = None) -> np.ndarray:
+        """
+        Indices of places inside a bounding box, most populous first. A box
+        with min_lon > max_lon crosses the antimeridian.
+        """
+        row_lo = _cell_rows(np.array([min_lat]), self.cell_degrees, self.n_lat)[0]
+        row_hi = _cell_rows(np.array([max_lat]), self.cell_degrees, self.n_lat)[0]
+        col_lo = _cell_cols(np.array([min_lon]), self.cell_degrees, self.n_lon)[0]
+        col_hi = _cell_cols(np.array([max_lon]), self.cell_degrees, self.n_lon)[0]
+        if min_lon <= max_lon and max_lon - min_lon >= 360 - self.cell_degrees:
+            col_ranges = [(0, self.n_lon - 1)]
+        elif min_lon <= max_lon and col_lo <= col_hi:
+            col_ranges = [(col_lo, col_hi)]
+        elif col_lo > col_hi:
+            col_ranges = [(col_lo, self.n_lon - 1), (0, col_hi)]
+        else:
+            # Wrapped box whose ends share a column: the two ranges would
+            # overlap and list that column's places twice
+            col_ranges = [(0, self.n_lon - 1)]
+
+        slices = []
+        for row in range(row_lo, row_hi + 1):
+            base = row * self.n_lon
+            for lo, hi in col_ranges:
+                start, end = self.cell_offsets[base + lo], self.cell_offsets[base + hi + 1]
+                if end > start:
+                    slices.append(np.arange(start, end))
+        if not slices:
+            return np.empty(0, np.int64)
+
+        idx = np.concatenate(slices)
+        lat, lon = self.lat[idx], self.lon[idx]
+        inside_lon = (lon >= min_lon) & (lon <= max_lon) if min_lon <= max_lon else \
+            (lon >= min_lon) | (lon <= max_lon)
+        idx = idx[(lat >= min_lat) & (lat <= max_lat) & inside_lon]
+        order = np.argsort(-np.asarray(self.population)[idx], kind='stable')
+        return idx[order[:limit]] if limit is not None else idx[order]
+
+def _cell_rows(lat: np.ndarray, cell_degrees: float, n_lat: int) -> np.ndarray:
+    return np.clip(np.floor((lat + 90) / cell_degrees), 0, n_lat - 1).astype(np.int64)
+
+def _cell_cols(lon: np.ndarray, cell_degrees: float, n_lon: int) -> np.ndarray:
+    return (np.floor((lon + 180) / cell_degrees).astype(np.int64)) % n_lon
+
+def load_gazetteer(builtin: Dict[str, Dict[str, float]], path: Optional[str] = None,
+                   cache_dir: Optional[str] = None) -> Gazetteer:
+    """
+    Build a gazetteer from the built-in city table plus an optional gazetteer
+    file. When `cache_dir` is given the built arrays are saved there and
+    memory-mapped on later startups as long as the source file is unchanged.
+    """
+    source = None
+    if path and os.path.exists(path):
+        stat = os.stat(path)
+        source = {'path': os.path.abspath(path), 'mtime': stat.st_mtime, 'size': stat.st_size}
+    meta = {'source': source, 'builtin': sorted(builtin)}
+
+    if cache_dir and os.path.exists(os.path.join(cache_dir, 'meta.json')):
+        try:
+            with open(os.path.join(cache_dir, 'meta.json'), 'r') as f:
+                cached = json.load(f)
+            if cached.get('source') == source and cached.get('builtin') == meta['builtin'] \
+                    and cached.get('cell_degrees') == CELL_DEGREES and NameIndex.exists(cache_dir):
+                gazetteer = Gazetteer.load(cache_dir)
+                gazetteer.names = NameIndex.load(cache_dir)
+                return gazetteer
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error loading gazetteer cache {cache_dir}: {e}")
+
+    names = [city.title() for city in builtin]
+    lats = [coords['lat'] for coords in builtin.values()]
+    lons = [coords['lon'] for coords in builtin.values()]
+    populations = [0] * len(names)
+    if source:
+        extra = read_gazetteer_file(path)
+        names += extra[0]
+        lats += extra[1]
+        lons += extra[2]
+        populations += extra[3]
+
+    gazetteer = Gazetteer.build(names, lats, lons, populations)
+    gazetteer.names = NameIndex.build([gazetteer.name(i) for i in range(len(gazetteer))])
+    if cache_dir and source:
+        try:
+            gazetteer.names.save(cache_dir)
+            gazetteer.save(cache_dir, meta)
+        except OSError as e:
+            print(f"Error saving gazetteer cache {cache_dir}: {e}")
+    return gazetteer
@@ -1,90 +1,214 @@
-import pandas as pd
+"""
+Dataset generation for Smart City System
+Vectorized synthetic datasets, generated in chunks and optionally sharded across processes
+
+    python generate_datasets.py --rows 10000000 --chunk-size 1000000 --workers 8 --format columnar
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+import pandas as pd
+
+from columnar import COLUMNAR_DIR, SCHEMA_FILE, columnar_path
+from scoring import (
+    air_quality_index, score_array, AQI_RANGE, ACCIDENT_RISK_LEVELS, ACTIVITY_LEVELS, PARKING_STATES,
+    predict_accident_risk_batch, predict_citizen_activity_batch, predict_parking_availability_batch
+)
+
+DEFAULT_ROWS = 1000
+DEFAULT_SEED = 42
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+def accident_risk(rng: np.random.Generator, n: int) -> pd.DataFrame:
+    """1. Accident Risk Analysis Dataset"""
+    df = pd.DataFrame({
+        'vehicle_density': rng.integers(50, 500, n, dtype=np.uint16),
+        'avg_speed': rng.integers(20, 100, n, dtype=np.uint8),
+        'road_condition': rng.choice(np.array([0, 1, 2], np.uint8), n, p=[0.2, 0.5, 0.3]),
+        'weather_condition': rng.choice(np.array([0, 1, 2], np.uint8), n, p=[0.5, 0.3, 0.2]),
+        'visibility': rng.integers(50, 1000, n, dtype=np.uint16),
+        'time_of_day': rng.integers(0, 4, n, dtype=np.uint8)
+    })
+    df['accident_risk'] = predict_accident_risk_batch(*(df[column] for column in df.columns))
+    return df
+
+def air_quality(rng: np.random.Generator, n: int) -> pd.DataFrame:
+    """2. Air Quality Prediction Dataset"""
+    df = pd.DataFrame({
+        'pm25': rng.uniform(10, 300, n),
+        'pm10': rng.uniform(20, 400, n),
+        'no2': rng.uniform(10, 150, n),
+        'co': rng.uniform(0.2, 3.0, n),
+        'so2': rng.uniform(5, 80, n),
+        'temperature': rng.uniform(10, 40, n),
+        'humidity': rng.uniform(30, 90, n),
+        'wind_speed': rng.uniform(0, 30, n)
+    })
+    # Noise goes in before clipping, so this is not predict_air_quality_batch
+    aqi = score_array(air_quality_index, *(df[column] for column in df.columns)) + rng.normal(0, 10, n)
+    df['aqi'] = np.clip(aqi, *AQI_RANGE)
+    return df
+
+def citizen_activity(rng: np.random.Generator, n: int) -> pd.DataFrame:
+    """3. Citizen Activity Monitoring Dataset"""
+    df = pd.DataFrame({
+        'population_density': rng.integers(500, 15000, n, dtype=np.uint16),
+        'avg_age': rng.integers(18, 60, n, dtype=np.uint8),
+        'workplace_count': rng.integers(0, 50, n, dtype=np.uint8),
+        'public_events': rng.integers(0, 5, n, dtype=np.uint8),
+        'temperature': rng.uniform(15, 40, n),
+        'day_of_week': rng.integers(0, 7, n, dtype=np.uint8)
+    })
+    df['activity_level'] = predict_citizen_activity_batch(*(df[column] for column in df.columns))
+    return df
+
+def smart_parking(rng: np.random.Generator, n: int) -> pd.DataFrame:
+    """4. Smart Parking Dataset"""
+    df = pd.DataFrame({
+        'parking_capacity': rng.integers(50, 300, n, dtype=np.uint16),
+        'occupied_slots': rng.integers(0, 300, n, dtype=np.uint16),
+        'entry_rate': rng.uniform(5, 50, n),
+        'exit_rate': rng.uniform(0, 40, n),
+        'time_of_day': rng.integers(0, 4, n, dtype=np.uint8),
+        'weekday': rng.integers(0, 7, n, dtype=np.uint8),
+        'nearby_events': rng.choice(np.array([0, 1], np.uint8), n, p=[0.8, 0.2])
+    })
+    df['availability'] = predict_parking_availability_batch(*(df[column] for column in df.columns))
+    return df
+
+# name -> (generator, label categories)
+DATASETS = {
+    'accident_risk': (accident_risk, sorted(ACCIDENT_RISK_LEVELS)),
+    'air_quality': (air_quality, None),
+    'citizen_activity': (citizen_activity, sorted(ACTIVITY_LEVELS)),
+    'smart_parking': (smart_parking, sorted(PARKING_STATES))
+}
+
+def shard_seeds(seed: int, name: str, shards: int):
+    """
+    Independent per-shard seeds spawned from (seed, dataset). A shard's data
+    depends only on these, so output is identical for any worker count.
+    """
+    index = list(DATASETS).index(name)
+    return np.random.SeedSequence([seed, index]).spawn(shards)
+
+def _generate_shard(name: str, seed_seq: np.random.SeedSequence, rows: int, fmt: str):
+    df = DATASETS[name][0](np.random.default_rng(seed_seq), rows)
+    if fmt == 'csv':
+        return df.to_csv(index=False, header=False).encode('utf-8'), list(df.columns)
+    return {column: df[column].to_numpy() for column in df.columns}, list(df.columns)
+
+def _columnar_writer(name: str, out_dir: str, rows: int):
+    """Memory-mapped column files, created from the first shard's dtypes"""
+    directory = columnar_path(name, out_dir)
+    os.makedirs(directory, exist_ok=True)
+    schema_path = os.path.join(directory, SCHEMA_FILE)
+    if os.path.exists(schema_path):
+        os.remove(schema_path)
+    arrays, columns = {}, []
+
+    def write(data, offset):
+        if not arrays:
+            categories = DATASETS[name][1]
+            for column, values in data.items():
+                if values.dtype.kind in 'OUT':
+                    columns.append({'name': column, 'kind': 'category', 'categories': categories, 'dtype': 'uint8'})
+                else:
+                    kind = 'float' if values.dtype.kind == 'f' else 'int'
+                    columns.append({'name': column, 'kind': kind, 'dtype': values.dtype.name})
+                arrays[column] = np.lib.format.open_memmap(
+                    os.path.join(directory, f"{column}.npy"), mode='w+',
+                    dtype=columns[-1]['dtype'], shape=(rows,))
+        for column in columns:
+            values = data[column['name']]
+            if column['kind'] == 'category':
+                values = pd.Categorical(values, categories=column['categories']).codes
+            arrays[column['name']][offset:offset + len(values)] = values
+
+    def close():
+        for array in arrays.values():
+            array.flush()
+        with open(schema_path, 'w') as f:
+            json.dump({'rows': rows, 'columns': columns, 'source': {'generator': 'generate_datasets.py'}}, f, indent=2)
+        return directory
+
+    return write, close
+
+def generate_dataset(name: str, rows: int, seed: int = DEFAULT_SEED, fmt: str = 'csv',
+                     chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int = 1, out_dir: str = '.') -> str:
+    """
+    Generate one dataset in shards of chunk_size rows and write them in
+    order. At most 2 * workers shards are in flight, so memory stays
+    bounded regardless of `rows`.
+    """
+    sizes = [min(chunk_size, rows - start) for start in range(0, rows, chunk_size)]
+    seeds = shard_seeds(seed, name, len(sizes))
+
+    if fmt == 'csv':
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, f"{name}.csv")
+        out = open(path, 'wb')
+        header_written = False
+
+        def write(data, offset):
+            out.write(data)
+    else:
+        write, close = _columnar_writer(name, out_dir, rows)
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        in_flight, offset = deque(), 0
+        shards = iter(zip(seeds, sizes))
+        while True:
+            while len(in_flight) < max(1, 2 * workers):
+                try:
+                    seed_seq, size = next(shards)
+                except StopIteration:
+                    break
+                if pool:
+                    in_flight.append((pool.submit(_generate_shard, name, seed_seq, size, fmt), size))
+                else:
+                    in_flight.append((_generate_shard(name, seed_seq, size, fmt), size))
+            if not in_flight:
+                break
+            result, size = in_flight.popleft()
+            data, columns = result.result() if pool else result
+            if fmt == 'csv' and not header_written:
+                out.write((','.join(columns) + '\n').encode('utf-8'))
+                header_written = True
+            write(data, offset)
+            offset += size
+    finally:
+        if pool:
+            pool.shutdown()
+        if fmt == 'csv':
+            out.close()
+
+    return path if fmt == 'csv' else close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate the synthetic Smart City datasets')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help='rows per dataset')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='base seed (output is reproducible)')
+    parser.add_argument('--format', choices=['csv', 'columnar'], default='csv',
+                        help='CSV files, or typed .npy columns under data/columnar (see columnar.py)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='rows per shard')
+    parser.add_argument('--workers', type=int, default=1, help='processes generating shards')
+    parser.add_argument('--datasets', nargs='+', choices=list(DATASETS), default=list(DATASETS))
+    parser.add_argument('--out-dir', default=None, help=f'output directory (default: . for csv, {COLUMNAR_DIR} for columnar)')
+    args = parser.parse_args()
+
+    out_dir = args.out_dir or ('.' if args.format == 'csv' else COLUMNAR_DIR)
+    for name in args.datasets:
+        started = time.perf_counter()
+        path = generate_dataset(name, args.rows, args.seed, args.format, args.chunk_size, args.workers, out_dir)
+        print(f"{path}: {args.rows} rows in {time.perf_counter() - started:.2f}s")
+    print("All datasets created successfully!")
 
-# Set seed for reproducibility
-np.random.seed(42)
-
-# 1. Accident Risk Analysis Dataset
-df1 = pd.DataFrame({
-    'vehicle_density': np.random.randint(50, 500, 1000),
-    'avg_speed': np.random.randint(20, 100, 1000),
-    'road_condition': np.random.choice([0,1,2], 1000, p=[0.2,0.5,0.3]),
-    'weather_condition': np.random.choice([0,1,2], 1000, p=[0.5,0.3,0.2]),
-    'visibility': np.random.randint(50, 1000, 1000),
-    'time_of_day': np.random.choice([0,1,2,3], 1000)
-})
-
-risk = []
-for i in range(1000):
-    score = (df1.loc[i,'vehicle_density']/500)*0.4 + (1 - df1.loc[i,'avg_speed']/100)*0.3 + \
-            (2 - df1.loc[i,'road_condition'])*0.1 + (df1.loc[i,'weather_condition'])*0.1 + \
-            (1 - df1.loc[i,'visibility']/1000)*0.1
-    if score < 0.4: risk.append('Low')
-    elif score < 0.7: risk.append('Medium')
-    else: risk.append('High')
-df1['accident_risk'] = risk
-df1.to_csv("accident_risk.csv", index=False)
-
-# 2. Air Quality Prediction Dataset
-df2 = pd.DataFrame({
-    'pm25': np.random.uniform(10, 300, 1000),
-    'pm10': np.random.uniform(20, 400, 1000),
-    'no2': np.random.uniform(10, 150, 1000),
-    'co': np.random.uniform(0.2, 3.0, 1000),
-    'so2': np.random.uniform(5, 80, 1000),
-    'temperature': np.random.uniform(10, 40, 1000),
-    'humidity': np.random.uniform(30, 90, 1000),
-    'wind_speed': np.random.uniform(0, 30, 1000)
-})
-df2['aqi'] = (0.4*df2['pm25'] + 0.3*df2['pm10'] + 0.1*df2['no2'] + 
-              15*df2['co'] + 0.05*df2['so2'] - 0.2*df2['wind_speed'] - 
-              0.1*df2['humidity'] + np.random.normal(0,10,1000))
-df2['aqi'] = df2['aqi'].clip(0, 500)
-df2.to_csv("air_quality.csv", index=False)
-
-# 3. Citizen Activity Monitoring Dataset
-df3 = pd.DataFrame({
-    'population_density': np.random.randint(500, 15000, 1000),
-    'avg_age': np.random.randint(18, 60, 1000),
-    'workplace_count': np.random.randint(0, 50, 1000),
-    'public_events': np.random.randint(0, 5, 1000),
-    'temperature': np.random.uniform(15, 40, 1000),
-    'day_of_week': np.random.randint(0, 7, 1000)
-})
-
-activity = []
-for i in range(1000):
-    score = (df3.loc[i,'population_density']/15000)*0.4 + (df3.loc[i,'workplace_count']/50)*0.3 + \
-            (df3.loc[i,'public_events']/5)*0.2 + (df3.loc[i,'temperature']/40)*0.1
-    if score < 0.4: activity.append('Low')
-    elif score < 0.7: activity.append('Moderate')
-    else: activity.append('High')
-df3['activity_level'] = activity
-df3.to_csv("citizen_activity.csv", index=False)
-
-# 4. Smart Parking Dataset
-df4 = pd.DataFrame({
-    'parking_capacity': np.random.randint(50, 300, 1000),
-    'occupied_slots': np.random.randint(0, 300, 1000),
-    'entry_rate': np.random.uniform(5, 50, 1000),
-    'exit_rate': np.random.uniform(0, 40, 1000),
-    'time_of_day': np.random.choice([0,1,2,3], 1000),
-    'weekday': np.random.randint(0, 7, 1000),
-    'nearby_events': np.random.choice([0,1], 1000, p=[0.8,0.2])
-})
-
-availability = []
-for i in range(1000):
-    utilization = df4.loc[i,'occupied_slots']/df4.loc[i,'parking_capacity']
-    inflow = df4.loc[i,'entry_rate'] - df4.loc[i,'exit_rate']
-    score = utilization + inflow/50 + df4.loc[i,'nearby_events']*0.5
-    if score > 1.2: availability.append('Full')
-    else: availability.append('Available')
-df4['availability'] = availability
-df4.to_csv("smart_parking.csv", index=False)
-
-print("All datasets created successfully!")
-print(f"accident_risk.csv: {len(df1)} rows")
-print(f"air_quality.csv: {len(df2)} rows") 
-print(f"citizen_activity.csv: {len(df3)} rows")
-print(f"smart_parking.csv: {len(df4)} rows")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Heatmap generation for Smart City System
+Vectorized point generation per layer and a packed float32 transport format
+"""
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+
+# Points per layer at density 1 (layer order is also the binary layout order)
+LAYER_COUNTS = {
+    'accident_risk': 100,
+    'air_quality': 150,
+    'parking': 50,
+    'crowd_density': 200
+}
+
+RADIUS_KM = 5
+DEFAULT_INTENSITY = (0.1, 1.0)
+MAX_DENSITY = 500
+
+def layer_intensities(metrics: Optional[Dict[str, Any]]) -> Dict[str, Tuple[float, float]]:
+    """Intensity range per layer, adjusted to a city's metrics when available"""
+    if not metrics:
+        return {layer: DEFAULT_INTENSITY for layer in LAYER_COUNTS}
+
+    aqi = metrics.get('air_quality', 50)
+    risk = metrics.get('accident_risk', 'Medium')
+    parking = metrics.get('parking_status', 'Available')
+    activity = metrics.get('activity_level', 'Moderate')
+
+    return {
+        'accident_risk': {'Low': (0.2, 0.5), 'Medium': (0.4, 0.7), 'High': (0.6, 1.0)}.get(risk, (0.4, 0.7)),
+        'air_quality': (0.3, min(1.0, 0.3 + (aqi / 500) * 0.7)),
+        'parking': {'Available': (0.3, 0.6), 'Full': (0.7, 1.0)}.get(parking, (0.4, 0.7)),
+        'crowd_density': {'Low': (0.2, 0.5), 'Moderate': (0.4, 0.7), 'High': (0.6, 1.0)}.get(activity, (0.4, 0.7))
+    }
+
+def generate_points(rng: np.random.Generator, center_lat: float, center_lng: float, count: int,
+                    radius_km: float, intensity_range=DEFAULT_INTENSITY) -> np.ndarray:
+    """Generate `count` heatmap points as an (count, 3) array of lat, lng, intensity"""
+    r = radius_km * np.sqrt(rng.random(count))
+    dx = r * 0.01 * rng.choice([-1.0, 1.0], count) * rng.random(count)
+    dy = r * 0.01 * rng.choice([-1.0, 1.0], count) * rng.random(count)
+
+    points = np.empty((count, 3))
+    points[:, 0] = center_lat + dy
+    points[:, 1] = center_lng + dx
+    points[:, 2] = rng.uniform(intensity_range[0], intensity_range[1], count)
+    return points
+
+def generate_heatmap(lat: float, lon: float, metrics: Optional[Dict[str, Any]] = None,
+                     density: int = 1, rng: Optional[np.random.Generator] = None) -> Dict[str, np.ndarray]:
+    """Generate every layer around a location"""
+    rng = rng or np.random.default_rng()
+    intensities = layer_intensities(metrics)
+    return {
+        layer: generate_points(rng, lat, lon, count * density, RADIUS_KM, intensities[layer])
+        for layer, count in LAYER_COUNTS.items()
+    }
+
+def to_json_layers(layers: Dict[str, np.ndarray]) -> Dict[str, list]:
+    """Nested [lat, lng, intensity] lists, rounded to ~1 m"""
+    return {layer: np.round(points, 5).tolist() for layer, points in layers.items()}
+
+def to_f32_layers(layers: Dict[str, np.ndarray]) -> Tuple[bytes, str]:
+    """
+    Pack every layer as little-endian float32 lat, lng, intensity triplets,
+    concatenated in layer order. Returns the body and a layer descriptor
+    ("name:count,name:count,...") that tells the client how to split it.
+    """
+    body = b''.join(points.astype('<f4').tobytes() for points in layers.values())
+    descriptor = ','.join(f"{layer}:{len(points)}" for layer, points in layers.items())
+    return body, descriptor
@@ -0,0 +1,147 @@
+"""
+Heatmap tiles for Smart City System
+Aggregates heatmap layers into cached slippy-map (z/x/y) tiles
+"""
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+from heatmap import generate_heatmap, LAYER_COUNTS
+
+TILE_PIXELS = 256
+GRID_CELLS = 32       # aggregation cells per tile side (8 px each)
+TILE_DENSITY = 100    # density of the source points behind the tiles
+MAX_ZOOM = 18
+
+def latlon_to_pixels(lat, lon, zoom: int):
+    """Web Mercator global pixel coordinates at `zoom` (vectorized)"""
+    world = TILE_PIXELS * (2 ** zoom)
+    siny = np.clip(np.sin(np.radians(lat)), -0.9999, 0.9999)
+    px = (np.asarray(lon) + 180) / 360 * world
+    py = (0.5 - np.log((1 + siny) / (1 - siny)) / (4 * np.pi)) * world
+    return px, py
+
+def pixels_to_latlon(px, py, zoom: int):
+    """Inverse of latlon_to_pixels"""
+    world = TILE_PIXELS * (2 ** zoom)
+    lon = np.asarray(px) / world * 360 - 180
+    lat = np.degrees(np.arctan(np.sinh(np.pi - 2 * np.pi * np.asarray(py) / world)))
+    return lat, lon
+
+class HeatmapTileCache:
+    """
+    Per-location source points (regenerated only when the location's metrics
+    version changes) and an LRU of aggregated tiles keyed by
+    (location, layer, z, x, y). Invalidating a location drops its points and
+    every tile built from them.
+    """
+
+    def __init__(self, max_tiles: int = 20000, max_sources: int = 64):
+        self.max_tiles = max_tiles
+        self.max_sources = max_sources
+        self._sources: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._tiles: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._tiles_by_source: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _source(self, key: str, lat: float, lon: float,
+                metrics: Optional[Dict[str, Any]], version: str) -> Dict[str, Any]:
+        source = self._sources.get(key)
+        if source is not None and source['version'] == version:
+            self._sources.move_to_end(key)
+            return source
+        if source is not None:
+            self._drop(key)
+
+        # Seeded by location and version so every worker builds identical tiles
+        rng = np.random.default_rng(zlib.crc32(f"{key}|{version}".encode('utf-8')))
+        layers = {}
+        for layer, points in generate_heatmap(lat, lon, metrics, TILE_DENSITY, rng).items():
+            px, py = latlon_to_pixels(points[:, 0], points[:, 1], MAX_ZOOM)
+            layers[layer] = (px, py, points[:, 2])
+
+        source = {'version': version, 'layers': layers}
+        self._sources[key] = source
+        while len(self._sources) > self.max_sources:
+            self._drop(next(iter(self._sources)))
+        return source
+
+    def get_tile(self, key: str, lat: float, lon: float, metrics: Optional[Dict[str, Any]],
+                 version: str, layer: str, z: int, x: int, y: int) -> np.ndarray:
+        """
+        Aggregated cells of one tile as an (n, 4) array of cell-centre lat,
+        lng, mean intensity and point count (empty cells omitted).
+        """
+        if layer not in LAYER_COUNTS:
+            raise ValueError(f"Unknown layer: {layer}")
+        if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+            raise ValueError(f"Invalid tile: {z}/{x}/{y}")
+
+        tile_key = (key, layer, z, x, y)
+        with self._lock:
+            source = self._source(key, lat, lon, metrics, version)
+            cells = self._tiles.get(tile_key)
+            if cells is not None:
+                self._tiles.move_to_end(tile_key)
+                self.stats['hits'] += 1
+                return cells
+            self.stats['misses'] += 1
+            px, py, intensity = source['layers'][layer]
+
+        cells = _aggregate_tile(px, py, intensity, z, x, y)
+
+        with self._lock:
+            # Skip storing if the source was replaced while we aggregated
+            if self._sources.get(key) is source:
+                self._tiles[tile_key] = cells
+                self._tiles_by_source.setdefault(key, set()).add(tile_key)
+                while len(self._tiles) > self.max_tiles:
+                    old_key, _ = self._tiles.popitem(last=False)
+                    self._tiles_by_source.get(old_key[0], set()).discard(old_key)
+        return cells
+
+    def _drop(self, key: str):
+        self._sources.pop(key, None)
+        for tile_key in self._tiles_by_source.pop(key, set()):
+            self._tiles.pop(tile_key, None)
+
+    def invalidate(self, key: str):
+        """Forget a location's points and tiles (call when its metrics change)"""
+        with self._lock:
+            self._drop(key)
+            self.stats['invalidations'] += 1
+
+def _aggregate_tile(px, py, intensity, z: int, x: int, y: int) -> np.ndarray:
+    """Bin source points (pixels at MAX_ZOOM) into the GRID_CELLS^2 cells of one tile"""
+    scale = 2 ** (MAX_ZOOM - z)
+    tx = px / scale - x * TILE_PIXELS
+    ty = py / scale - y * TILE_PIXELS
+    inside = (tx >= 0) & (tx < TILE_PIXELS) & (ty >= 0) & (ty < TILE_PIXELS)
+    if not inside.any():
+        return np.empty((0, 4))
+
+    cell_pixels = TILE_PIXELS / GRID_CELLS
+    cx = (tx[inside] // cell_pixels).astype(np.int64)
+    cy = (ty[inside] // cell_pixels).astype(np.int64)
+    idx = cy * GRID_CELLS + cx
+    counts = np.bincount(idx, minlength=GRID_CELLS * GRID_CELLS)
+    sums = np.bincount(idx, weights=intensity[inside], minlength=GRID_CELLS * GRID_CELLS)
+
+    occupied = np.flatnonzero(counts)
+    centre_x = x * TILE_PIXELS + (occupied % GRID_CELLS + 0.5) * cell_pixels
+    centre_y = y * TILE_PIXELS + (occupied // GRID_CELLS + 0.5) * cell_pixels
+    lat, lon = pixels_to_latlon(centre_x, centre_y, z)
+
+    cells = np.empty((len(occupied), 4))
+    cells[:, 0] = lat
+    cells[:, 1] = lon
+    cells[:, 2] = sums[occupied] / counts[occupied]
+    cells[:, 3] = counts[occupied]
+    return cells
+
+# Global heatmap tile cache instance
+heatmap_tiles = HeatmapTileCache()
@@ -0,0 +1,164 @@
+"""
+HTTP client for external data providers
+Pooled keep-alive sessions, bounded retries with jittered backoff and a circuit breaker
+"""
+import random
+import threading
+import time
+from typing import Dict, Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Status codes worth retrying (rate limiting and transient server errors)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open"""
+
+class RetryableStatusError(requests.HTTPError):
+    """Provider answered with a status in RETRY_STATUSES"""
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures, rejects calls for
+    `reset_timeout` seconds, then lets a single trial call through
+    (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> bool:
+        """Return True if a call may be attempted now"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+class ProviderClient:
+    """
+    Shared session and failure policy for one external provider. Every call
+    runs under a deadline (`call_budget` seconds unless the caller passes
+    one): attempt timeouts are cut to the time left and no retry starts
+    that could not finish before it, so a call never outlives its caller.
+    """
+
+    def __init__(self, name: str, timeout: float = 5.0, max_retries: int = 2,
+                 backoff_base: float = 0.2, backoff_max: float = 2.0,
+                 pool_size: int = 16, breaker: Optional[CircuitBreaker] = None,
+                 call_budget: float = 3.0):
+        self.name = name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.call_budget = call_budget
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0, 'short_circuited': 0, 'deadline_exceeded': 0}
+        self._stats_lock = threading.Lock()
+
+        # Keep-alive connection pool shared by every request to this provider
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff delay for a retry attempt"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def get_json(self, url: str, params: Dict[str, Any] = None, deadline: Optional[float] = None) -> Any:
+        """
+        GET `url` and return the decoded JSON body.
+        Connection errors, timeouts and RETRY_STATUSES are retried up to
+        `max_retries` times while `deadline` (a time.monotonic() value,
+        default now + call_budget) allows; other HTTP errors fail immediately.
+        Raises CircuitOpenError without touching the network while the
+        circuit is open.
+        """
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        if deadline is None:
+            deadline = time.monotonic() + self.call_budget
+
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                delay = self._backoff(attempt - 1)
+                if time.monotonic() + delay >= deadline:
+                    self._count('deadline_exceeded')
+                    break
+                self._count('retries')
+                time.sleep(delay)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._count('deadline_exceeded')
+                break
+            self._count('requests')
+            try:
+                response = self.session.get(url, params=params, timeout=min(self.timeout, remaining))
+                if response.status_code in RETRY_STATUSES:
+                    raise RetryableStatusError(f"{self.name} returned {response.status_code}",
+                                               response=response)
+                response.raise_for_status()
+                data = response.json()
+            except (requests.ConnectionError, requests.Timeout, RetryableStatusError) as e:
+                last_error = e
+                continue
+            except (requests.RequestException, ValueError) as e:
+                last_error = e
+                break
+
+            self.breaker.record_success()
+            return data
+
+        self._count('failures')
+        self.breaker.record_failure()
+        raise last_error or requests.Timeout(f"{self.name} call deadline exceeded")
+
+    def status(self) -> Dict[str, Any]:
+        """Breaker state and request counters"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {
+            'state': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            **stats
+        }
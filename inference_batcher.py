@@ -0,0 +1,202 @@
+"""
+Inference Batcher for Smart City System
+Coalesces single-row model predictions into one predict call per dataset
+"""
+import bisect
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Any, List, Callable, Optional, Sequence
+
+import numpy as np
+
+from model_registry import model_registry
+
+# Rows per predict call, and how long the first queued row waits for company
+MAX_BATCH_SIZE = 64
+MAX_WAIT_MS = 2.0
+# A request gives up waiting for its batch after this many seconds
+RESULT_TIMEOUT = 10.0
+# Largest batch size and batching window that may be configured; the window is far below RESULT_TIMEOUT
+MAX_BATCH_LIMIT = 4096
+MAX_WAIT_LIMIT_MS = 1000.0
+
+# Upper bounds of the histogram buckets (the last bucket is open-ended)
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+class Histogram:
+    """Fixed-bucket counts with percentiles reported as bucket upper bounds"""
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float, count: int = 1):
+        self.counts[bisect.bisect_left(self.bounds, value)] += count
+        self.total += count
+        self.sum += value * count
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.total:
+            return None
+        rank, seen = q / 100 * self.total, 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[i] if i < len(self.bounds) else float('inf')
+        return float('inf')
+
+    def as_dict(self) -> Dict[str, Any]:
+        labels = [f"<={bound:g}" for bound in self.bounds] + [f">{self.bounds[-1]:g}"]
+        return {
+            'buckets': dict(zip(labels, self.counts)),
+            'count': self.total,
+            'mean': round(self.sum / self.total, 3) if self.total else None,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99)
+        }
+
+class ModelBatcher:
+    """
+    Queue of single-row requests for one dataset, drained by a worker thread.
+    The worker waits at most `max_wait_ms` after the first queued row for the
+    batch to fill up to `max_batch`, then runs one predict call and resolves
+    every waiting request's future with its row of the result.
+    """
+
+    def __init__(self, name: str, predict: Callable[[str, np.ndarray], Optional[np.ndarray]],
+                 max_batch: int = MAX_BATCH_SIZE, max_wait_ms: float = MAX_WAIT_MS):
+        self.name = name
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: List[tuple] = []  # (features, future, enqueued_at)
+        self._cond = threading.Condition()
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.stats = {'rows': 0, 'batches': 0, 'errors': 0, 'fallbacks': 0, 'predict_seconds': 0.0, 'started': None}
+        self._thread = threading.Thread(target=self._loop, name=f'batcher-{name}', daemon=True)
+        self._thread.start()
+
+    def submit(self, features: Sequence[float]) -> Future:
+        future = Future()
+        with self._cond:
+            self._queue.append((features, future, time.perf_counter()))
+            if self.stats['started'] is None:
+                self.stats['started'] = time.perf_counter()
+            if len(self._queue) == 1 or len(self._queue) >= self.max_batch:
+                self._cond.notify()
+        return future
+
+    def _take(self) -> List[tuple]:
+        with self._cond:
+            self._cond.wait_for(lambda: self._queue)
+            deadline = self._queue[0][2] + self.max_wait
+            while len(self._queue) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._queue[:self.max_batch]
+            del self._queue[:self.max_batch]
+            return batch
+
+    def _loop(self):
+        while True:
+            batch = self._take()
+            started = time.perf_counter()
+            try:
+                X = np.array([features for features, _, _ in batch], dtype=np.float64)
+                predictions = self.predict(self.name, X)
+                results = [None] * len(batch) if predictions is None else predictions.tolist()
+            except Exception as e:
+                print(f"Error running batched prediction for {self.name}: {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                with self._cond:
+                    self.stats['errors'] += 1
+                continue
+
+            done = time.perf_counter()
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+            with self._cond:
+                self.stats['rows'] += len(batch)
+                self.stats['batches'] += 1
+                self.stats['predict_seconds'] += done - started
+                self.batch_sizes.observe(len(batch))
+                for _, _, enqueued_at in batch:
+                    self.latency_ms.observe((done - enqueued_at) * 1000)
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self.stats)
+            stats['queued'] = len(self._queue)
+            stats['latency_ms'] = self.latency_ms.as_dict()
+            stats['batch_size'] = self.batch_sizes.as_dict()
+        started = stats.pop('started')
+        elapsed = time.perf_counter() - started if started is not None else 0.0
+        stats['rows_per_second'] = round(stats['rows'] / elapsed, 1) if elapsed else None
+        stats['rows_per_predict_second'] = round(stats['rows'] / stats['predict_seconds'], 1) \
+            if stats['predict_seconds'] else None
+        stats['max_batch'] = self.max_batch
+        stats['max_wait_ms'] = self.max_wait * 1000
+        return stats
+
+class InferenceBatcher:
+    """One ModelBatcher per dataset, created on first use"""
+
+    def __init__(self, predict: Callable[[str, np.ndarray], Optional[np.ndarray]],
+                 max_batch: int = MAX_BATCH_SIZE, max_wait_ms: float = MAX_WAIT_MS):
+        self.predict_fn = predict
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self._batchers: Dict[str, ModelBatcher] = {}
+        self._lock = threading.Lock()
+
+    def _batcher(self, name: str) -> ModelBatcher:
+        batcher = self._batchers.get(name)
+        if batcher is None:
+            with self._lock:
+                batcher = self._batchers.get(name)
+                if batcher is None:
+                    batcher = self._batchers[name] = ModelBatcher(
+                        name, self.predict_fn, self.max_batch, self.max_wait_ms)
+        return batcher
+
+    def predict(self, name: str, features: Sequence[float], timeout: float = RESULT_TIMEOUT):
+        """Prediction for one row of `name`'s features, batched with concurrent callers"""
+        return self._batcher(name).submit(features).result(timeout)
+
+    def count_fallback(self, name: str):
+        """Record that a caller answered without the model (its batch timed out or failed)"""
+        batcher = self._batcher(name)
+        with batcher._cond:
+            batcher.stats['fallbacks'] += 1
+
+    def configure(self, max_batch: int = None, max_wait_ms: float = None):
+        """Change the batching window; applies to every dataset immediately"""
+        with self._lock:
+            if max_batch is not None:
+                self.max_batch = max_batch
+            if max_wait_ms is not None:
+                self.max_wait_ms = max_wait_ms
+            for batcher in self._batchers.values():
+                with batcher._cond:
+                    batcher.max_batch = self.max_batch
+                    batcher.max_wait = self.max_wait_ms / 1000
+                    batcher._cond.notify()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait_ms,
+            'models': {name: batcher.status() for name, batcher in list(self._batchers.items())}
+        }
+
+# Global inference batcher instance, in front of the model registry
+inference_batcher = InferenceBatcher(model_registry.predict)
@@ -2,12 +2,14 @@
 Location Services for Smart City System
 Handles geocoding, reverse geocoding, and city data management
 """
-import json
-import os
+import sqlite3
 from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import random
 
+from city_store import CityStore
+from gazetteer import load_gazetteer
+
 @dataclass
 class CityData:
     """Data class for city information"""
@@ -57,41 +59,57 @@ class LocationService:
                 longitude=coords['lon']
             )
         
-        # Try partial matches
-        for city, coords in self.CITY_COORDINATES.items():
-            if city_name_lower in city or city in city_name_lower:
-                return CityData(
-                    name=city.title(),
-                    latitude=coords['lat'],
-                    longitude=coords['lon']
-                )
+        # Fall back to the gazetteer name index (exact, prefix, then typo-tolerant)
+        matches = self.gazetteer.names.search(city_name, self.gazetteer.population, limit=1)
+        if matches:
+            return self._city_data(matches[0]['id'])
         
         # If not found, return None (in production, use a real geocoding API)
         return None
     
-    def reverse_geocode(self, latitude: float, longitude: float) -> Optional[CityData]:
+    def suggest(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Ranked place-name suggestions for a search box"""
+        suggestions = []
+        for match in self.gazetteer.names.search(query, self.gazetteer.population, limit=limit):
+            city = self._city_data(match['id'])
+            suggestions.append({
+                **city.to_dict(),
+                'population': int(self.gazetteer.population[match['id']]),
+                'match': match['match'],
+                'score': match['score']
+            })
+        return suggestions
+    
+    def cities_in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                       limit: Optional[int] = None) -> List[CityData]:
+        """Known places inside a bounding box, most populous first"""
+        ids = self.gazetteer.in_bbox(min_lat, min_lon, max_lat, max_lon, limit)
+        return [self._city_data(int(i)) for i in ids]
+    
+    def _city_data(self, place_id: int) -> CityData:
+        return CityData(
+            name=self.gazetteer.name(place_id),
+            latitude=float(self.gazetteer.lat[place_id]),
+            longitude=float(self.gazetteer.lon[place_id])
+        )
+    
+    def __init__(self, gazetteer_path: Optional[str] = None, cache_dir: Optional[str] = None,
+                 reverse_radius_km: float = 50.0):
+        # Built once at startup; memory-mapped from cache_dir when it is up to date
+        self.gazetteer = load_gazetteer(self.CITY_COORDINATES, gazetteer_path, cache_dir)
+        self.reverse_radius_km = reverse_radius_km
+    
+    def reverse_geocode(self, latitude: float, longitude: float,
+                        radius_km: Optional[float] = None) -> Optional[CityData]:
         """
         Convert coordinates to city name
-        In a real app, this would use a reverse geocoding API
+        Returns the nearest known place (haversine distance) within radius_km
         """
-        # Find the closest city (simple distance calculation)
-        min_distance = float('inf')
-        closest_city = None
-        
-        for city, coords in self.CITY_COORDINATES.items():
-            # Simple distance calculation (not accurate for large distances)
-            distance = ((coords['lat'] - latitude) ** 2 + (coords['lon'] - longitude) ** 2) ** 0.5
-            if distance < min_distance:
-                min_distance = distance
-                closest_city = city
+        radius_km = self.reverse_radius_km if radius_km is None else radius_km
+        match = self.gazetteer.nearest(latitude, longitude, radius_km)
         
-        if closest_city and min_distance < 0.5:  # Within ~50km
-            coords = self.CITY_COORDINATES[closest_city]
-            return CityData(
-                name=closest_city.title(),
-                latitude=coords['lat'],
-                longitude=coords['lon']
-            )
+        if match:
+            return self._city_data(match[0])
         
         # If no close city found, create a generic city data
         return CityData(
@@ -100,25 +118,50 @@ class LocationService:
             longitude=longitude
         )
 
+# Optional local gazetteer (GeoNames .txt or CSV with name,latitude,longitude)
+GAZETTEER_FILE = 'data/gazetteer.csv'
+GAZETTEER_CACHE_DIR = 'data/gazetteer_index'
+
 # Global location service instance
-location_service = LocationService()
+location_service = LocationService(GAZETTEER_FILE, GAZETTEER_CACHE_DIR)
 
 # City data storage
+# The JSON file is the legacy format; it is imported into the database on first use
 CITY_DATA_FILE = 'data/city_data.json'
+CITY_DB_FILE = 'data/city_data.db'
+
+city_store = CityStore(CITY_DB_FILE, legacy_json=CITY_DATA_FILE)
 
 def load_city_data() -> Dict[str, Any]:
-    """Load city data from JSON file"""
-    if os.path.exists(CITY_DATA_FILE):
-        try:
-            with open(CITY_DATA_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+    """Load all city data from the store"""
+    try:
+        return city_store.load_all()
+    except sqlite3.Error as e:
+        print(f"Error loading city data: {e}")
+        return {}
+
+def load_city(city_name: str) -> Optional[Dict[str, Any]]:
+    """Load a single city's data from the store"""
+    try:
+        return city_store.get(city_name)
+    except sqlite3.Error as e:
+        print(f"Error loading city {city_name}: {e}")
+        return None
 
-def save_city_data(data: Dict[str, Any]):
-    """Save city data to JSON file"""
-    os.makedirs(os.path.dirname(CITY_DATA_FILE), exist_ok=True)
-    with open(CITY_DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+def save_city_data(data: Dict[str, Any]) -> bool:
+    """Save city data to the store (upserts every city in `data`); False if the write failed"""
+    try:
+        city_store.upsert_many(data)
+        return True
+    except sqlite3.Error as e:
+        print(f"Error saving city data: {e}")
+        return False
 
+def save_city(city_name: str, metrics: Dict[str, Any]) -> bool:
+    """Save a single city's data to the store; False if the write failed"""
+    try:
+        city_store.upsert(city_name, metrics)
+        return True
+    except sqlite3.Error as e:
+        print(f"Error saving city {city_name}: {e}")
+        return False
@@ -0,0 +1,193 @@
+"""
+Model Registry for Smart City System
+Persists the trained preprocessing + best estimator per dataset and serves them lazily
+"""
+import os
+import threading
+from typing import Dict, Any, Optional, List
+
+import joblib
+import numpy as np
+
+from compiled_forest import compile_checked
+
+# Directory holding one bundle per dataset (written by smart_city_system.py)
+MODELS_DIR = 'models'
+
+# Web app module name -> training dataset name
+MODULE_DATASETS = {
+    'accident': 'accident_risk',
+    'air_quality': 'air_quality',
+    'activity': 'citizen_activity',
+    'parking': 'smart_parking'
+}
+
+def model_path(name: str, models_dir: str = MODELS_DIR) -> str:
+    """Location of the bundle for a dataset"""
+    return os.path.join(models_dir, f"{name}.joblib")
+
+# Probe rows used to check the fused preprocessing against scaler + PCA
+AFFINE_CHECK_ROWS = 1000
+AFFINE_TOLERANCE = 1e-9
+
+def fuse_preprocessing(scaler, pca) -> Dict[str, np.ndarray]:
+    """
+    Collapse a fitted StandardScaler and optional PCA into one affine map,
+    X @ weight + offset. With z = (x - mu) / s and p = (z - m) @ C.T, the
+    weight is C.T with row j divided by s[j] and the offset is
+    -(mu / s + m) @ C.T (columns further divided when PCA whitens).
+    """
+    n = scaler.n_features_in_
+    mu = scaler.mean_ if scaler.with_mean else np.zeros(n)
+    s = scaler.scale_ if scaler.with_std else np.ones(n)
+    if pca is None:
+        return {'weight': np.diag(1 / s), 'offset': -mu / s}
+
+    components = pca.components_.T
+    if pca.whiten:
+        components = components / np.sqrt(pca.explained_variance_)
+    mean = pca.mean_ if pca.mean_ is not None else np.zeros(n)
+    return {
+        'weight': np.ascontiguousarray(components / s[:, None]),
+        'offset': -(mu / s + mean) @ components
+    }
+
+def check_fused_preprocessing(affine: Dict[str, np.ndarray], scaler, pca) -> float:
+    """
+    Largest difference between the fused map and scaler + PCA on probe rows
+    spread around the training distribution; raises ValueError when it
+    exceeds AFFINE_TOLERANCE (relative to the output magnitude).
+    """
+    rng = np.random.default_rng(0)
+    n = scaler.n_features_in_
+    mu = scaler.mean_ if scaler.with_mean else np.zeros(n)
+    s = scaler.scale_ if scaler.with_std else np.ones(n)
+    X = mu + s * rng.normal(0, 3, (AFFINE_CHECK_ROWS, n))
+
+    expected = scaler.transform(X)
+    if pca is not None:
+        expected = pca.transform(expected)
+    fused = X @ affine['weight'] + affine['offset']
+    error = float(np.max(np.abs(fused - expected)))
+    bound = AFFINE_TOLERANCE * max(1.0, float(np.max(np.abs(expected))))
+    if not error <= bound:
+        raise ValueError(f"fused preprocessing differs from scaler + PCA by {error:g} (limit {bound:g})")
+    return error
+
+def save_model_bundle(name: str, scaler, pca, model, encoder, features: List[str],
+                      model_name: str, metrics: Dict[str, float],
+                      models_dir: str = MODELS_DIR, check_rows: Optional[np.ndarray] = None) -> str:
+    """
+    Serialize everything needed to serve one dataset's predictions.
+    Bundles are written uncompressed so numpy arrays inside them can be
+    memory-mapped on load. Random forests (alone or inside a stack) are
+    stored compiled when they reproduce sklearn exactly on `check_rows`, and
+    the scaler + PCA are also stored fused into one verified affine map.
+    """
+    os.makedirs(models_dir, exist_ok=True)
+    model = compile_checked(model, check_rows)
+    affine = fuse_preprocessing(scaler, pca)
+    check_fused_preprocessing(affine, scaler, pca)
+    bundle = {
+        'name': name,
+        'scaler': scaler,
+        'pca': pca,
+        'affine': affine,
+        'model': model,
+        'encoder': encoder,
+        'features': list(features),
+        'model_name': model_name,
+        'metrics': dict(metrics)
+    }
+    path = model_path(name, models_dir)
+    tmp_path = path + '.tmp'
+    joblib.dump(bundle, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+class ModelRegistry:
+    """Lazily loads persisted model bundles, one dataset at a time"""
+
+    def __init__(self, models_dir: str = MODELS_DIR):
+        self.models_dir = models_dir
+        self._bundles: Dict[str, Dict[str, Any]] = {}
+        self._missing = set()
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the bundle for a dataset, loading it on first use.
+        Returns None (and remembers that) when no bundle was exported, so
+        callers can fall back to the formulas without touching the disk again.
+        """
+        bundle = self._bundles.get(name)
+        if bundle is not None or name in self._missing:
+            return bundle
+
+        with self._lock:
+            if name in self._bundles or name in self._missing:
+                return self._bundles.get(name)
+
+            path = model_path(name, self.models_dir)
+            if not os.path.exists(path):
+                self._missing.add(name)
+                return None
+
+            try:
+                bundle = joblib.load(path, mmap_mode='r')
+            except Exception as e:
+                print(f"Error loading model bundle {path}: {e}")
+                self._missing.add(name)
+                return None
+
+            self._bundles[name] = bundle
+            return bundle
+
+    def is_available(self, name: str) -> bool:
+        """Check whether a trained model can serve this dataset"""
+        return self.get(name) is not None
+
+    def transform(self, name: str, X) -> Optional[np.ndarray]:
+        """
+        Apply the fitted scaler (and PCA) for a dataset to raw feature rows,
+        as one matmul when the bundle carries the fused affine map
+        """
+        bundle = self.get(name)
+        if bundle is None:
+            return None
+
+        X = np.asarray(X, dtype=np.float64).reshape(-1, len(bundle['features']))
+        affine = bundle.get('affine')
+        if affine is not None:
+            return X @ affine['weight'] + affine['offset']
+        X = bundle['scaler'].transform(X)
+        if bundle['pca'] is not None:
+            X = bundle['pca'].transform(X)
+        return X
+
+    def predict(self, name: str, X) -> Optional[np.ndarray]:
+        """
+        Predict for a 2-D array of raw feature rows (columns in training order).
+        Returns decoded labels for classifiers, or None if no model is available.
+        """
+        X = self.transform(name, X)
+        if X is None:
+            return None
+        if len(X) == 0:
+            # sklearn estimators refuse zero-sample input
+            return np.empty(0)
+
+        bundle = self._bundles[name]
+        y = bundle['model'].predict(X)
+        if bundle['encoder'] is not None:
+            y = bundle['encoder'].inverse_transform(np.asarray(y, dtype=int))
+        return y
+
+    def clear(self):
+        """Forget loaded bundles so the next request reloads from disk"""
+        with self._lock:
+            self._bundles.clear()
+            self._missing.clear()
+
+# Global model registry instance
+model_registry = ModelRegistry()
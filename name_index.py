@@ -0,0 +1,200 @@
+"""
+Name Index for Smart City System
+Normalized prefix and trigram indexes over gazetteer place names
+"""
+import os
+import re
+import unicodedata
+from typing import List, Tuple, Dict, Any
+
+import numpy as np
+
+# Cap on posting-list entries scanned per fuzzy query (rarest trigrams first)
+MAX_POSTINGS = 5000
+MIN_SIMILARITY = 0.3
+
+def normalize_name(name: str) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    decomposed = unicodedata.normalize('NFKD', name)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return re.sub(r'[\W_]+', ' ', stripped.casefold()).strip()
+
+def trigrams(key: str) -> set:
+    """Trigrams of a normalized key, padded so word starts/ends count"""
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _gram_code(gram: str) -> int:
+    """Pack a trigram into one int64 (21 bits per code point)"""
+    return (ord(gram[0]) << 42) | (ord(gram[1]) << 21) | ord(gram[2])
+
+class NameIndex:
+    """
+    Sorted normalized keys for exact/prefix lookups plus a trigram posting
+    index for typo-tolerant search. All state is flat arrays so it can be
+    saved next to the gazetteer and memory-mapped on load.
+    """
+
+    ARRAYS = ('sorted_ids', 'key_blob', 'key_offsets', 'gram_codes', 'gram_offsets', 'gram_ids')
+
+    def __init__(self, sorted_ids, key_blob, key_offsets, gram_codes, gram_offsets, gram_ids):
+        self.sorted_ids = sorted_ids
+        self.key_blob = key_blob
+        self.key_offsets = key_offsets
+        self.gram_codes = gram_codes
+        self.gram_offsets = gram_offsets
+        self.gram_ids = gram_ids
+        self._keys = _KeyView(key_blob, key_offsets)
+        # Place id -> position in the sorted key arrays
+        self.positions = np.empty(len(sorted_ids), np.int64)
+        self.positions[np.asarray(sorted_ids)] = np.arange(len(sorted_ids))
+
+    @classmethod
+    def build(cls, names: List[str]) -> 'NameIndex':
+        keys = [normalize_name(name) for name in names]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+
+        encoded = [keys[i].encode('utf-8') for i in order]
+        key_offsets = np.zeros(len(encoded) + 1, np.int64)
+        np.cumsum([len(e) for e in encoded], out=key_offsets[1:])
+        key_blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+        codes, ids = [], []
+        for i, key in enumerate(keys):
+            for gram in trigrams(key):
+                codes.append(_gram_code(gram))
+                ids.append(i)
+        codes = np.asarray(codes, dtype=np.int64)
+        ids = np.asarray(ids, dtype=np.int32)
+        by_code = np.argsort(codes, kind='stable')
+        codes, ids = codes[by_code], ids[by_code]
+        gram_codes, starts = np.unique(codes, return_index=True)
+        gram_offsets = np.append(starts, len(codes)).astype(np.int64)
+
+        return cls(np.asarray(order, dtype=np.int32), key_blob, key_offsets,
+                   gram_codes, gram_offsets, ids)
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        for attr in self.ARRAYS:
+            np.save(os.path.join(directory, f"names_{attr}.npy"), getattr(self, attr))
+
+    @classmethod
+    def load(cls, directory: str) -> 'NameIndex':
+        return cls(*[np.load(os.path.join(directory, f"names_{attr}.npy"), mmap_mode='r')
+                     for attr in cls.ARRAYS])
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        return all(os.path.exists(os.path.join(directory, f"names_{attr}.npy")) for attr in cls.ARRAYS)
+
+    def _range(self, key: str, prefix: bool = False) -> Tuple[int, int]:
+        """Positions [lo, hi) of keys equal to (or starting with) `key`"""
+        lo = _bisect(self._keys, key)
+        hi = _bisect(self._keys, key + ('\U0010ffff' if prefix else '\x00'))
+        return lo, hi
+
+    def exact(self, query: str) -> List[int]:
+        """Place ids whose normalized name equals the query"""
+        lo, hi = self._range(normalize_name(query))
+        return np.asarray(self.sorted_ids[lo:hi]).tolist()
+
+    def prefix(self, query: str, population, limit: int = 10) -> List[int]:
+        """
+        Most populous place ids whose normalized name starts with the query
+        (excluding exact matches)
+        """
+        key = normalize_name(query)
+        if not key:
+            return []
+        _, lo = self._range(key)
+        _, hi = self._range(key, prefix=True)
+        ids = np.asarray(self.sorted_ids[lo:hi])
+        if len(ids) > limit:
+            ids = ids[np.argpartition(-np.asarray(population)[ids], limit)[:limit]]
+        return ids.tolist()
+
+    def fuzzy(self, query: str, limit: int = 10) -> List[Tuple[int, float]]:
+        """Place ids ranked by trigram (Jaccard) similarity to the query"""
+        key = normalize_name(query)
+        grams = trigrams(key) if key else set()
+        postings = []
+        for gram in grams:
+            code = _gram_code(gram)
+            i = int(np.searchsorted(self.gram_codes, code))
+            if i < len(self.gram_codes) and self.gram_codes[i] == code:
+                postings.append(self.gram_ids[self.gram_offsets[i]:self.gram_offsets[i + 1]])
+        if not postings:
+            return []
+
+        # Candidates come from the rarest trigrams; common ones add little signal
+        postings.sort(key=len)
+        selected, total = [], 0
+        for posting in postings:
+            if selected and total + len(posting) > MAX_POSTINGS:
+                break
+            selected.append(posting)
+            total += len(posting)
+        ids, counts = np.unique(np.concatenate(selected), return_counts=True)
+        top = ids[np.argsort(-counts, kind='stable')[:limit * 4]]
+
+        scored = []
+        for i in top.tolist():
+            other = trigrams(self.key_of(i))
+            similarity = len(grams & other) / len(grams | other)
+            if similarity >= MIN_SIMILARITY:
+                scored.append((i, similarity))
+        scored.sort(key=lambda item: -item[1])
+        return scored[:limit]
+
+    def key_of(self, place_id: int) -> str:
+        """Normalized key for a place id"""
+        return self._keys[int(self.positions[place_id])]
+
+    def search(self, query: str, population, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Ranked matches: exact names first, then prefix matches, then fuzzy
+        matches; ties broken by population (largest first).
+        """
+        results, seen = [], set()
+
+        def add(ids, match, score):
+            ranked = sorted(ids, key=lambda i: -int(population[i]))
+            for i in ranked:
+                if i not in seen and len(results) < limit:
+                    seen.add(i)
+                    results.append({'id': i, 'match': match, 'score': score})
+
+        add(self.exact(query), 'exact', 1.0)
+        if len(results) < limit:
+            add(self.prefix(query, population, limit), 'prefix', 0.9)
+        if len(results) < limit:
+            for i, similarity in self.fuzzy(query, limit):
+                if i not in seen and len(results) < limit:
+                    seen.add(i)
+                    results.append({'id': i, 'match': 'fuzzy', 'score': round(similarity * 0.8, 3)})
+        return results
+
+class _KeyView:
+    """Sequence view over keys stored in a UTF-8 blob"""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, j: int) -> str:
+        return bytes(self.blob[self.offsets[j]:self.offsets[j + 1]]).decode('utf-8')
+
+def _bisect(keys: _KeyView, key: str) -> int:
+    """Leftmost position where `key` could be inserted into the sorted keys"""
+    lo, hi = 0, len(keys)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if keys[mid] < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
@@ -0,0 +1,210 @@
+"""
+Parking Window for Smart City System
+Per-lot rolling gate counters: entry/exit rates, occupancy and time-until-full
+"""
+import os
+import time
+from typing import Dict, Optional, List
+
+import numpy as np
+
+# Seconds of gate events each lot's rates are computed over
+WINDOW_SECONDS = 300
+# Rates are reported per hour, like the simulated parking feed
+RATE_UNIT = 3600
+# Time-until-full forecasts further out than this are reported as NaN (not filling)
+FORECAST_HORIZON = 3600
+INITIAL_LOTS = 1024
+# Readings stamped further ahead of the server clock than this are refused
+MAX_CLOCK_SKEW = 5
+
+class ParkingWindow:
+    """
+    Entry/exit counts for many lots in per-second ring buffers, one row per
+    lot in shared NumPy arrays. Each lot keeps running window sums, so
+    recording an event is O(1) and a rate query is O(1) plus clearing the
+    seconds that elapsed since the lot's last event (each second is cleared
+    once, so that is O(1) amortized). Not thread-safe; callers serialize access.
+    """
+
+    def __init__(self, window: int = WINDOW_SECONDS, initial_lots: int = INITIAL_LOTS):
+        self.window = window
+        self._rows: Dict[tuple, int] = {}  # (city, lot) -> row
+        self._cities: Dict[str, List[int]] = {}
+        self._keys: List[tuple] = []
+        self._allocate(initial_lots)
+
+    def _allocate(self, lots: int):
+        self.entries = np.zeros((lots, self.window), dtype=np.int32)
+        self.exits = np.zeros((lots, self.window), dtype=np.int32)
+        self.sum_entries = np.zeros(lots, dtype=np.int64)
+        self.sum_exits = np.zeros(lots, dtype=np.int64)
+        self.head = np.zeros(lots, dtype=np.int64)      # latest second the ring reflects
+        self.first = np.zeros(lots, dtype=np.int64)     # first second with data, for warm-up
+        self.capacity = np.zeros(lots, dtype=np.int32)
+        self.occupied = np.zeros(lots, dtype=np.int32)
+        self.occupied_at = np.zeros(lots, dtype=np.float64)  # ts of the latest absolute occupancy
+        self.seen = np.zeros(lots, dtype=np.float64)         # ts of the latest reading of any kind
+
+    def _grow(self):
+        arrays = {name: getattr(self, name) for name in self._array_names()}
+        self._allocate(2 * len(self.head))
+        for name, old in arrays.items():
+            getattr(self, name)[:len(old)] = old
+
+    @staticmethod
+    def _array_names():
+        return ('entries', 'exits', 'sum_entries', 'sum_exits', 'head', 'first',
+                'capacity', 'occupied', 'occupied_at', 'seen')
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _row(self, city: str, lot: str, second: int) -> int:
+        key = (city, lot)
+        row = self._rows.get(key)
+        if row is None:
+            row = len(self._keys)
+            if row == len(self.head):
+                self._grow()
+            self._rows[key] = row
+            self._keys.append(key)
+            self._cities.setdefault(city, []).append(row)
+            self.head[row] = self.first[row] = second
+        return row
+
+    def _advance(self, row: int, second: int):
+        """Move a lot's ring forward to `second`, clearing the seconds that fell out"""
+        head = int(self.head[row])
+        if second <= head:
+            return
+        if second - head >= self.window:
+            self.entries[row] = 0
+            self.exits[row] = 0
+            self.sum_entries[row] = 0
+            self.sum_exits[row] = 0
+        else:
+            entries, exits = self.entries[row], self.exits[row]
+            for s in range(head + 1, second + 1):
+                slot = s % self.window
+                self.sum_entries[row] -= entries[slot]
+                self.sum_exits[row] -= exits[slot]
+                entries[slot] = 0
+                exits[slot] = 0
+        self.head[row] = second
+
+    def record(self, city: str, lot: str, ts: float, entries: int = 0, exits: int = 0,
+               occupied: Optional[int] = None, capacity: Optional[int] = None, now: float = None):
+        """
+        Add gate counts seen at `ts` (epoch seconds). Occupancy follows the
+        counts unless an absolute `occupied` reading is given; late absolute
+        readings do not overwrite newer ones. Counts older than the window are
+        only applied to occupancy. Raises ValueError if `ts` is more than
+        MAX_CLOCK_SKEW seconds ahead of `now` (the current time by default),
+        since it would advance the ring past every correctly timed reading.
+        """
+        now = time.time() if now is None else now
+        if ts > now + MAX_CLOCK_SKEW:
+            raise ValueError(f"ts {ts} is ahead of the clock ({now})")
+        second = int(ts)
+        row = self._row(city, lot, second)
+        self.seen[row] = max(self.seen[row], ts)
+        if capacity is not None:
+            self.capacity[row] = capacity
+        if entries or exits:
+            self._advance(row, second)
+            if second > self.head[row] - self.window:
+                slot = second % self.window
+                self.entries[row, slot] += entries
+                self.exits[row, slot] += exits
+                self.sum_entries[row] += entries
+                self.sum_exits[row] += exits
+                self.first[row] = min(self.first[row], second)
+
+        if occupied is not None:
+            if ts >= self.occupied_at[row]:
+                self.occupied[row] = occupied
+                self.occupied_at[row] = ts
+        elif entries or exits:
+            level = int(self.occupied[row]) + entries - exits
+            self.occupied[row] = min(max(level, 0), self.capacity[row] or level)
+
+    def cities(self) -> List[str]:
+        return list(self._cities)
+
+    def city_state(self, city: str, now: float) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Per-lot arrays for a city as of `now`: capacity, occupied, entry_rate,
+        exit_rate (per RATE_UNIT seconds), time_until_full in seconds (NaN
+        when the lot is not filling up within FORECAST_HORIZON) and seen.
+        """
+        rows = self._cities.get(city)
+        if not rows:
+            return None
+        second = int(now)
+        for row in rows:
+            self._advance(row, second)
+        rows = np.asarray(rows)
+
+        # A lot seen for less than the window is averaged over the time it has existed
+        span = np.clip(second - self.first[rows] + 1, 1, self.window).astype(np.float64)
+        entry_rate = self.sum_entries[rows] / span
+        exit_rate = self.sum_exits[rows] / span
+        capacity = self.capacity[rows].astype(np.int64)
+        occupied = self.occupied[rows].astype(np.int64)
+
+        net = entry_rate - exit_rate
+        free = np.maximum(capacity - occupied, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            until_full = np.where(net > 0, free / net, np.nan)
+        until_full[until_full > FORECAST_HORIZON] = np.nan
+
+        return {
+            'lot': [self._keys[row][1] for row in rows],
+            'capacity': capacity,
+            'occupied': occupied,
+            'entry_rate': entry_rate * RATE_UNIT,
+            'exit_rate': exit_rate * RATE_UNIT,
+            'time_until_full': until_full,
+            'seen': self.seen[rows]
+        }
+
+    def snapshot(self, path: str):
+        """Write every lot's ring, sums and occupancy to an .npz file (atomically)"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        n = len(self._keys)
+        arrays = {name: getattr(self, name)[:n] for name in self._array_names()}
+        keys = np.array(self._keys, dtype=str).reshape(n, 2)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, window=self.window, cities=keys[:, 0], lots=keys[:, 1], **arrays)
+        os.replace(tmp_path, path)
+
+    def restore(self, path: str) -> bool:
+        """
+        Load a snapshot written by snapshot(). Heads are absolute seconds, so
+        the next query ages the restored window by the downtime. Returns False
+        if there is no usable snapshot.
+        """
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                if int(data['window']) != self.window:
+                    print(f"Error restoring parking window {path}: window {int(data['window'])}s != {self.window}s")
+                    return False
+                n = len(data['lots'])
+                self._rows, self._cities, self._keys = {}, {}, []
+                self._allocate(max(INITIAL_LOTS, n))
+                for name in self._array_names():
+                    getattr(self, name)[:n] = data[name]
+                for row, (city, lot) in enumerate(zip(data['cities'].tolist(), data['lots'].tolist())):
+                    self._rows[(city, lot)] = row
+                    self._keys.append((city, lot))
+                    self._cities.setdefault(city, []).append(row)
+        except Exception as e:
+            print(f"Error restoring parking window {path}: {e}")
+            return False
+        return True
@@ -0,0 +1,125 @@
+"""
+Pub/Sub for Smart City System
+In-process fan-out of city score and alert events to stream subscribers
+"""
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+# Topic every subscriber receives in addition to its own (alerts without a city)
+GLOBAL_TOPIC = '*'
+# Retained events kept for topics nobody subscribes to; least recently published go first
+MAX_RETAINED = 1024
+
+class Subscription:
+    """
+    Bounded event queue for one subscriber. A slow consumer loses its oldest
+    events rather than blocking publishers or growing without limit.
+    """
+
+    def __init__(self, topics: Tuple[str, ...], max_queue: int = 100):
+        self.topics = topics
+        self.events = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def put(self, event: Dict[str, Any]):
+        while True:
+            try:
+                self.events.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.events.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Next event, or None if nothing arrived within `timeout` seconds"""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class EventBroker:
+    """
+    Topic-keyed fan-out. Publishing serializes an event once and hands the
+    same payload to every subscriber of the topic; retained events (the
+    latest score of a city) are replayed to new subscribers on connect.
+    Retained events of topics without subscribers are evicted least recently
+    published first once there are more than `max_retained`.
+    """
+
+    def __init__(self, max_queue: int = 100, max_retained: int = MAX_RETAINED):
+        self.max_queue = max_queue
+        self.max_retained = max_retained
+        self._subscribers: Dict[str, set] = {}
+        self._retained: 'OrderedDict[Tuple[str, str], Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'published': 0, 'delivered': 0}
+
+    def subscribe(self, *topics: str) -> Subscription:
+        topics = tuple(dict.fromkeys(topics + (GLOBAL_TOPIC,)))
+        subscription = Subscription(topics, self.max_queue)
+        with self._lock:
+            for topic in topics:
+                self._subscribers.setdefault(topic, set()).add(subscription)
+            retained = [event for (topic, _), event in self._retained.items() if topic in topics]
+        for event in retained:
+            subscription.put(event)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[topic]
+
+    def publish(self, topic: str, event: str, data: Dict[str, Any], retain: bool = False) -> int:
+        """Send an event to every subscriber of `topic`; returns the number reached"""
+        message = {'event': event, 'data': json.dumps(data, default=str), 'time': time.time()}
+        with self._lock:
+            if retain:
+                self._retained[(topic, event)] = message
+                self._retained.move_to_end((topic, event))
+                self._evict_retained()
+            subscribers = list(self._subscribers.get(topic, ()))
+            self.stats['published'] += 1
+            self.stats['delivered'] += len(subscribers)
+        for subscription in subscribers:
+            subscription.put(message)
+        return len(subscribers)
+
+    def _evict_retained(self):
+        """Drop the oldest retained events of unsubscribed topics beyond max_retained (lock held)"""
+        excess = len(self._retained) - self.max_retained
+        if excess <= 0:
+            return
+        stale = [key for key in self._retained if key[0] not in self._subscribers][:excess]
+        for key in stale:
+            del self._retained[key]
+
+    def retained(self, topic: str, event: str) -> Optional[Dict[str, Any]]:
+        """Latest retained event of a kind for a topic, decoded"""
+        with self._lock:
+            message = self._retained.get((topic, event))
+        return json.loads(message['data']) if message else None
+
+    def subscriber_count(self, topic: Optional[str] = None) -> int:
+        with self._lock:
+            if topic is not None:
+                return len(self._subscribers.get(topic, ()))
+            return len({s for subscribers in self._subscribers.values() for s in subscribers})
+
+def format_sse(message: Dict[str, Any]) -> str:
+    """Encode a published message as a Server-Sent Events frame"""
+    return f"event: {message['event']}\ndata: {message['data']}\n\n"
+
+# Global event broker instance
+event_broker = EventBroker()
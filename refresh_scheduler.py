@@ -0,0 +1,211 @@
+"""
+Refresh Scheduler for Smart City System
+Keeps precomputed metric snapshots of watched cities warm in the background
+"""
+import heapq
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, Optional, Callable
+
+# Seconds between refreshes of a city, and of one requested within HOT_WINDOW
+REFRESH_INTERVAL = 300.0
+HOT_INTERVAL = 60.0
+HOT_WINDOW = 900.0
+# Cities that were only requested (not watched) stop refreshing after this long unrequested
+IDLE_TTL = 3600.0
+# Fraction of the interval each refresh time is randomly shifted by
+REFRESH_JITTER = 0.1
+MAX_CONCURRENT_REFRESHES = 4
+
+class RefreshScheduler:
+    """
+    Recomputes watched cities on a jittered cadence using at most
+    `max_workers` concurrent refreshes. Cities requested within `hot_window`
+    seconds are refreshed every `hot_interval` seconds and go first when
+    several refreshes are due at once. Handlers read the latest snapshot;
+    only a city with no snapshot yet is computed inside the request.
+    Cities added by watch() stay for good; cities that joined through get()
+    are dropped once nobody has requested them for `idle_ttl` seconds.
+    """
+
+    def __init__(self, refresh: Callable[[str, float, float], Dict[str, Any]],
+                 interval: float = REFRESH_INTERVAL, hot_interval: float = HOT_INTERVAL,
+                 hot_window: float = HOT_WINDOW, jitter: float = REFRESH_JITTER,
+                 max_workers: int = MAX_CONCURRENT_REFRESHES, idle_ttl: float = IDLE_TTL):
+        self.refresh = refresh
+        self.interval = interval
+        self.hot_interval = hot_interval
+        self.hot_window = hot_window
+        self.jitter = jitter
+        self.idle_ttl = idle_ttl
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='refresh')
+
+        # name -> {'lat', 'lon', 'due', 'requested_at', 'snapshot', 'future', 'pinned'}
+        self._cities: Dict[str, Dict[str, Any]] = {}
+        self._queue = []  # (due, seq, name); entries whose due no longer matches are stale
+        self._seq = 0
+        self._running = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stats = {'refreshes': 0, 'errors': 0, 'inline_refreshes': 0, 'expired': 0}
+
+    def _is_hot(self, city: Dict[str, Any], now: float) -> bool:
+        return city['requested_at'] is not None and now - city['requested_at'] < self.hot_window
+
+    def _next_due(self, city: Dict[str, Any], now: float) -> float:
+        interval = self.hot_interval if self._is_hot(city, now) else self.interval
+        return now + interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _schedule(self, name: str, due: float):
+        # Caller holds self._cond
+        self._cities[name]['due'] = due
+        self._seq += 1
+        heapq.heappush(self._queue, (due, self._seq, name))
+        self._cond.notify()
+
+    def watch(self, name: str, lat: float, lon: float, delay: float = 0.0):
+        """Add a city to the refresh set for good (pins it if it was only requested)"""
+        with self._cond:
+            if name in self._cities:
+                self._cities[name]['pinned'] = True
+                return
+            self._cities[name] = {'lat': lat, 'lon': lon, 'due': None, 'requested_at': None,
+                                  'snapshot': None, 'future': None, 'pinned': True}
+            self._schedule(name, time.monotonic() + delay)
+
+    def unwatch(self, name: str):
+        with self._cond:
+            self._cities.pop(name, None)
+
+    def snapshot(self, name: str) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            city = self._cities.get(name)
+            return city['snapshot'] if city else None
+
+    def get(self, name: str, lat: float, lon: float) -> Dict[str, Any]:
+        """
+        Latest snapshot for a city, marking it as recently requested. A city
+        without a snapshot is watched and refreshed now (concurrent callers
+        share the same refresh).
+        """
+        now = time.monotonic()
+        with self._cond:
+            if name not in self._cities:
+                self._cities[name] = {'lat': lat, 'lon': lon, 'due': None, 'requested_at': now,
+                                      'snapshot': None, 'future': None, 'pinned': False}
+            city = self._cities[name]
+            was_hot = self._is_hot(city, now)
+            city['requested_at'] = now
+            if city['snapshot'] is not None:
+                # Pull a cold city's next refresh forward to the hot cadence
+                if not was_hot and city['future'] is None and \
+                        (city['due'] is None or city['due'] > now + self.hot_interval):
+                    self._schedule(name, now + self.hot_interval)
+                return city['snapshot']
+            future = city['future']
+            if future is None:
+                future = city['future'] = Future()
+                self.stats['inline_refreshes'] += 1
+                owner = True
+            else:
+                owner = False
+
+        if owner:
+            self._run(name, lat, lon, future)
+        return future.result()
+
+    def _run(self, name: str, lat: float, lon: float, future: Future):
+        try:
+            snapshot = self.refresh(name, lat, lon)
+        except Exception as e:
+            print(f"Error refreshing {name}: {e}")
+            with self._cond:
+                self.stats['errors'] += 1
+                city = self._cities.get(name)
+                if city is not None:
+                    city['future'] = None
+                    self._schedule(name, self._next_due(city, time.monotonic()))
+            future.set_exception(e)
+            return
+
+        with self._cond:
+            self.stats['refreshes'] += 1
+            city = self._cities.get(name)
+            if city is not None:
+                city['snapshot'] = snapshot
+                city['future'] = None
+                self._schedule(name, self._next_due(city, time.monotonic()))
+        future.set_result(snapshot)
+
+    def _finished(self, _):
+        with self._cond:
+            self._running -= 1
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                due = []
+                while self._queue and self._queue[0][0] <= now:
+                    when, seq, name = heapq.heappop(self._queue)
+                    city = self._cities.get(name)
+                    if city is None or city['due'] != when or city['future'] is not None:
+                        continue
+                    if not city['pinned'] and now - city['requested_at'] >= self.idle_ttl:
+                        # Nobody asked for this city lately; stop refreshing it
+                        del self._cities[name]
+                        self.stats['expired'] += 1
+                        continue
+                    due.append((when, seq, name))
+
+                # Recently requested cities first, then oldest due
+                due.sort(key=lambda entry: (not self._is_hot(self._cities[entry[2]], now), entry[0]))
+                free = self.max_workers - self._running
+                start, deferred = due[:free], due[free:]
+                for entry in deferred:
+                    heapq.heappush(self._queue, entry)
+
+                jobs = []
+                for _, _, name in start:
+                    city = self._cities[name]
+                    city['future'] = Future()
+                    self._running += 1
+                    jobs.append((name, city['lat'], city['lon'], city['future']))
+
+                if not jobs:
+                    if self._running >= self.max_workers or not self._queue:
+                        self._cond.wait()
+                    else:
+                        self._cond.wait(max(0.0, self._queue[0][0] - now))
+                    continue
+
+            for job in jobs:
+                try:
+                    self.executor.submit(self._run, *job).add_done_callback(self._finished)
+                except RuntimeError:
+                    # Executor shut down at interpreter exit
+                    return
+
+    def start(self) -> bool:
+        """Start the background refresh loop; returns False if already running"""
+        with self._cond:
+            if self._thread is not None:
+                return False
+            self._thread = threading.Thread(target=self._loop, name='refresh-scheduler', daemon=True)
+            self._thread.start()
+            return True
+
+    def status(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._cond:
+            return {
+                'watched': len(self._cities),
+                'hot': sum(1 for city in self._cities.values() if self._is_hot(city, now)),
+                'warm': sum(1 for city in self._cities.values() if city['snapshot'] is not None),
+                'running': self._running,
+                **self.stats
+            }
@@ -0,0 +1,115 @@
+"""
+Scoring kernel for Smart City System
+Rule-based formulas shared by the web app, the CLI demo and the dataset generator
+"""
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+ACCIDENT_RISK_LEVELS = ('Low', 'Medium', 'High')
+ACTIVITY_LEVELS = ('Low', 'Moderate', 'High')
+PARKING_STATES = ('Available', 'Full')
+
+# Upper bounds of the lower levels (score < 0.4 -> Low, < 0.7 -> Medium/Moderate)
+LEVEL_THRESHOLDS = (0.4, 0.7)
+PARKING_FULL_SCORE = 1.2
+AQI_RANGE = (0, 500)
+
+# Arrays at least this long use the compiled kernels when Numba is installed
+COMPILED_MIN_SIZE = 10_000
+
+# Score formulas. Written once with plain arithmetic so the same function
+# serves Python scalars and NumPy arrays, in the same operation order.
+def accident_risk_score(vehicle_density, avg_speed, road_condition, weather_condition, visibility, time_of_day):
+    return (vehicle_density/500)*0.4 + (1 - avg_speed/100)*0.3 + \
+           (2 - road_condition)*0.1 + weather_condition*0.1 + \
+           (1 - visibility/1000)*0.1
+
+def air_quality_index(pm25, pm10, no2, co, so2, temperature, humidity, wind_speed):
+    """Unclipped AQI"""
+    return (0.4*pm25 + 0.3*pm10 + 0.1*no2 + 15*co + 0.05*so2 -
+            0.2*wind_speed - 0.1*humidity)
+
+def citizen_activity_score(population_density, avg_age, workplace_count, public_events, temperature, day_of_week):
+    return (population_density/15000)*0.4 + (workplace_count/50)*0.3 + \
+           (public_events/5)*0.2 + (temperature/40)*0.1
+
+def parking_score(parking_capacity, occupied_slots, entry_rate, exit_rate, time_of_day, weekday, nearby_events):
+    utilization = occupied_slots/parking_capacity
+    inflow = entry_rate - exit_rate
+    return utilization + inflow/50 + nearby_events*0.5
+
+def _level(score, levels):
+    if score < LEVEL_THRESHOLDS[0]: return levels[0]
+    elif score < LEVEL_THRESHOLDS[1]: return levels[1]
+    else: return levels[2]
+
+# Scalar predictors (one record)
+def predict_accident_risk(vehicle_density, avg_speed, road_condition, weather_condition, visibility, time_of_day):
+    return _level(accident_risk_score(vehicle_density, avg_speed, road_condition,
+                                      weather_condition, visibility, time_of_day), ACCIDENT_RISK_LEVELS)
+
+def predict_air_quality(pm25, pm10, no2, co, so2, temperature, humidity, wind_speed):
+    aqi = air_quality_index(pm25, pm10, no2, co, so2, temperature, humidity, wind_speed)
+    return max(AQI_RANGE[0], min(AQI_RANGE[1], aqi))
+
+def predict_citizen_activity(population_density, avg_age, workplace_count, public_events, temperature, day_of_week):
+    return _level(citizen_activity_score(population_density, avg_age, workplace_count,
+                                         public_events, temperature, day_of_week), ACTIVITY_LEVELS)
+
+def predict_parking_availability(parking_capacity, occupied_slots, entry_rate, exit_rate, time_of_day, weekday, nearby_events):
+    score = parking_score(parking_capacity, occupied_slots, entry_rate, exit_rate,
+                          time_of_day, weekday, nearby_events)
+    return PARKING_STATES[1] if score > PARKING_FULL_SCORE else PARKING_STATES[0]
+
+def _compile(kernel):
+    """
+    Numba build of a score formula for float64 arrays (the array expression
+    is fused into one loop), or None when Numba is unavailable. NumPy error
+    semantics keep division by zero returning inf/nan as the NumPy path does.
+    """
+    if numba is None:
+        return None
+    return numba.njit(error_model='numpy', cache=True)(kernel)
+
+_COMPILED = {
+    kernel: _compile(kernel)
+    for kernel in (accident_risk_score, air_quality_index, citizen_activity_score, parking_score)
+}
+
+def score_array(kernel, *features) -> np.ndarray:
+    """
+    Evaluate a score formula over float64 feature arrays (any integer or
+    narrow dtype is widened first), through its compiled kernel for large
+    inputs when available.
+    """
+    arrays = [np.asarray(feature, dtype=np.float64) for feature in features]
+    compiled = _COMPILED.get(kernel)
+    if compiled is not None and arrays and arrays[0].size >= COMPILED_MIN_SIZE:
+        return compiled(*arrays)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return kernel(*arrays)
+
+def _levels(score, levels) -> np.ndarray:
+    return np.select([score < LEVEL_THRESHOLDS[0], score < LEVEL_THRESHOLDS[1]], list(levels[:2]), default=levels[2])
+
+# Array predictors: one array per feature in, one prediction per row out
+def predict_accident_risk_batch(vehicle_density, avg_speed, road_condition, weather_condition, visibility, time_of_day):
+    return _levels(score_array(accident_risk_score, vehicle_density, avg_speed, road_condition,
+                               weather_condition, visibility, time_of_day), ACCIDENT_RISK_LEVELS)
+
+def predict_air_quality_batch(pm25, pm10, no2, co, so2, temperature, humidity, wind_speed):
+    aqi = score_array(air_quality_index, pm25, pm10, no2, co, so2, temperature, humidity, wind_speed)
+    return np.clip(aqi, *AQI_RANGE)
+
+def predict_citizen_activity_batch(population_density, avg_age, workplace_count, public_events, temperature, day_of_week):
+    return _levels(score_array(citizen_activity_score, population_density, avg_age, workplace_count,
+                               public_events, temperature, day_of_week), ACTIVITY_LEVELS)
+
+def predict_parking_availability_batch(parking_capacity, occupied_slots, entry_rate, exit_rate, time_of_day, weekday, nearby_events):
+    score = score_array(parking_score, parking_capacity, occupied_slots, entry_rate, exit_rate,
+                        time_of_day, weekday, nearby_events)
+    return np.where(score > PARKING_FULL_SCORE, PARKING_STATES[1], PARKING_STATES[0])
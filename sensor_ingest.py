@@ -0,0 +1,300 @@
+"""
+Sensor Ingestion for Smart City System
+Buffers IoT parking and activity readings and folds them into live per-city aggregates
+"""
+import atexit
+import json
+import math
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Optional, List, Tuple
+
+import numpy as np
+
+from parking_window import ParkingWindow, WINDOW_SECONDS, MAX_CLOCK_SKEW
+
+# Readings accepted but not yet applied; a POST that would exceed it is refused
+MAX_PENDING_READINGS = 200_000
+# Readings folded into the state tables per lock acquisition, and how long
+# the worker lingers for a batch to fill once the first readings arrive
+MICRO_BATCH_SIZE = 5_000
+MICRO_BATCH_WAIT = 0.05
+# Parking lot windows are saved this often (and at exit) so a restart keeps them
+PARKING_SNAPSHOT_FILE = 'data/parking_window.npz'
+SNAPSHOT_INTERVAL = 60
+# Lots and zones silent for longer than this are left out of city aggregates
+STALE_AFTER = 900
+
+ACTIVITY_FIELDS = ('population_density', 'avg_age', 'workplace_count', 'public_events')
+# Gate counts, occupancy and capacity are held in int32 columns
+MAX_COUNT = int(np.iinfo(np.int32).max)
+
+def city_key(city_name: str) -> str:
+    return city_name.strip().title()
+
+def _timestamp(value: Any, now: float) -> float:
+    """
+    A reading's ts as finite, non-negative epoch seconds no more than
+    MAX_CLOCK_SKEW ahead of `now`; ValueError otherwise
+    """
+    ts = float(value)
+    if not math.isfinite(ts) or ts < 0 or ts > now + MAX_CLOCK_SKEW:
+        raise ValueError(f"ts out of range: {value}")
+    return ts
+
+def _count(value: Any) -> int:
+    """A count that fits the int32 state columns; ValueError otherwise"""
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ValueError(f"count out of range: {value}")
+    count = int(value)
+    if not 0 <= count <= MAX_COUNT:
+        raise ValueError(f"count out of range: {value}")
+    return count
+
+def _measure(value: Any) -> float:
+    """An activity field as a finite, non-negative number; ValueError otherwise"""
+    measure = float(value)
+    if not math.isfinite(measure) or measure < 0:
+        raise ValueError(f"value out of range: {value}")
+    return measure
+
+def parse_ndjson(body: bytes) -> Tuple[List[Dict[str, Any]], int]:
+    """Readings from a newline-delimited JSON body, plus the count of malformed lines"""
+    readings, malformed = [], 0
+    loads = json.loads
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            reading = loads(line)
+        except ValueError:
+            malformed += 1
+            continue
+        if isinstance(reading, dict):
+            readings.append(reading)
+        else:
+            malformed += 1
+    return readings, malformed
+
+class IngestQueueFull(Exception):
+    """The pending-readings queue has no room for a batch"""
+
+class SensorIngest:
+    """
+    Bounded queue of raw readings drained by one worker thread. The worker
+    applies readings in micro-batches to the latest-state tables (one row per
+    parking lot / activity zone) and to the per-lot gate counters of a
+    ParkingWindow, so POSTs never wait on the state lock and readers see a
+    consistent table. The parking window is snapshotted to disk periodically
+    and at exit, and restored when the worker starts.
+
+    Parking readings: {"type": "parking", "city", "lot", "capacity",
+    "occupied", "entries", "exits", "ts"}; entries/exits are counts since the
+    lot's previous reading, and occupied is derived from them when omitted.
+    Activity readings: {"type": "activity", "city", "zone", <ACTIVITY_FIELDS>, "ts"}.
+    "ts" (epoch seconds) defaults to the arrival time; readings stamped more than
+    MAX_CLOCK_SKEW seconds in the future are rejected.
+    """
+
+    def __init__(self, max_pending: int = MAX_PENDING_READINGS, batch_size: int = MICRO_BATCH_SIZE,
+                 batch_wait: float = MICRO_BATCH_WAIT, window: int = WINDOW_SECONDS,
+                 snapshot_path: Optional[str] = PARKING_SNAPSHOT_FILE):
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.snapshot_path = snapshot_path
+        self._last_snapshot = time.monotonic()
+
+        self._queue = deque()  # (enqueued_at, readings)
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+        # Rolling gate counters and occupancy per (city, lot)
+        self.parking = ParkingWindow(window)
+        # city -> zone -> {field: value, 'updated'}
+        self._zones: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._state_lock = threading.Lock()
+        self.stats = {'accepted': 0, 'applied': 0, 'rejected': 0, 'refused': 0,
+                      'batches': 0, 'apply_seconds': 0.0, 'max_lag': 0.0}
+
+    def start(self) -> bool:
+        """Start the worker thread; False if it was already running"""
+        with self._cond:
+            if self._thread is not None:
+                return False
+            if self.snapshot_path:
+                with self._state_lock:
+                    if self.parking.restore(self.snapshot_path):
+                        print(f"Restored {len(self.parking)} parking lots from {self.snapshot_path}")
+                atexit.register(self.save_snapshot)
+            self._thread = threading.Thread(target=self._loop, name='sensor-ingest', daemon=True)
+            self._thread.start()
+            return True
+
+    def submit(self, readings: List[Dict[str, Any]]):
+        """Queue readings for the worker; raises IngestQueueFull instead of blocking"""
+        if not readings:
+            return
+        self.start()
+        with self._cond:
+            if self._pending + len(readings) > self.max_pending:
+                self.stats['refused'] += len(readings)
+                raise IngestQueueFull(f"{self._pending} readings pending (limit {self.max_pending})")
+            self._queue.append((time.monotonic(), readings))
+            self._pending += len(readings)
+            self.stats['accepted'] += len(readings)
+            self._cond.notify()
+
+    def _take(self) -> Tuple[List[Dict[str, Any]], float]:
+        """Block until readings arrive, then take up to batch_size of them"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending > 0)
+            self._cond.wait_for(lambda: self._pending >= self.batch_size, timeout=self.batch_wait)
+            batch, oldest = [], self._queue[0][0]
+            while self._queue and len(batch) < self.batch_size:
+                enqueued_at, readings = self._queue[0]
+                room = self.batch_size - len(batch)
+                if len(readings) > room:
+                    # Split a large POST so one batch never holds the state lock for long
+                    batch.extend(readings[:room])
+                    self._queue[0] = (enqueued_at, readings[room:])
+                else:
+                    batch.extend(readings)
+                    self._queue.popleft()
+            self._pending -= len(batch)
+            return batch, oldest
+
+    def _loop(self):
+        while True:
+            batch, oldest = self._take()
+            started = time.monotonic()
+            try:
+                applied = self.apply(batch)
+            except Exception as e:
+                print(f"Error applying sensor readings: {e}")
+                applied = 0
+            with self._cond:
+                self.stats['applied'] += applied
+                self.stats['rejected'] += len(batch) - applied
+                self.stats['batches'] += 1
+                self.stats['apply_seconds'] += time.monotonic() - started
+                self.stats['max_lag'] = max(self.stats['max_lag'], started - oldest)
+            if self.snapshot_path and time.monotonic() - self._last_snapshot >= SNAPSHOT_INTERVAL:
+                self.save_snapshot()
+
+    def save_snapshot(self):
+        """Persist the parking window so a restart keeps the current rates"""
+        self._last_snapshot = time.monotonic()
+        try:
+            with self._state_lock:
+                self.parking.snapshot(self.snapshot_path)
+        except Exception as e:
+            print(f"Error saving parking window: {e}")
+
+    def apply(self, readings: List[Dict[str, Any]]) -> int:
+        """Fold readings into the state tables; returns how many were usable"""
+        now = time.time()
+        applied = 0
+        with self._state_lock:
+            for reading in readings:
+                try:
+                    kind = reading.get('type')
+                    if kind == 'parking':
+                        self._apply_parking(reading, now)
+                    elif kind == 'activity':
+                        self._apply_activity(reading, now)
+                    else:
+                        continue
+                except (KeyError, TypeError, ValueError, AttributeError, OverflowError):
+                    continue
+                applied += 1
+        return applied
+
+    def _apply_parking(self, reading: Dict[str, Any], now: float):
+        # Everything is validated before the window is touched
+        city, lot = city_key(reading['city']), str(reading['lot'])
+        ts = _timestamp(reading.get('ts', now), now)
+        entries, exits = _count(reading.get('entries', 0)), _count(reading.get('exits', 0))
+        occupied = _count(reading['occupied']) if 'occupied' in reading else None
+        capacity = _count(reading['capacity']) if 'capacity' in reading else None
+        self.parking.record(city, lot, ts, entries, exits, occupied, capacity, now)
+
+    def _apply_activity(self, reading: Dict[str, Any], now: float):
+        city, zone_id = city_key(reading['city']), str(reading['zone'])
+        ts = _timestamp(reading.get('ts', now), now)
+        values = {field: _measure(reading[field]) for field in ACTIVITY_FIELDS if field in reading}
+        zone = self._zones.setdefault(city, {}).setdefault(zone_id, {'updated': 0.0})
+        if ts < zone['updated']:
+            return
+        zone.update(values)
+        zone['updated'] = ts
+
+    def lot_states(self, city_name: str, now: float = None) -> Optional[Dict[str, np.ndarray]]:
+        """Per-lot window state (see ParkingWindow.city_state) for the city's live lots"""
+        now = time.time() if now is None else now
+        with self._state_lock:
+            state = self.parking.city_state(city_key(city_name), now)
+        if state is None:
+            return None
+        live = (now - state['seen'] <= STALE_AFTER) & (state['capacity'] > 0)
+        if not live.any():
+            return None
+        state['lot'] = [lot for lot, keep in zip(state['lot'], live) if keep]
+        for name, values in state.items():
+            if name != 'lot':
+                state[name] = values[live]
+        return state
+
+    def parking_aggregate(self, city_name: str, now: float = None) -> Optional[Dict[str, Any]]:
+        """
+        Per-lot averages over the city's live lots, in the units of the
+        parking model (one lot's capacity and occupancy, vehicles per hour),
+        or None when no lot in the city has reported recently.
+        """
+        state = self.lot_states(city_name, now)
+        if state is None:
+            return None
+        until_full = state['time_until_full']
+        return {
+            'parking_capacity': round(float(state['capacity'].mean())),
+            'occupied_slots': round(float(state['occupied'].mean())),
+            'entry_rate': float(state['entry_rate'].mean()),
+            'exit_rate': float(state['exit_rate'].mean()),
+            'lots': len(state['lot']),
+            'lots_filling': int((~np.isnan(until_full)).sum()),
+            'min_time_until_full': None if np.isnan(until_full).all() else float(np.nanmin(until_full)),
+            'source': 'Sensors'
+        }
+
+    def activity_aggregate(self, city_name: str, now: float = None) -> Optional[Dict[str, Any]]:
+        """Mean of each activity field over the city's live zones, or None when none are live"""
+        now = time.time() if now is None else now
+        with self._state_lock:
+            zones = [zone for zone in self._zones.get(city_key(city_name), {}).values()
+                     if now - zone['updated'] <= STALE_AFTER]
+            if not zones:
+                return None
+            aggregate = {'zones': len(zones), 'source': 'Sensors'}
+            for field in ACTIVITY_FIELDS:
+                values = [zone[field] for zone in zones if field in zone]
+                if values:
+                    aggregate[field] = round(sum(values) / len(values))
+        return aggregate
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self.stats)
+            stats['pending'] = self._pending
+            stats['max_pending'] = self.max_pending
+        with self._state_lock:
+            stats['cities'] = len(set(self.parking.cities()) | set(self._zones))
+            stats['lots'] = len(self.parking)
+            stats['zones'] = sum(len(zones) for zones in self._zones.values())
+        stats['us_per_reading'] = round(stats['apply_seconds'] / stats['applied'] * 1e6, 3) \
+            if stats['applied'] else None
+        return stats
+
+# Global sensor ingestion instance
+sensor_ingest = SensorIngest()
@@ -1,31 +1,59 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
+from sklearn.base import clone
+from sklearn.model_selection import train_test_split, cross_val_predict
 from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor, StackingClassifier, StackingRegressor
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 from sklearn.linear_model import LogisticRegression, LinearRegression
 from sklearn.svm import SVC, SVR
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, mean_squared_error, r2_score
-from sklearn.decomposition import PCA
+from sklearn.decomposition import PCA, IncrementalPCA
+from sklearn.linear_model import SGDClassifier, SGDRegressor
+from sklearn.neural_network import MLPClassifier, MLPRegressor
 import matplotlib.pyplot as plt
 import seaborn as sns
+from model_registry import MODELS_DIR, save_model_bundle
+from stacking import PrefitStacking, drop_binary_column
+from columnar import columnar_path, is_fresh, load_columnar, iter_columnar
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+DATASET_NAMES = ['accident_risk', 'air_quality', 'citizen_activity', 'smart_parking']
+
+# Rows per chunk in out-of-core training
+CHUNK_SIZE = 100_000
+
 class SmartCitySystem:
     def __init__(self):
         self.datasets = {}
         self.models = {}
         self.scalers = {}
         self.encoders = {}
+        self.pcas = {}
+        self.feature_names = {}
         self.results = {}
+        self.timings = {}
+        self.test_sets = {}
         
     def load_datasets(self):
         """Load all datasets"""
-        dataset_names = ['accident_risk', 'air_quality', 'citizen_activity', 'smart_parking']
-        for name in dataset_names:
-            self.datasets[name] = pd.read_csv(f"{name}.csv")
-            print(f"{name}.csv loaded: {self.datasets[name].shape}")
+        for name in DATASET_NAMES:
+            # Typed, memory-mapped columns when converted since the CSV last changed
+            if is_fresh(columnar_path(name), f"{name}.csv"):
+                self.datasets[name] = load_columnar(columnar_path(name))
+                print(f"{name} loaded from {columnar_path(name)}: {self.datasets[name].shape}")
+            else:
+                self.datasets[name] = pd.read_csv(f"{name}.csv")
+                print(f"{name}.csv loaded: {self.datasets[name].shape}")
             
     def inspect_data(self):
         """Inspect datasets for structure and missing values"""
@@ -47,7 +75,7 @@ class SmartCitySystem:
             # Encode categorical targets
             if name != 'air_quality':  # AQI is already numeric
                 target_col = df.columns[-1]
-                if df[target_col].dtype == 'object':
+                if not pd.api.types.is_numeric_dtype(df[target_col]):  # text, string or categorical labels
                     le = LabelEncoder()
                     df[target_col] = le.fit_transform(df[target_col])
                     self.encoders[name] = le
@@ -59,10 +87,11 @@ class SmartCitySystem:
         df = self.datasets[name]
         X = df.iloc[:, :-1]
         y = df.iloc[:, -1]
+        self.feature_names[name] = list(X.columns)
         
-        # Scale features
+        # Scale features (fit on the raw matrix so serving can pass plain arrays)
         scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
+        X_scaled = scaler.fit_transform(X.to_numpy())
         self.scalers[name] = scaler
         
         # Optional PCA (keep 95% variance)
@@ -70,83 +99,88 @@ class SmartCitySystem:
             pca = PCA(n_components=0.95)
             X_pca = pca.fit_transform(X_scaled)
         else:
+            pca = None
             X_pca = X_scaled
+        self.pcas[name] = pca
         
         return train_test_split(X_pca, y, test_size=0.2, random_state=42)
         
-    def train_models(self):
-        """Train models for each dataset"""
+    def train_models(self, jobs=None):
+        """
+        Train every dataset x model job on a process pool. Stacking base
+        estimators also produce out-of-fold predictions while they train, so
+        the stacking job only fits the final estimator on top of them.
+        """
+        workers = jobs or os.cpu_count() or 1
+        splits, specs = {}, []
         for name in self.datasets.keys():
-            print(f"\nTraining models for {name}...")
-            X_train, X_test, y_train, y_test = self.prepare_features(name)
+            splits[name] = self.prepare_features(name)
+            for model_name, model in build_models(name).items():
+                specs.append((name, model_name, model))
+        # Stacking bases first: they gate the stacking jobs
+        specs.sort(key=lambda spec: spec[1] not in STACK_BASES[_task(spec[0])])
+        
+        print(f"\nTraining {len(specs)} jobs ({len(splits)} datasets) on {workers} processes...")
+        started = time.perf_counter()
+        outputs = {name: {} for name in splits}
+        timings = {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for name, model_name, model in specs:
+                X_train, X_test, y_train, _ = splits[name]
+                classifier = _task(name) == 'classification'
+                oof_method = None
+                if model_name in STACK_BASES[_task(name)]:
+                    oof_method = 'predict_proba' if classifier else 'predict'
+                pending.add(pool.submit(_fit_job, name, model_name, model, X_train, y_train,
+                                        X_test, oof_method))
             
-            # Choose model type based on task
-            if name == 'air_quality':  # Regression
-                models = {
-                    'RandomForest': RandomForestRegressor(n_estimators=100, random_state=42),
-                    'LinearRegression': LinearRegression(),
-                    'SVR': SVR(kernel='rbf')
-                }
-                
-                # Train individual models
-                trained_models = {}
-                for model_name, model in models.items():
-                    model.fit(X_train, y_train)
-                    trained_models[model_name] = model
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    output = future.result()
+                    name, model_name = output['dataset'], output['model_name']
+                    outputs[name][model_name] = output
+                    timings.setdefault(name, {})[model_name] = {'wall': output['wall'], 'cpu': output['cpu']}
+                    print(f"  {name:17} {model_name:18} wall {output['wall']:7.2f}s  cpu {output['cpu']:7.2f}s")
                     
-                # Stacking ensemble
-                stacking = StackingRegressor(
-                    estimators=[('rf', models['RandomForest']), ('lr', models['LinearRegression'])],
-                    final_estimator=SVR(),
-                    cv=5
-                )
-                stacking.fit(X_train, y_train)
-                trained_models['Stacking'] = stacking
-                
-                # Evaluate
-                results = {}
-                for model_name, model in trained_models.items():
-                    y_pred = model.predict(X_test)
+                    bases = STACK_BASES[_task(name)]
+                    if model_name in bases and all(base in outputs[name] for base in bases):
+                        X_train, X_test, y_train, _ = splits[name]
+                        pending.add(pool.submit(
+                            _stack_job, name,
+                            [(STACK_ALIASES[base], outputs[name][base]['model']) for base in bases],
+                            np.hstack([outputs[name][base]['oof'] for base in bases]),
+                            y_train, X_test
+                        ))
+        wall = time.perf_counter() - started
+        
+        for name, (_, _, _, y_test) in splits.items():
+            trained_models, results = {}, {}
+            for model_name in list(build_models(name)) + ['Stacking']:
+                output = outputs[name][model_name]
+                trained_models[model_name] = output['model']
+                y_pred = output['y_pred']
+                if name == 'air_quality':
                     results[model_name] = {
                         'MSE': mean_squared_error(y_test, y_pred),
                         'R2': r2_score(y_test, y_pred)
                     }
-                    
-            else:  # Classification
-                models = {
-                    'RandomForest': RandomForestClassifier(n_estimators=100, random_state=42),
-                    'LogisticRegression': LogisticRegression(random_state=42, max_iter=1000),
-                    'SVM': SVC(random_state=42, probability=True)
-                }
-                
-                # Train individual models
-                trained_models = {}
-                for model_name, model in models.items():
-                    model.fit(X_train, y_train)
-                    trained_models[model_name] = model
-                    
-                # Stacking ensemble
-                stacking = StackingClassifier(
-                    estimators=[('rf', models['RandomForest']), ('lr', models['LogisticRegression'])],
-                    final_estimator=SVC(probability=True),
-                    cv=5
-                )
-                stacking.fit(X_train, y_train)
-                trained_models['Stacking'] = stacking
-                
-                # Evaluate
-                results = {}
-                for model_name, model in trained_models.items():
-                    y_pred = model.predict(X_test)
+                else:
                     results[model_name] = {
                         'Accuracy': accuracy_score(y_test, y_pred),
                         'Precision': precision_score(y_test, y_pred, average='weighted'),
                         'Recall': recall_score(y_test, y_pred, average='weighted'),
                         'F1': f1_score(y_test, y_pred, average='weighted')
                     }
-                    
             self.models[name] = trained_models
             self.results[name] = results
+            self.test_sets[name] = splits[name][1]
+        self.timings = timings
+        
+        cpu = sum(t['cpu'] for models in timings.values() for t in models.values())
+        print(f"Trained in {wall:.2f}s wall, {cpu:.2f}s CPU across jobs "
+              f"({cpu / (wall * workers):.0%} utilization of {workers} processes)")
             
     def visualize_results(self):
         """Visualize model performance"""
@@ -217,20 +251,287 @@ class SmartCitySystem:
             else:
                 best_model = max(results.items(), key=lambda x: x[1]['Accuracy'])
                 print(f"{name.replace('_', ' ').title():20} | {best_model[0]:15} | Acc: {best_model[1]['Accuracy']:.3f}")
+    
+    def iter_chunks(self, name, chunk_size=CHUNK_SIZE):
+        """Yield a dataset as DataFrames of at most chunk_size rows (columnar, Parquet or CSV)"""
+        parquet_path = f"{name}.parquet"
+        if is_fresh(columnar_path(name), f"{name}.csv"):
+            yield from iter_columnar(columnar_path(name), chunk_size)
+        elif pq is not None and os.path.exists(parquet_path):
+            for batch in pq.ParquetFile(parquet_path).iter_batches(batch_size=chunk_size):
+                yield batch.to_pandas()
+        else:
+            yield from pd.read_csv(f"{name}.csv", chunksize=chunk_size)
+    
+    def _chunk_arrays(self, name, chunk, test_fraction, chunk_index):
+        """Features (NaNs filled with the running means), encoded target and hold-out mask of a chunk"""
+        chunk = chunk.drop_duplicates()
+        X = chunk.iloc[:, :-1].to_numpy(dtype=np.float64)
+        missing = np.isnan(X)
+        if missing.any() and name in self.scalers:
+            X[missing] = np.take(self.scalers[name].mean_, np.nonzero(missing)[1])
+        
+        y = chunk.iloc[:, -1].to_numpy()
+        if name in self.encoders:
+            y = self.encoders[name].transform(y)
+        
+        return X, y, self._holdout_mask(len(chunk), test_fraction, chunk_index)
+    
+    @staticmethod
+    def _holdout_mask(n_rows, test_fraction, chunk_index):
+        """Deterministic per-chunk split so every pass sees the same hold-out rows"""
+        return np.random.default_rng([42, chunk_index]).random(n_rows) < test_fraction
+    
+    def train_streaming(self, chunk_size=CHUNK_SIZE, epochs=1, test_fraction=0.2):
+        """
+        Out-of-core training: datasets are read chunk by chunk (never whole),
+        the scaler and IncrementalPCA are fitted with partial_fit and
+        incremental estimators (SGD and mini-batch MLP) are trained per chunk.
+        Peak memory depends on chunk_size, not on dataset size.
+        """
+        for name in DATASET_NAMES:
+            print(f"\nStreaming training for {name} (chunks of {chunk_size})...")
+            regression = name == 'air_quality'
+            
+            # Pass 1: feature statistics and the label set
+            scaler = StandardScaler()
+            labels = set()
+            rows = 0
+            for i, chunk in enumerate(self.iter_chunks(name, chunk_size)):
+                chunk = chunk.drop_duplicates()
+                self.feature_names[name] = list(chunk.columns[:-1])
+                # Scaled on training rows only, like the PCA, so hold-out metrics stay clean
+                train = ~self._holdout_mask(len(chunk), test_fraction, i)
+                if train.any():
+                    scaler.partial_fit(chunk.iloc[:, :-1].to_numpy(dtype=np.float64)[train])
+                if not regression:
+                    labels.update(chunk.iloc[:, -1].unique().tolist())
+                rows += len(chunk)
+            self.scalers[name] = scaler
+            classes = None
+            if not regression:
+                # Encoded up front: partial_fit must see every class on the first call
+                self.encoders[name] = LabelEncoder().fit(sorted(labels))
+                classes = np.arange(len(labels))
+            
+            # Pass 2: IncrementalPCA on scaled training rows, truncated to 95% variance
+            n_features = len(self.feature_names[name])
+            pca = None
+            if n_features > 2:
+                pca = IncrementalPCA(n_components=n_features)
+                pending = []
+                for i, chunk in enumerate(self.iter_chunks(name, chunk_size)):
+                    X, _, test = self._chunk_arrays(name, chunk, test_fraction, i)
+                    pending.append(scaler.transform(X[~test]))
+                    # partial_fit needs at least n_components rows per call
+                    if sum(len(block) for block in pending) >= n_features:
+                        pca.partial_fit(np.vstack(pending))
+                        pending = []
+                _truncate_pca(pca, 0.95)
+            self.pcas[name] = pca
+            
+            # Pass 3: incremental estimators, one partial_fit per chunk and epoch
+            if regression:
+                models = {
+                    'SGDRegressor': SGDRegressor(random_state=42),
+                    'MLP': MLPRegressor(hidden_layer_sizes=(64,), random_state=42)
+                }
+            else:
+                models = {
+                    'SGDClassifier': SGDClassifier(loss='log_loss', random_state=42),
+                    'MLP': MLPClassifier(hidden_layer_sizes=(64,), random_state=42)
+                }
+            for _ in range(epochs):
+                for i, chunk in enumerate(self.iter_chunks(name, chunk_size)):
+                    X, y, test = self._chunk_arrays(name, chunk, test_fraction, i)
+                    X_train = self._reduce(name, X[~test])
+                    for model in models.values():
+                        if regression:
+                            model.partial_fit(X_train, y[~test])
+                        else:
+                            model.partial_fit(X_train, y[~test], classes=classes)
+            
+            # Pass 4: streaming evaluation on the hold-out rows
+            totals = {model_name: _StreamingMetrics(regression, 0 if regression else len(classes))
+                      for model_name in models}
+            for i, chunk in enumerate(self.iter_chunks(name, chunk_size)):
+                X, y, test = self._chunk_arrays(name, chunk, test_fraction, i)
+                if not test.any():
+                    continue
+                X_test = self._reduce(name, X[test])
+                for model_name, model in models.items():
+                    totals[model_name].update(y[test], model.predict(X_test))
+            
+            self.models[name] = models
+            self.results[name] = {model_name: metrics.result() for model_name, metrics in totals.items()}
+            print(f"{name}: {rows} rows, {pca.n_components_ if pca is not None else n_features} components")
+    
+    def _reduce(self, name, X):
+        X = self.scalers[name].transform(X)
+        return self.pcas[name].transform(X) if self.pcas.get(name) is not None else X
+    
+    def get_best_model_name(self, name):
+        """Return the name of the best performing model for a dataset"""
+        results = self.results[name]
+        metric = 'R2' if name == 'air_quality' else 'Accuracy'
+        return max(results.items(), key=lambda x: x[1][metric])[0]
+    
+    def save_models(self, models_dir=MODELS_DIR):
+        """Persist scaler + PCA + best estimator per dataset for serving"""
+        for name in self.models.keys():
+            best_name = self.get_best_model_name(name)
+            path = save_model_bundle(
+                name,
+                scaler=self.scalers[name],
+                pca=self.pcas.get(name),
+                model=self.models[name][best_name],
+                encoder=self.encoders.get(name),
+                features=self.feature_names[name],
+                model_name=best_name,
+                metrics=self.results[name][best_name],
+                models_dir=models_dir,
+                check_rows=self.test_sets.get(name)
+            )
+            print(f"Saved {name} ({best_name}) to {path}")
+
+def _task(name):
+    return 'regression' if name == 'air_quality' else 'classification'
+
+# Base estimators of each stacking ensemble and their names inside the stack
+STACK_BASES = {
+    'regression': ['RandomForest', 'LinearRegression'],
+    'classification': ['RandomForest', 'LogisticRegression']
+}
+STACK_ALIASES = {'RandomForest': 'rf', 'LinearRegression': 'lr', 'LogisticRegression': 'lr'}
+STACK_CV = 5
+
+def build_models(name):
+    """Unfitted base models for a dataset (single-threaded; parallelism is across jobs)"""
+    if _task(name) == 'regression':
+        return {
+            'RandomForest': RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=1),
+            'LinearRegression': LinearRegression(),
+            'SVR': SVR(kernel='rbf')
+        }
+    return {
+        'RandomForest': RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=1),
+        'LogisticRegression': LogisticRegression(random_state=42, max_iter=1000),
+        'SVM': SVC(random_state=42, probability=True)
+    }
+
+def _fit_job(name, model_name, model, X_train, y_train, X_test, oof_method=None):
+    """Fit one model in a worker process; stacking bases also return out-of-fold predictions"""
+    wall, cpu = time.perf_counter(), time.process_time()
+    model.fit(X_train, y_train)
+    oof = None
+    if oof_method:
+        # Same folds StackingClassifier/StackingRegressor(cv=5) would use
+        oof = cross_val_predict(clone(model), X_train, y_train, cv=STACK_CV, method=oof_method)
+        oof = drop_binary_column(oof) if oof_method == 'predict_proba' else oof.reshape(-1, 1)
+    return {
+        'dataset': name,
+        'model_name': model_name,
+        'model': model,
+        'oof': oof,
+        'y_pred': model.predict(X_test),
+        'wall': time.perf_counter() - wall,
+        'cpu': time.process_time() - cpu
+    }
+
+def _stack_job(name, estimators, oof, y_train, X_test):
+    """Fit the stacking final estimator on the bases' out-of-fold predictions"""
+    wall, cpu = time.perf_counter(), time.process_time()
+    classifier = _task(name) == 'classification'
+    final_estimator = SVC(probability=True) if classifier else SVR()
+    final_estimator.fit(oof, y_train)
+    stack = PrefitStacking(estimators, final_estimator, classifier)
+    return {
+        'dataset': name,
+        'model_name': 'Stacking',
+        'model': stack,
+        'oof': None,
+        'y_pred': stack.predict(X_test),
+        'wall': time.perf_counter() - wall,
+        'cpu': time.process_time() - cpu
+    }
+
+def _truncate_pca(pca, variance):
+    """Keep the fewest fitted components explaining `variance` of the total"""
+    k = int(np.searchsorted(np.cumsum(pca.explained_variance_ratio_), variance) + 1)
+    k = min(k, len(pca.components_))
+    pca.components_ = pca.components_[:k]
+    pca.explained_variance_ = pca.explained_variance_[:k]
+    pca.explained_variance_ratio_ = pca.explained_variance_ratio_[:k]
+    pca.singular_values_ = pca.singular_values_[:k]
+    pca.n_components = pca.n_components_ = k
+
+class _StreamingMetrics:
+    """Evaluation metrics accumulated chunk by chunk (sums or a confusion matrix)"""
+    
+    def __init__(self, regression, n_classes):
+        self.regression = regression
+        self.n = 0
+        if regression:
+            self.sse = self.sum_y = self.sum_y2 = 0.0
+        else:
+            self.confusion = np.zeros((n_classes, n_classes), np.int64)
+    
+    def update(self, y_true, y_pred):
+        self.n += len(y_true)
+        if self.regression:
+            y_true = np.asarray(y_true, dtype=np.float64)
+            self.sse += float(np.sum((y_true - y_pred) ** 2))
+            self.sum_y += float(y_true.sum())
+            self.sum_y2 += float(np.sum(y_true ** 2))
+        else:
+            np.add.at(self.confusion, (np.asarray(y_true, dtype=np.int64), np.asarray(y_pred, dtype=np.int64)), 1)
+    
+    def result(self):
+        if self.regression:
+            sst = self.sum_y2 - self.sum_y ** 2 / self.n
+            return {'MSE': self.sse / self.n, 'R2': 1 - self.sse / sst if sst else 0.0}
+        
+        # Support-weighted precision/recall/F1, as average='weighted'
+        tp = np.diag(self.confusion).astype(np.float64)
+        support = self.confusion.sum(axis=1)
+        predicted = self.confusion.sum(axis=0)
+        precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+        recall = np.divide(tp, support, out=np.zeros_like(tp), where=support > 0)
+        f1 = np.divide(2 * precision * recall, precision + recall,
+                       out=np.zeros_like(tp), where=(precision + recall) > 0)
+        weights = support / support.sum()
+        return {
+            'Accuracy': float(tp.sum() / self.n),
+            'Precision': float(weights @ precision),
+            'Recall': float(weights @ recall),
+            'F1': float(weights @ f1)
+        }
 
 def main():
+    parser = argparse.ArgumentParser(description='Train the Smart City prediction models')
+    parser.add_argument('--streaming', action='store_true',
+                        help='train out-of-core, reading datasets in chunks')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='rows per chunk in streaming mode')
+    parser.add_argument('--epochs', type=int, default=1, help='passes over the data in streaming mode')
+    parser.add_argument('--jobs', type=int, default=None, help='training processes (default: CPU count)')
+    args = parser.parse_args()
+    
     # Initialize system
     system = SmartCitySystem()
     
-    # Load and inspect data
-    system.load_datasets()
-    system.inspect_data()
-    
-    # Preprocess data
-    system.preprocess_data()
-    
-    # Train models
-    system.train_models()
+    if args.streaming:
+        # Datasets are never loaded whole
+        system.train_streaming(chunk_size=args.chunk_size, epochs=args.epochs)
+    else:
+        # Load and inspect data
+        system.load_datasets()
+        system.inspect_data()
+        
+        # Preprocess data
+        system.preprocess_data()
+        
+        # Train models
+        system.train_models(jobs=args.jobs)
     
     # Visualize results
     system.visualize_results()
@@ -238,6 +539,9 @@ def main():
     # Print summary
     system.print_summary()
     
+    # Persist best models for the web app
+    system.save_models()
+    
     print(f"\n{'SYSTEM READY FOR URBAN MOBILITY PREDICTIONS':^60}")
     print("="*60)
 
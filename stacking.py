@@ -0,0 +1,44 @@
+"""
+Stacking for Smart City System
+Stacked ensembles over already-fitted base estimators
+"""
+from typing import List, Tuple
+
+import numpy as np
+
+def stack_features(estimators: List[Tuple[str, object]], X, classifier: bool) -> np.ndarray:
+    """
+    Meta-features from base estimator outputs, laid out like sklearn's
+    StackingClassifier/StackingRegressor (probabilities for classifiers,
+    dropping the redundant first column for binary targets).
+    """
+    columns = []
+    for _, estimator in estimators:
+        if classifier:
+            columns.append(drop_binary_column(estimator.predict_proba(X)))
+        else:
+            columns.append(np.asarray(estimator.predict(X)).reshape(-1, 1))
+    return np.hstack(columns)
+
+def drop_binary_column(proba: np.ndarray) -> np.ndarray:
+    return proba[:, 1:] if proba.shape[1] == 2 else proba
+
+class PrefitStacking:
+    """
+    Stack whose base estimators were fitted on the full training set and
+    whose final estimator was fitted on their cross-validated (out-of-fold)
+    predictions, so nothing is refitted to build the ensemble.
+    """
+
+    def __init__(self, estimators: List[Tuple[str, object]], final_estimator, classifier: bool):
+        self.estimators = estimators
+        self.final_estimator = final_estimator
+        self.classifier = classifier
+        if classifier:
+            self.classes_ = final_estimator.classes_
+
+    def predict(self, X):
+        return self.final_estimator.predict(stack_features(self.estimators, X, self.classifier))
+
+    def predict_proba(self, X):
+        return self.final_estimator.predict_proba(stack_features(self.estimators, X, self.classifier))
@@ -0,0 +1,30 @@
+"""
+Tests for columnar: CSV round trips through the typed column store
+"""
+import numpy as np
+import pandas as pd
+
+from columnar import convert_csv, iter_columnar, load_columnar
+
+def test_round_trip_keeps_missing_categories(tmp_path):
+    csv_path = tmp_path / 'readings.csv'
+    pd.DataFrame({
+        'zone': ['North', None, 'South', 'North', None],
+        'count': [1, 2, 3, 4, 5],
+        'level': [0.5, np.nan, 1.5, 2.5, 3.5]
+    }).to_csv(csv_path, index=False)
+
+    schema = convert_csv(str(csv_path), str(tmp_path / 'readings'), chunk_size=2)
+    zone = next(column for column in schema['columns'] if column['name'] == 'zone')
+    assert zone['categories'] == ['North', 'South']
+    assert np.dtype(zone['dtype']).kind == 'i'
+
+    frame = load_columnar(str(tmp_path / 'readings'))
+    assert frame['zone'].isna().tolist() == [False, True, False, False, True]
+    assert frame['zone'].dropna().tolist() == ['North', 'South', 'North']
+    assert frame['count'].tolist() == [1, 2, 3, 4, 5]
+    np.testing.assert_array_equal(frame['level'].to_numpy(), [0.5, np.nan, 1.5, 2.5, 3.5])
+
+    chunks = list(iter_columnar(str(tmp_path / 'readings'), 2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert chunks[0]['zone'].isna().tolist() == [False, True]
@@ -0,0 +1,65 @@
+"""
+Tests for compiled_forest: compiled random forests must match sklearn exactly
+"""
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.linear_model import LogisticRegression
+
+from compiled_forest import CompiledForest, compile_checked, compile_forests, same_predictions
+from stacking import PrefitStacking, stack_features
+
+def features(n_rows: int = 400, n_features: int = 5, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(0, 1, (n_rows, n_features))
+
+def with_missing(X: np.ndarray, fraction: float = 0.1, seed: int = 1) -> np.ndarray:
+    X = X.copy()
+    X[np.random.default_rng(seed).random(X.shape) < fraction] = np.nan
+    return X
+
+def test_classifier_matches_sklearn_with_missing_values():
+    X = with_missing(features())
+    y = np.where(np.nan_to_num(X[:, 0]) + np.nan_to_num(X[:, 1]) > 0, 'High', 'Low')
+    y[np.isnan(X[:, 2])] = 'Medium'
+    forest = RandomForestClassifier(n_estimators=20, max_depth=6, random_state=0).fit(X, y)
+    compiled = CompiledForest(forest)
+
+    X_new = with_missing(features(seed=2), seed=3)
+    np.testing.assert_array_equal(compiled.predict(X_new), forest.predict(X_new))
+    np.testing.assert_array_equal(compiled.predict_proba(X_new), forest.predict_proba(X_new))
+
+def test_regressor_matches_sklearn():
+    X = features()
+    y = 3 * X[:, 0] - X[:, 1] ** 2 + np.random.default_rng(4).normal(0, 0.1, len(X))
+    forest = RandomForestRegressor(n_estimators=20, random_state=0).fit(X, y)
+    compiled = CompiledForest(forest)
+
+    X_new = features(seed=5)
+    np.testing.assert_array_equal(compiled.predict(X_new), forest.predict(X_new))
+
+def test_multi_output_forest_is_not_compiled():
+    X = features()
+    forest = RandomForestRegressor(n_estimators=5, random_state=0).fit(X, np.column_stack([X[:, 0], X[:, 1]]))
+
+    with pytest.raises(ValueError, match='single-output'):
+        CompiledForest(forest)
+    assert compile_forests(forest) is forest
+
+def test_compile_checked_verifies_without_check_rows():
+    X = features()
+    y = (X[:, 0] > 0).astype(int)
+    forest = RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+    final = LogisticRegression().fit(stack_features([('rf', forest)], X, True), y)
+    stack = PrefitStacking([('rf', forest)], final, classifier=True)
+
+    for model in (forest, stack):
+        compiled = compile_checked(model, None)
+        assert compiled is not model
+        assert same_predictions(model, compiled, features(seed=6))
+
+def test_compile_checked_keeps_a_model_that_does_not_match(monkeypatch):
+    X = features()
+    forest = RandomForestRegressor(n_estimators=5, random_state=0).fit(X, X[:, 0])
+    monkeypatch.setattr(CompiledForest, 'predict', lambda self, rows: np.zeros(len(rows)))
+
+    assert compile_checked(forest, None) is forest
@@ -0,0 +1,27 @@
+"""
+Tests for gazetteer: bounding-box queries, including boxes across the antimeridian
+"""
+from gazetteer import Gazetteer
+
+def pacific() -> Gazetteer:
+    return Gazetteer.build(
+        ['Suva', 'Apia', 'Auckland', 'Honolulu', 'Lima', 'Tarawa'],
+        [-18.14, -13.83, -36.85, 21.31, -12.05, 1.33],
+        [178.44, -171.76, 174.76, -157.86, -77.04, 170.10],
+        [90_000, 40_000, 1_700_000, 350_000, 10_000_000, 60_000]
+    )
+
+def names(gazetteer: Gazetteer, *bbox) -> list:
+    return [gazetteer.name(int(i)) for i in gazetteer.in_bbox(*bbox)]
+
+def test_box_across_the_antimeridian():
+    # west 170, east -170: the 20 degrees around the date line, most populous first
+    assert names(pacific(), -50, 170, 50, -170) == ['Auckland', 'Suva', 'Tarawa', 'Apia']
+
+def test_wrapped_box_with_both_ends_in_one_cell_lists_each_place_once():
+    # west 170.5, east 170.2 wraps almost the whole globe, excluding only (170.2, 170.5)
+    found = names(pacific(), -50, 170.5, 50, 170.2)
+    assert sorted(found) == sorted(['Suva', 'Apia', 'Auckland', 'Honolulu', 'Lima', 'Tarawa'])
+
+def test_plain_box():
+    assert names(pacific(), -40, 170, 0, 180) == ['Auckland', 'Suva']
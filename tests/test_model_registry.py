@@ -0,0 +1,57 @@
+"""
+Tests for model_registry: fused scaler + PCA preprocessing and serving
+"""
+import numpy as np
+import pytest
+from sklearn.decomposition import PCA
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+from model_registry import (AFFINE_TOLERANCE, ModelRegistry, check_fused_preprocessing,
+                            fuse_preprocessing, save_model_bundle)
+
+def training_rows(n_rows: int = 500, n_features: int = 6) -> np.ndarray:
+    rng = np.random.default_rng(42)
+    # Features on very different scales, like the city datasets
+    return rng.normal(0, 1, (n_rows, n_features)) * np.logspace(-2, 3, n_features) + np.arange(n_features) * 10
+
+@pytest.mark.parametrize('pca_kwargs', [None, {'n_components': 3}, {'n_components': 4, 'whiten': True}])
+@pytest.mark.parametrize('scaler_kwargs', [{}, {'with_mean': False}, {'with_std': False}])
+def test_fused_map_matches_scaler_and_pca(scaler_kwargs, pca_kwargs):
+    X = training_rows()
+    scaler = StandardScaler(**scaler_kwargs).fit(X)
+    pca = PCA(**pca_kwargs).fit(scaler.transform(X)) if pca_kwargs is not None else None
+
+    affine = fuse_preprocessing(scaler, pca)
+    expected = scaler.transform(X)
+    if pca is not None:
+        expected = pca.transform(expected)
+    fused = X @ affine['weight'] + affine['offset']
+
+    assert fused.shape == expected.shape
+    np.testing.assert_allclose(fused, expected, rtol=0, atol=AFFINE_TOLERANCE * max(1.0, np.abs(expected).max()))
+    assert check_fused_preprocessing(affine, scaler, pca) <= AFFINE_TOLERANCE * max(1.0, np.abs(expected).max())
+
+def test_check_rejects_a_wrong_map():
+    X = training_rows()
+    scaler = StandardScaler().fit(X)
+    pca = PCA(n_components=3).fit(scaler.transform(X))
+    affine = fuse_preprocessing(scaler, pca)
+    affine['offset'] = affine['offset'] + 1e-3
+
+    with pytest.raises(ValueError, match='fused preprocessing differs'):
+        check_fused_preprocessing(affine, scaler, pca)
+
+def test_predict_with_no_rows_returns_empty(tmp_path):
+    X = training_rows(n_features=4)
+    labels = np.where(X[:, 3] > X[:, 3].mean(), 'High', 'Low')
+    scaler = StandardScaler().fit(X)
+    encoder = LabelEncoder().fit(labels)
+    model = LogisticRegression().fit(scaler.transform(X), encoder.transform(labels))
+    save_model_bundle('activity', scaler, None, model, encoder, ['a', 'b', 'c', 'd'],
+                      'Logistic Regression', {}, models_dir=str(tmp_path))
+
+    registry = ModelRegistry(str(tmp_path))
+    assert registry.predict('activity', np.empty((0, 4))).tolist() == []
+    assert registry.predict('activity', X[:3]).tolist() == encoder.inverse_transform(
+        model.predict(scaler.transform(X[:3]))).tolist()